@@ -0,0 +1,86 @@
+"""
+Per-chapter memory footprint of parsed chapters.
+
+Compares the previous representation, which kept the page HTML and
+wrapped, decorated lines for every chapter, against Chapter, which keeps
+only verse records until it is rendered.
+
+Usage: python benchmarks/chapter_memory.py [-t nkjv] [-b regex]
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from biblestudytools.algorithm import parse_passages, regex_search
+from biblestudytools.bible import Bible
+from biblestudytools.book import Chapter
+from biblestudytools.cache import Data
+from biblestudytools.http import parse
+
+
+class LegacyChapter:
+    """The representation Chapter used before records were introduced."""
+
+    def __init__(self, translation: str, content: str):
+        self.translation = translation
+        self.content = content
+        self.num_verses, self.verses = parse_passages(parse(content))
+
+
+def measure(contents: list[bytes], build) -> int:
+    gc.collect()
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    # Decode inside the measurement so retained HTML is accounted for
+    held = [build(c.decode()) for c in contents]
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-t", "--translation", default="nkjv")
+    parser.add_argument("-b", "--book", default=None)
+    args = parser.parse_args()
+
+    bible = Bible(args.translation)
+    books = bible.books()
+    if args.book:
+        books = regex_search(args.book, books)
+
+    contents = [
+        Data.read_chapter(bible.translation, book, ch)
+        for _, book in books
+        for ch in bible.cached_chapters(book)
+    ]
+    if not contents:
+        print("No cached chapters; run 'biblestudytools download' first")
+        return 1
+
+    t = args.translation
+
+    def wrapped(c: str) -> Chapter:
+        chapter = Chapter(t, c)
+        chapter.verses
+        return chapter
+
+    results = [
+        ("legacy", measure(contents, lambda c: LegacyChapter(t, c))),
+        ("records", measure(contents, lambda c: Chapter(t, c))),
+        ("records + lines", measure(contents, wrapped)),
+    ]
+
+    n = len(contents)
+    print(f"{n} chapters")
+    for name, total in results:
+        print(f"{name:>24}: {total / n / 1024:8.1f} KiB/chapter")
+
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
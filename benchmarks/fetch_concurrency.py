@@ -0,0 +1,93 @@
+"""
+Fetch throughput against the local fixture server.
+
+Serves a recorded cache with injected latency and errors, then fetches
+every recorded chapter of a translation into an empty cache with an
+increasing number of threads, reporting wall time, the concurrency the
+server saw and how many requests were throttled and retried. Needs no
+network access.
+
+Usage: python benchmarks/fetch_concurrency.py [--root DIR] [-t nkjv]
+           [--latency 0.05] [--error-rate 0.05] [--rate 100]
+"""
+
+import argparse
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from biblestudytools import conf
+from biblestudytools.bible import Bible
+from biblestudytools.cache import Data
+from biblestudytools.fixture import FixtureServer
+from biblestudytools.http import limiter
+
+
+def recorded_chapters(root: str, translation: str) -> list[tuple[str, int]]:
+    Data.configure(root, shared=[])
+    bible = Bible(translation)
+    return [
+        (book, ch)
+        for _, book in bible.books()
+        for ch in bible.cached_chapters(book)
+    ]
+
+
+def run(server: FixtureServer, translation: str, refs: list, jobs: int):
+    with tempfile.TemporaryDirectory() as cache:
+        Data.configure(cache, shared=[])
+        server.stats.clear()
+        limiter.configure(concurrency=jobs)
+
+        start = time.perf_counter()
+        bible = Bible(translation)
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            list(pool.map(lambda ref: bible.get_chapter(*ref), refs))
+        elapsed = time.perf_counter() - start
+
+    stats = server.snapshot()
+    print(
+        f"{jobs:>4} {elapsed:>8.2f}s {len(refs) / elapsed:>8.1f}/s "
+        f"{stats.get('requests', 0):>6} {stats.get('peak_concurrency', 0):>5}"
+        f" {stats.get(f'status_{server.error_status}', 0):>6}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--root", default=Data.path)
+    parser.add_argument("-t", "--translation", default="nkjv")
+    parser.add_argument("--latency", default=0.05, type=float)
+    parser.add_argument("--error-rate", default=0.05, type=float)
+    parser.add_argument("--rate", default=100.0, type=float)
+    parser.add_argument("--jobs", default="1,2,4,8,16")
+    args = parser.parse_args()
+
+    refs = recorded_chapters(args.root, args.translation)
+    server = FixtureServer(
+        args.root,
+        latency=args.latency,
+        error_rate=args.error_rate,
+        retry_after=0,
+        seed=1,
+    ).start()
+    conf.configure(server.base_uri)
+    limiter.configure(rate=args.rate, burst=int(args.rate))
+
+    print(
+        f"{len(refs)} chapters, {args.latency}s latency, "
+        f"{args.error_rate:.0%} errors, {args.rate}/s"
+    )
+    print(
+        f"{'jobs':>4} {'time':>9} {'rate':>10} {'reqs':>6} {'peak':>5} "
+        f"{'errors':>6}"
+    )
+    try:
+        for jobs in [int(j) for j in args.jobs.split(",")]:
+            run(server, args.translation, refs, jobs)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Frame time of the reader, replaying keys against the cache headlessly.
+
+Opens a cached chapter in HeadlessUI, replays a script of keys (see
+biblestudytools.headless) and reports, per action, how long frames took
+and how many window refreshes and lines they drew. Frames where the
+screen didn't then show the lines at the scroll position are counted as
+inconsistent, which is how scrolling off-by-ones show up; overlays such
+as the find prompt and cross-references don't count.
+
+Usage: python benchmarks/ui_frames.py [-t nkjv] [-b john] [-c 3]
+           [-s script] [--size 24x80] [-r 5]
+"""
+
+import argparse
+import statistics
+from collections import defaultdict
+
+from biblestudytools.bible import Bible
+from biblestudytools.headless import Frame, HeadlessUI
+
+SCRIPT = (
+    "down*60 pgdn*4 up*30 pgup*4 resize:30x100 pgdn*2 resize:24x80 "
+    "right pgdn*3 left pgup"
+)
+
+
+def run(bibles: list[Bible], book: str, ch: int, args) -> list[Frame]:
+    h, w = [int(n) for n in args.size.split("x")]
+    return HeadlessUI(h, w).replay(bibles, book, ch, args.script)
+
+
+def percentile(values: list[float], p: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-t", "--translation", default="nkjv")
+    parser.add_argument("-b", "--book", default="john")
+    parser.add_argument("-c", "--chapter", default=3, type=int)
+    parser.add_argument("-s", "--script", default=SCRIPT)
+    parser.add_argument("--size", default="24x80")
+    parser.add_argument("-r", "--repeat", default=5, type=int)
+    args = parser.parse_args()
+
+    bibles = [Bible(t) for t in args.translation.split(",")]
+    if not bibles[0].chapter_exists(args.book, args.chapter):
+        print(f"{args.book} {args.chapter} isn't cached")
+        return 1
+
+    # The first run warms the cache and parsed chapters; it isn't counted
+    frames = run(bibles, args.book, args.chapter, args)
+    times = defaultdict(list)
+    for i in range(args.repeat):
+        frames = run(bibles, args.book, args.chapter, args)
+        for frame in frames:
+            times[frame.action].append(frame.seconds)
+
+    actions = defaultdict(list)
+    for frame in frames:
+        actions[frame.action].append(frame)
+
+    print(f"{len(frames)} frames, {args.repeat} runs at {args.size}")
+    print(
+        f"{'action':<14} {'n':>4} {'mean ms':>9} {'p95 ms':>9} "
+        f"{'refresh':>8} {'lines':>6} {'bad':>4}"
+    )
+    inconsistent = 0
+    for action, group in actions.items():
+        seconds = times[action]
+        bad = sum(1 for f in group if not f.consistent)
+        inconsistent += bad
+        print(
+            f"{action:<14} {len(group):>4} "
+            f"{statistics.mean(seconds) * 1000:>9.3f} "
+            f"{percentile(seconds, 0.95) * 1000:>9.3f} "
+            f"{sum(f.refreshes for f in group) / len(group):>8.1f} "
+            f"{sum(f.lines for f in group) / len(group):>6.1f} "
+            f"{bad:>4}"
+        )
+    print(f"inconsistent {inconsistent}/{len(frames)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""
+Wrapping speed of the span-aware wrapper against textwrap.
+
+Wraps every verse of the cached chapters of a translation with
+textwrap.wrap, which verses went through before styled spans were
+kept, and with wrap_spans, which also splits the spans across lines.
+Reports the time for both and how many verses wrap identically.
+
+Usage: python benchmarks/wrap_speed.py [-t nkjv] [-b regex] [-w 72]
+"""
+
+import argparse
+import time
+from textwrap import wrap
+
+from biblestudytools.algorithm import regex_search, wrap_spans
+from biblestudytools.bible import Bible
+from biblestudytools.book import parse_chapter
+from biblestudytools.cache import Data
+
+
+def load_verses(bible: Bible, expr: str) -> list:
+    t = bible.translation.name
+    verses = []
+    for display, book in regex_search(expr, bible.books()):
+        for ch in bible.cached_chapters(book):
+            content = Data.read_chapter(t, book, ch).decode()
+            verses += parse_chapter(content)[1]
+    return verses
+
+
+def with_textwrap(verses: list, width: int) -> list:
+    output = []
+    for v in verses:
+        indent = " " * (1 + len(str(v.number)))
+        text = f"{v.number} {v.text}"
+        output.append(wrap(text, width=width, subsequent_indent=indent))
+    return output
+
+
+def with_spans(verses: list, width: int) -> list:
+    output = []
+    for v in verses:
+        indent = " " * (1 + len(str(v.number)))
+        shift = len(str(v.number)) + 1
+        spans = [(s[0] + shift, s[1] + shift, s[2]) for s in v.spans]
+        text = f"{v.number} {v.text}"
+        output.append(wrap_spans(text, spans, width, indent)[0])
+    return output
+
+
+def best_of(fn, *args, repeat: int = 5) -> tuple[float, list]:
+    times = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        result = fn(*args)
+        times.append(time.perf_counter() - start)
+    return (min(times), result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("-t", "--translation", default="nkjv")
+    parser.add_argument("-b", "--books", default=".")
+    parser.add_argument("-w", "--width", default=72, type=int)
+    args = parser.parse_args()
+
+    verses = load_verses(Bible(args.translation), args.books)
+    if not verses:
+        print("No cached chapters matched")
+        return 1
+
+    old, expected = best_of(with_textwrap, verses, args.width)
+    new, actual = best_of(with_spans, verses, args.width)
+    same = sum(1 for a, b in zip(expected, actual) if a == b)
+
+    print(f"{len(verses)} verses at width {args.width}")
+    print(f"textwrap   {old * 1000:>9.1f} ms")
+    print(f"wrap_spans {new * 1000:>9.1f} ms  ({old / new:.1f}x)")
+    print(f"identical  {same}/{len(verses)}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
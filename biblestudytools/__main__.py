@@ -14,15 +14,42 @@ import logging.config
 import os
 import shutil
 import sys
+import threading
+import time
 import traceback
+from datetime import date
+from typing import Iterable
 
-from .algorithm import regex_search
-from .bible import Bible
-from .book import Chapter
-from .conf import BASE_URI, PROG
-from .http import HttpError
-from .system import execute
+from . import conf
+from .algorithm import (
+    ansi,
+    regex_search,
+    text_width,
+    wrap_passages,
+    wrap_spans,
+)
+from .bible import Bible, SearchHit, load_bibles, load_parallel
+from .book import Chapter, column_width
+from .cache import CACHE_ENV, Data
+from .conf import BASE_URI_ENV, PROG
+from .diff import BookScore, DiffExecutor, DiffSummary, marked
+from .fresh import TTL_ENV, Freshness, parse_ttl
+from .fuzzy import TrigramIndex
+from .http import DEFAULT_RATE, RATE_ENV, HttpError, limiter, parse_rate
+from .parallel import ParseExecutor, book_refs
+from .resolver import BookResolver
+from .sink import clipboard_available, open_sink
+from .stream import (
+    Reference,
+    parse_reference,
+    render_chapter,
+    render_parallel,
+    stream_reference,
+)
+from .sync import Manifest, ManifestServer, open_source, sync
 from .ui import BookUI
+from .warm import plan_chapters, read_plan, select_refs, split_ref, warm
+from .xref import Target, prefetch
 
 HOME = os.environ.get("HOME")
 SEARCH_BOOKS = {
@@ -55,6 +82,13 @@ SEARCH_BOOKS = {
     "nt": "n",
     "gospels": "gos",
 }
+SEARCH_RESOLVER = BookResolver(list(SEARCH_BOOKS.items()))
+BULK_COMMANDS = ("verify", "export", "batch", "refresh")
+# Search hits whose chapters are prefetched
+SEARCH_PREFETCH = 5
+CONCORDANCE_QUERIES = ("freq", "top", "kwic", "cooccur", "compare", "index")
+# Addresses sync --serve may listen on without --public
+LOOPBACK = ("127.0.0.1", "::1", "localhost")
 
 logging.basicConfig(
     filename="/tmp/bst.log",
@@ -63,17 +97,43 @@ logging.basicConfig(
 )
 
 
-def make_optional_parser() -> argparse.ArgumentParser:
+def ttl_arg(spec: str) -> str:
+    try:
+        parse_ttl(spec)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+    return spec
+
+
+def rate_arg(spec: str) -> float:
+    try:
+        return parse_rate(spec)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc))
+
+
+def make_optional_parser(
+    command_only: bool = False,
+) -> argparse.ArgumentParser:
+    """
+    Parser of the options shared by every command and the command (or
+    book) itself. With command_only, -h and the command's own arguments
+    are left for the parser of the command.
+    """
     epilog = "To list available books, run 'biblestudytools list'"
     parser = argparse.ArgumentParser(
-        prog=PROG, description=f"Cache client for {BASE_URI}", epilog=epilog
+        prog=PROG,
+        description=f"Cache client for {conf.BASE_URI}",
+        epilog=epilog,
+        add_help=not command_only,
     )
 
     parser.add_argument(
         "-t",
         "--translation",
         default="nkjv",
-        help="Bible translation (default: 'nkjv')",
+        help="Bible translation, or comma-separated translations "
+        "to view side by side (default: 'nkjv')",
     )
     parser.add_argument(
         "-r",
@@ -83,7 +143,34 @@ def make_optional_parser() -> argparse.ArgumentParser:
         help="Produce raw output (without ANSI escape codes)",
     )
 
-    if os.environ.get("WAYLAND_DISPLAY", None):
+    parser.add_argument(
+        "--ttl",
+        default=None,
+        type=ttl_arg,
+        help="revalidate cached pages older than this, e.g. 3600, 12h "
+        f"or 30d (default: ${TTL_ENV} or never)",
+    )
+    parser.add_argument(
+        "--rate",
+        default=None,
+        type=rate_arg,
+        help="maximum requests per second to the site "
+        f"(default: ${RATE_ENV} or {DEFAULT_RATE:g})",
+    )
+    parser.add_argument(
+        "--base-uri",
+        default=None,
+        help=f"site to fetch from (default: ${BASE_URI_ENV} or "
+        f"{conf.DEFAULT_BASE_URI})",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help=f"cache directory (default: ${CACHE_ENV} or ~/.{PROG})",
+    )
+
+    parser.set_defaults(clipboard=False)
+    if clipboard_available():
         parser.add_argument(
             "-c",
             "--clipboard",
@@ -94,26 +181,283 @@ def make_optional_parser() -> argparse.ArgumentParser:
 
     parser.add_argument(
         "book",
+        nargs="?" if command_only else None,
         help="regex matched against books "
         "returned by 'biblestudytools list'",
     )
     return parser
 
 
+def common_args(args: argparse.Namespace) -> dict:
+    """Options shared by every command."""
+    return {
+        "translation": args.translation,
+        "cache_dir": args.cache_dir,
+        "ttl": args.ttl,
+        "rate": args.rate,
+        "base_uri": args.base_uri,
+        "raw": args.raw,
+        "clipboard": args.clipboard,
+        "book": args.book,
+    }
+
+
+def parse_command() -> str:
+    """The command, or book to read, named on the command line."""
+    args, rest = make_optional_parser(command_only=True).parse_known_args()
+    return args.book
+
+
 def parse_args():
     parser = make_optional_parser()
+    command = parse_command()
 
     b = None
-    if "list" in sys.argv or "download" in sys.argv:
+    if command in ("list", "download"):
         args = parser.parse_args()
         return {
-            "translation": args.translation,
-            "raw": args.raw,
-            "clipboard": args.clipboard,
+            **common_args(args),
             "b": b,
-            "book": args.book,
         }
-    elif "search" in sys.argv:
+    elif command == "warm":
+        parser.add_argument(
+            "refs",
+            nargs="*",
+            help="references to warm, e.g. 'gen 1-3' 'ro 8:28-9:5'",
+        )
+        parser.add_argument(
+            "-p", "--plan", help="reading plan file (see warm.py)"
+        )
+        parser.add_argument(
+            "--from",
+            dest="start",
+            type=date.fromisoformat,
+            default=date.today(),
+            help="first plan day to warm (default: today)",
+        )
+        parser.add_argument(
+            "--to",
+            dest="end",
+            type=date.fromisoformat,
+            default=None,
+            help="last plan day to warm (default: --from)",
+        )
+        parser.add_argument(
+            "-w",
+            "--widths",
+            type=lambda s: tuple(int(w) for w in s.split(",")),
+            default=(text_width(), 72),
+            help="comma-separated widths to pre-render "
+            "(default: this terminal's and 72)",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of parsing processes (default: CPU count)",
+        )
+        args = parser.parse_intermixed_args()
+        refs = list(args.refs)
+        if args.plan:
+            entries = read_plan(args.plan)
+            refs += select_refs(entries, args.start, args.end or args.start)
+        return {
+            **common_args(args),
+            "refs": refs,
+            "widths": args.widths,
+            "jobs": args.jobs,
+        }
+    elif command == "xrefs":
+        parser.add_argument(
+            "ref",
+            nargs="*",
+            help="verses to look up, e.g. 'john 3:16' or 'ro 8'; "
+            "without one, index every cached chapter",
+        )
+        parser.add_argument(
+            "-b",
+            "--book",
+            dest="b",
+            help="regex matched against books to index",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of parsing processes (default: CPU count)",
+        )
+        args = parser.parse_intermixed_args()
+        return {
+            **common_args(args),
+            "b": args.b,
+            "ref": " ".join(args.ref),
+            "jobs": args.jobs,
+        }
+    elif command in ("manifest", "sync"):
+        parser.add_argument(
+            "source",
+            nargs="?",
+            default=None,
+            help="sync: cache directory or peer URI (e.g. "
+            "http://host:8765) to copy missing and changed entries from",
+        )
+        parser.add_argument(
+            "--serve",
+            default=False,
+            action="store_true",
+            help="sync: serve this cache to syncing peers",
+        )
+        parser.add_argument(
+            "--host",
+            default=None,
+            help="sync --serve: address to listen on (default: 127.0.0.1, "
+            "or every interface with --public)",
+        )
+        parser.add_argument(
+            "--public",
+            default=False,
+            action="store_true",
+            help="sync --serve: allow listening beyond this host; peers "
+            "aren't authenticated, so anyone reaching the port can read "
+            "the cache",
+        )
+        parser.add_argument("--port", default=8765, type=int)
+        parser.add_argument(
+            "-n",
+            "--dry-run",
+            default=False,
+            action="store_true",
+            help="sync: only report what would be copied",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of hashing and transfer threads "
+            "(default: CPU count)",
+        )
+        args = parser.parse_intermixed_args()
+        host = args.host or ("0.0.0.0" if args.public else "127.0.0.1")
+        if host not in LOOPBACK and not args.public:
+            raise argparse.ArgumentError(
+                None, f"serving on '{host}' needs --public"
+            )
+        return {
+            **common_args(args),
+            "source": args.source,
+            "serve": args.serve,
+            "address": (host, args.port),
+            "dry_run": args.dry_run,
+            "jobs": args.jobs,
+        }
+    elif command == "diff":
+        parser.add_argument(
+            "-b",
+            "--book",
+            dest="b",
+            help="regex matched against books to compare",
+        )
+        parser.add_argument(
+            "-n",
+            "--limit",
+            type=int,
+            default=10,
+            help="number of most divergent verses to show (default: 10)",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of diffing processes (default: CPU count)",
+        )
+        args = parser.parse_args()
+        return {
+            **common_args(args),
+            "raw": args.raw or args.clipboard,
+            "b": args.b,
+            "limit": args.limit,
+            "jobs": args.jobs,
+        }
+    elif command == "concordance":
+        parser.add_argument(
+            "query",
+            choices=CONCORDANCE_QUERIES,
+            help="freq: occurrences of terms per book; top: most frequent "
+            "terms; kwic: terms in context; cooccur: terms found in the "
+            "same verses as a term; compare: vocabulary distinctive of "
+            "--book against --against; index: rebuild the concordance",
+        )
+        parser.add_argument("terms", nargs="*", help="terms to look up")
+        parser.add_argument(
+            "-b",
+            "--book",
+            dest="b",
+            help="regex matched against books to limit the query to",
+        )
+        parser.add_argument(
+            "--against",
+            default=None,
+            help="regex matched against books to compare with "
+            "(default: every other book)",
+        )
+        parser.add_argument(
+            "-n",
+            "--limit",
+            type=int,
+            default=20,
+            help="number of results (default: 20)",
+        )
+        parser.add_argument(
+            "-w",
+            "--window",
+            type=int,
+            default=6,
+            help="words of context either side in kwic (default: 6)",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of parsing processes (default: CPU count)",
+        )
+        args = parser.parse_intermixed_args()
+        return {
+            **common_args(args),
+            "b": args.b,
+            "query": args.query,
+            "terms": args.terms,
+            "against": args.against,
+            "limit": args.limit,
+            "window": args.window,
+            "jobs": args.jobs,
+        }
+    elif command in BULK_COMMANDS:
+        parser.add_argument(
+            "-b",
+            "--book",
+            dest="b",
+            help="regex matched against books to limit the job to",
+        )
+        parser.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="Number of parsing processes (default: CPU count)",
+        )
+        args = parser.parse_args()
+        return {
+            **common_args(args),
+            "raw": args.raw or args.clipboard,
+            "b": args.b,
+            "jobs": args.jobs,
+        }
+    elif command == "search":
         parser.add_argument(
             "-b",
             "--book",
@@ -121,17 +465,44 @@ def parse_args():
             type=str.lower,
             help="Particular book(s) to search",
         )
+        parser.add_argument(
+            "-o",
+            "--open",
+            type=int,
+            default=None,
+            metavar="N",
+            help="open the Nth result in the reader",
+        )
+        parser.add_argument(
+            "--fuzzy",
+            default=False,
+            action="store_true",
+            help="rank cached verses by likeness to the query instead, "
+            "for misremembered wording; needs no network access",
+        )
+        parser.add_argument(
+            "--rebuild",
+            default=False,
+            action="store_true",
+            help="rebuild the --fuzzy index of cached verses first",
+        )
+        parser.add_argument(
+            "-k",
+            "--top",
+            type=int,
+            default=10,
+            help="number of --fuzzy results (default: 10)",
+        )
         parser.add_argument(
             "query", nargs="+", help="Keyword strings (space-separated)"
         )
-        args = parser.parse_args()
+        args = parser.parse_intermixed_args()
 
         if args.b:
-            for key in SEARCH_BOOKS.keys():
-                if key.startswith(args.b):
-                    b = SEARCH_BOOKS.get(key)
-                    print(f"Focusing search on '{key}'...\n")
-                    break
+            result = SEARCH_RESOLVER.resolve(args.b)
+            if result:
+                key, b = result
+                print(f"Focusing search on '{key}'...\n")
 
             if b is None:
                 raise LookupError(
@@ -139,53 +510,40 @@ def parse_args():
                 )
 
         return {
-            "translation": args.translation,
+            **common_args(args),
             "raw": args.raw or args.clipboard,
-            "clipboard": args.clipboard,
             "b": b,
-            "book": args.book,
             "query": args.query,
+            "open": args.open,
+            "fuzzy": args.fuzzy,
+            "rebuild": args.rebuild,
+            "top": args.top,
         }
 
     parser.add_argument(
         "verse",
-        help="chapter and optional verse range, " "e.g. 1, 3:16, 1:2-4",
+        nargs="?",
+        default=None,
+        help="chapter and optional verse range, e.g. 1, 3:16, 1:2-4, "
+        "3-5 or 8:28-9:5; omit to output the whole book",
     )
     args = parser.parse_args()
 
-    ch = 0  # Chapter
-    verse = None  # Verse
-    if ":" in args.verse:
-        ch, verse = args.verse.split(":")
-        ch = int(ch)
-        if "-" in verse:
-            verse = verse.split("-")
-            try:
-                start, end = [int(x) for x in verse]
-            except Exception:
-                raise argparse.ArgumentError(
-                    f"invalid verse specification '{args.verse}'"
-                )
-
-            if start < 1 or start > end:
-                raise argparse.ArgumentError(
-                    "invalid verse range; a >= 1 && b >= a"
-                )
+    try:
+        ref = parse_reference(args.verse)
+    except ValueError as exc:
+        raise argparse.ArgumentError(None, str(exc))
 
-            verse = (start, end)
-        else:
-            verse = int(verse)
-            verse = (verse, verse)
-    else:
-        ch = int(args.verse)
+    verse = None
+    if ref.single() and ref.start_verse is not None:
+        verse = (ref.start_verse, ref.end_verse)
 
     return {
-        "translation": args.translation,
+        **common_args(args),
         "raw": args.raw or args.clipboard,
-        "clipboard": args.clipboard,
-        "book": args.book,
-        "chapter": ch,
+        "chapter": ref.start_chapter,
         "verse": verse,
+        "reference": ref,
     }
 
 
@@ -201,62 +559,56 @@ def parse_range(verses: str) -> tuple[int, int]:
     )
 
 
-def print_append(memo: list[str], text: str):
-    print(text)
-    memo.append(text)
-
-
 def output_chapter(
     chapter: Chapter,
     verses: tuple[int, int],
     raw: bool = False,
     clipboard: bool = False,
 ):
-    start, end = verses
-    verse_disp = f"{start}-{end}"
-    if start == end:
-        verse_disp = str(start)
-
-    pre, post = "", ""
-    if not raw:
-        pre = "\n \033[1;4m"
-        post = "\033[0m"
-
-    t = chapter.translation.upper()
-    memo = list()
-    print_append(memo, f"{pre}{chapter.title}:{verse_disp} ({t}){post}\n")
-
-    m = start - 1
-    for i in range(start - 1, end):
-        while not chapter.verses[m][1][0].startswith(f"{i + 1} "):
-            m += 1
-        attr, lines = chapter.verses[m]
+    output_lines(render_chapter(chapter, verses, raw), clipboard)
+
+
+def output_lines(lines: Iterable[str], clipboard: bool = False):
+    with open_sink(clipboard) as sink:
         for line in lines:
-            print_append(memo, line)
+            sink.write(line)
 
-    if clipboard:
-        memo_str = "\n".join(memo)
-        execute("wl-copy", input_data=memo_str)
-        execute("wl-copy", "-p", input_data=memo_str)
-    else:
+    if not clipboard:
         print()
 
 
+def output_parallel(
+    chapters: list[Chapter],
+    verses: tuple[int, int],
+    raw: bool = False,
+    clipboard: bool = False,
+    width: int = None,
+):
+    """Output the same verses of several translations aligned by number."""
+    output_lines(render_parallel(chapters, verses, raw, width), clipboard)
+
+
 def single_view(
-    bible: Bible,
+    bibles: list[Bible],
     book: str,
     ch: int,
     verses: tuple[int, int],
     raw: bool,
     clipboard: bool,
 ):
-    content = bible.get_chapter(book, ch)
-    chapter = Chapter(bible.translation.name, content, raw)
+    if len(bibles) == 1:
+        chapter = bibles[0].load_chapter(book, ch, raw)
+        if not verses:
+            verses = chapter.range()
+        return output_chapter(chapter, verses, raw, clipboard)
 
+    width = text_width()
+    cw = column_width(len(bibles), width)
+    chapters = load_parallel(bibles, book, ch, raw, cw)
     if not verses:
-        verses = chapter.range()
+        verses = chapters[0].range()
 
-    output_chapter(chapter, verses, raw, clipboard)
+    output_parallel(chapters, verses, raw, clipboard, width)
 
 
 def get_lines(chapter: Chapter):
@@ -267,8 +619,20 @@ def get_lines(chapter: Chapter):
     return lines
 
 
+def stream_view(
+    bibles: list[Bible],
+    ref: Reference,
+    book: str,
+    raw: bool,
+    clipboard: bool,
+):
+    """Stream a reference spanning chapters, writing lines as they render."""
+    with open_sink(clipboard) as sink:
+        stream_reference(bibles, book, ref, raw, sink.write)
+
+
 def book_view(
-    bible: Bible,
+    bibles: list[Bible],
     book: str,
     ch: int,
     verses: tuple[int, int],
@@ -276,29 +640,520 @@ def book_view(
     clipboard: bool,
 ):
     ui = BookUI()
-    ui.loop(bible, book, ch)
+    ui.loop(bibles, book, ch)
+
+
+def search_lines(bible: Bible, hit: SearchHit, target: Target, raw: bool):
+    """
+    Lines of a search hit: the verses from the cached chapter when it's
+    cached, so they're styled like the reader, else the result's text.
+    """
+    width = text_width()
+    if target is not None and target.start is not None:
+        if bible.chapter_exists(target.book, target.chapter):
+            chapter = bible.load_chapter(target.book, target.chapter, raw)
+            for n in range(target.start, target.end + 1):
+                entry = chapter.styled_verse(n)
+                if entry is None:
+                    continue
+                attr, lines, runs = entry
+                yield from (lines if raw else map(ansi, lines, runs))
+            return
 
+    num_verses, passage = wrap_passages(hit.verses, raw, width)
+    for attr, lines in passage:
+        yield from lines
 
-def search(args: dict[str, str], bible: Bible):
+
+def open_result(bibles: list[Bible], targets: list[Target], n: int) -> int:
+    """Open the nth of targets in the reader."""
+    if not 0 < n <= len(targets) or targets[n - 1] is None:
+        print(f"error: no result {n} to open")
+        return 1
+    target = targets[n - 1]
+    ui = BookUI()
+    ui.loop(bibles, target.book, target.chapter, target.start)
+    return 0
+
+
+def fuzzy_search(args: dict[str, str], bibles: list[Bible]) -> int:
+    """Rank cached verses of every translation by likeness to the query."""
+    query = " ".join(args.get("query"))
+    hits, verses = [], 0
+    for bible in bibles:
+        index = TrigramIndex.open(bible, args.get("rebuild"))
+        verses += len(index.refs)
+        hits += [(hit, bible) for hit in index.search(query, args["top"])]
+    hits.sort(key=lambda h: h[0].score, reverse=True)
+    hits = hits[: args.get("top")]
+
+    n = args.get("open")
+    if n is not None:
+        return open_result(bibles, [hit.target for hit, b in hits], n)
+
+    raw = args.get("raw")
+    for i, (hit, bible) in enumerate(hits, 1):
+        names = {slug: display for display, slug in bible.books()}
+        t = bible.translation.name.upper()
+        title = hit.target.display(names)
+        print(f" {i}. {title} ({t}) {hit.score:.0%}")
+        for line in search_lines(bible, None, hit.target, raw):
+            print(line)
+        print()
+
+    if not verses:
+        print("No cached verses to search; read or warm some first")
+        return 1
+    if not hits:
+        print("No similar verses found")
+        return 1
+    print(f"Open one with '{PROG} search --fuzzy -o N {query}'")
+    print()
+    return 0
+
+
+def search(args: dict[str, str], bibles: list[Bible]):
+    if args.get("fuzzy"):
+        return fuzzy_search(args, bibles)
+
+    bible = bibles[0]
     results = bible.search(args, 1)
+    targets = [bible.locate(hit) for hit in results]
+
+    n = args.get("open")
+    if n is not None:
+        return open_result(bibles, targets, n)
 
-    for title, passage in results:
-        print(f" - {title}")
-        for attr, lines in passage:
-            print("\n".join(lines))
+    # Warm the chapters of the top hits while they're printed, so
+    # opening one is a cache hit
+    top = [t for t in targets if t is not None][:SEARCH_PREFETCH]
+    prefetcher = threading.Thread(target=prefetch, args=(bibles, top))
+    prefetcher.start()
+
+    raw = args.get("raw")
+    for i, (hit, target) in enumerate(zip(results, targets), 1):
+        print(f" {i}. {hit.title}")
+        for line in search_lines(bible, hit, target, raw):
+            print(line)
         print()
 
     remaining = bible.num_results
+    prefetcher.join()
     if remaining < 1:
         print("No results found")
         return 1
 
     print(f"Total results: {remaining}")
+    print(f"Open one with '{PROG} search -o N {' '.join(args['query'])}'")
     print()
 
     return 0
 
 
+def select_books(bible: Bible, expr: str = None) -> list[tuple[str, str]]:
+    books = bible.books()
+    if expr:
+        books = regex_search(expr, books)
+    return books
+
+
+def verify(args: dict[str, str], bible: Bible) -> int:
+    """Parse every cached chapter in parallel and report failures."""
+    refs = [
+        ref
+        for display, book in select_books(bible, args.get("b"))
+        for ref in book_refs(bible, book)
+        if bible.chapter_exists(*ref)
+    ]
+
+    failed = 0
+    with ParseExecutor(args.get("jobs")) as executor:
+        for (book, ch), future in executor.parse(bible, refs):
+            try:
+                future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"{book} {ch}: {exc}")
+
+    print(f"Verified {len(refs)} chapters, {failed} failed")
+    return int(failed > 0)
+
+
+def export(args: dict[str, str], bible: Bible) -> int:
+    """Print every verse of the selected books as 'Title:verse<TAB>text'."""
+    refs = [
+        ref
+        for display, book in select_books(bible, args.get("b"))
+        for ref in book_refs(bible, book)
+    ]
+
+    with ParseExecutor(args.get("jobs")) as executor:
+        for (book, ch), future in executor.parse(bible, refs):
+            try:
+                parsed = future.result()
+            except Exception as exc:
+                logging.error(f"{book} {ch}: {exc}")
+                continue
+
+            for verse in parsed.verses:
+                print(f"{parsed.title}:{verse.number}\t{verse.text}")
+
+    return 0
+
+
+def batch(args: dict[str, str], bible: Bible) -> int:
+    """
+    Look up 'book [reference]' references read from stdin, one per line,
+    parsing the chapters they need in parallel.
+    """
+    lookups = []
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            name, spec = split_ref(line)
+            ref = parse_reference(spec)
+            book = bible.resolve(name)
+        except ValueError:
+            book = None
+
+        if book is None:
+            print(f"error: invalid reference '{line}'")
+            continue
+        try:
+            end = ref.end_chapter or bible.probe_chapters(book)
+        except HttpError as exc:
+            print(f"error: unable to load {book}: {exc}")
+            continue
+        for ch in range(ref.start_chapter, end + 1):
+            lookups.append((book, ch, ref))
+
+    refs = list(dict.fromkeys([(book, ch) for book, ch, ref in lookups]))
+    chapters = dict()
+    with ParseExecutor(args.get("jobs")) as executor:
+        for ref, future in executor.parse(bible, refs):
+            try:
+                chapters[ref] = future.result()
+            except Exception as exc:
+                logging.error(f"{ref}: {exc}")
+
+    e = 0
+    raw = args.get("raw")
+    for book, ch, ref in lookups:
+        parsed = chapters.get((book, ch))
+        if parsed is None:
+            print(f"error: unable to load {book} {ch}")
+            e = 1
+            continue
+
+        chapter = parsed.to_chapter(bible.translation.name, raw)
+        first, last = chapter.range()
+        if ch == ref.start_chapter and ref.start_verse:
+            first = ref.start_verse
+        if ch == ref.end_chapter and ref.end_verse:
+            last = min(ref.end_verse, last)
+        if first <= last:
+            output_chapter(chapter, (first, last), raw)
+
+    return e
+
+
+def refresh(args: dict[str, str], bible: Bible) -> int:
+    """Revalidate every cached page of the selected books now."""
+    books = [book for display, book in select_books(bible, args.get("b"))]
+    entries = bible.cached_entries(books)
+
+    t = bible.translation.name.upper()
+    print(f"Revalidating {len(entries)} pages ({t})...")
+    counts = Freshness.refresh(entries, args.get("jobs") or 4)
+
+    print(
+        f"{counts['unchanged']} unchanged, {counts['updated']} updated "
+        f"({counts['bytes']} bytes), {counts['errors']} failed"
+    )
+    return int(counts["errors"] > 0)
+
+
+def warm_cache(args: dict[str, str], bibles: list[Bible]) -> int:
+    refs = args.get("refs")
+    if not refs:
+        print("Nothing to warm")
+        return 0
+
+    failed = 0
+    for bible in bibles:
+        chapters = plan_chapters(bible, refs, args.get("jobs"))
+        t = bible.translation.name.upper()
+        print(f"Warming {len(chapters)} chapters ({t})...")
+        failed += warm(bible, chapters, args.get("widths"), args.get("jobs"))
+
+    return int(failed > 0)
+
+
+def index_xrefs(args: dict[str, str], bible: Bible) -> int:
+    """Index cross-references of every cached chapter not yet indexed."""
+    refs = [
+        ref
+        for display, book in select_books(bible, args.get("b"))
+        for ref in book_refs(bible, book)
+        if bible.chapter_exists(*ref) and not bible.has_xrefs(*ref)
+    ]
+
+    t = bible.translation.name
+    edges = failed = 0
+    with ParseExecutor(args.get("jobs")) as executor:
+        for (book, ch), future in executor.parse(bible, refs):
+            try:
+                chapter = future.result().to_chapter(t)
+            except Exception as exc:
+                failed += 1
+                print(f"{book} {ch}: {exc}")
+                continue
+            bible.save_parsed(book, ch, chapter)
+            edges += sum(map(len, bible.xrefs(book, ch).values()))
+
+    print(f"Indexed {len(refs)} chapters, {edges} cross-references")
+    return int(failed > 0)
+
+
+def xrefs(args: dict[str, str], bible: Bible) -> int:
+    """Print the verses cross-referenced by a reference."""
+    if not args.get("ref"):
+        return index_xrefs(args, bible)
+
+    name, spec = split_ref(args.get("ref"))
+    book = bible.resolve(name)
+    if book is None:
+        print("error: invalid book name")
+        return 1
+
+    ref = parse_reference(spec)
+    if not ref.single():
+        print("error: cross-references are looked up within a chapter")
+        return 1
+
+    ch = ref.start_chapter
+    graph = bible.xrefs(book, ch)
+    start, end = ref.start_verse or 1, ref.end_verse or max(graph, default=0)
+    graph = {n: ts for n, ts in sorted(graph.items()) if start <= n <= end}
+    prefetch([bible], [t for ts in graph.values() for t in ts])
+
+    names = {slug: display for display, slug in bible.books()}
+    t = bible.translation.name.upper()
+    for n, targets in graph.items():
+        print(f"{names.get(book, book)} {ch}:{n} ({t})")
+        for target in targets:
+            print(f"  {target.display(names)}")
+            try:
+                chapter = bible.load_chapter(
+                    target.book, target.chapter, raw=True
+                )
+            except Exception as exc:
+                print(f"    error: {exc}")
+                continue
+            for verse in chapter.records:
+                if target.start is not None and (
+                    target.start <= verse.number <= target.end
+                ):
+                    print(f"    {verse.number} {verse.text}")
+        print()
+
+    if not graph:
+        print("No cross-references found")
+    return 0
+
+
+def diff_lines(translation: str, ops: tuple, raw: bool) -> list[str]:
+    """Word differences of a verse, wrapped under its translation."""
+    text, spans = marked(ops)
+    prefix = f"  {translation} "
+    shift = len(prefix)
+    spans = [(s.start + shift, s.end + shift, s.style) for s in spans]
+    lines, runs = wrap_spans(
+        prefix + text, spans, text_width(), " " * shift, raw
+    )
+    return lines if raw else list(map(ansi, lines, runs))
+
+
+def diff(args: dict[str, str], bibles: list[Bible]) -> int:
+    """Compare translations verse by verse, streaming per-book scores."""
+    if len(bibles) < 2:
+        print("error: diff compares translations, e.g. -t nkjv,esv diff")
+        return 1
+
+    bible = bibles[0]
+    refs = [
+        ref
+        for display, book in select_books(bible, args.get("b"))
+        for ref in book_refs(bible, book)
+    ]
+    names = {slug: display for display, slug in bible.books()}
+    t = [b.translation.name.upper() for b in bibles]
+    print(f"Comparing {', '.join(t[1:])} with {t[0]}\n")
+
+    def report(score: BookScore):
+        name = names.get(score.book, "All")
+        print(
+            f"{name:<16} {score.similarity:>7.1%} similar "
+            f"{score.chapters:>4} chapters {score.verses:>6} verses "
+            f"{score.identical:>6} identical"
+        )
+
+    failed = 0
+    summary = DiffSummary(args.get("limit"))
+    with DiffExecutor(args.get("jobs")) as executor:
+        for (book, ch), future in executor.diff(bibles, refs):
+            try:
+                done = summary.add(future.result())
+            except Exception as exc:
+                failed += 1
+                logging.error(f"{book} {ch}: {exc}")
+                continue
+            if done is not None:
+                report(done)
+    if summary.finish() is not None:
+        report(summary.books[-1])
+    report(summary.overall())
+    if failed:
+        print(f"{failed} chapters could not be compared")
+
+    raw = args.get("raw")
+    divergent = summary.most_divergent()
+    if divergent:
+        print("\nMost divergent verses\n")
+    for v in divergent:
+        name = names.get(v.book, v.book)
+        print(f"{name} {v.chapter}:{v.verse} ({v.similarity:.0%})")
+        for translation, ops in zip(t[1:], v.ops):
+            for line in diff_lines(translation, ops, raw):
+                print(line)
+        print()
+
+    return int(failed > 0)
+
+
+def manifest(args: dict[str, str]) -> Manifest:
+    """Update the cache's manifest and report what it holds."""
+    start = time.perf_counter()
+    result = Manifest.local(args.get("jobs"))
+    elapsed = time.perf_counter() - start
+    print(
+        f"{len(result.entries)} entries, {result.size()} bytes; "
+        f"hashed {result.hashed} in {elapsed:.2f}s"
+    )
+    return result
+
+
+def serve_cache(args: dict[str, str]) -> int:
+    server = ManifestServer(args.get("address"), args.get("jobs"))
+    host, port = server.server_address[:2]
+    print(f"Serving {Data.path} to peers on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+def sync_cache(args: dict[str, str]) -> int:
+    """Copy entries missing or changed here from another cache."""
+    if args.get("serve"):
+        return serve_cache(args)
+    if not args.get("source"):
+        print("error: sync needs a cache directory or peer to sync from")
+        return 1
+
+    jobs = args.get("jobs")
+    source = open_source(args.get("source"))
+    try:
+        remote = source.manifest(jobs)
+    except Exception as exc:
+        print(f"error: {exc}")
+        return 1
+
+    local = manifest(args)
+    delta = local.delta(remote)
+    size = sum([remote[relpath].size for relpath in delta])
+    print(f"{len(delta)} of {len(remote)} entries to copy ({size} bytes)")
+    if args.get("dry_run"):
+        for relpath in delta:
+            print(f"  {relpath}")
+        return 0
+
+    counts = sync(source, local, remote, jobs or 8)
+    print(
+        f"Copied {counts['copied']} entries "
+        f"({counts['bytes']} bytes transferred), "
+        f"{counts['failed']} failed"
+    )
+    if counts["copied"]:
+        Manifest.local(jobs)
+    return int(counts["failed"] > 0)
+
+
+def concordance(args: dict[str, str], bible: Bible) -> int:
+    """Answer word-frequency queries from the cached chapters."""
+    try:
+        # numpy is optional; only the concordance needs it
+        from .concordance import Concordance
+    except ImportError:
+        print(f"error: the concordance needs numpy ({PROG}[analytics])")
+        return 1
+
+    query, terms = args.get("query"), args.get("terms")
+    if query in ("freq", "kwic", "cooccur") and not terms:
+        print(f"error: {query} needs a term to look up")
+        return 1
+
+    rebuild = query == "index"
+    index = Concordance.open(bible, rebuild, args.get("jobs"))
+    if rebuild:
+        print(
+            f"Indexed {len(index.chapters)} chapters, "
+            f"{len(index.tokens)} words, {len(index.terms)} terms"
+        )
+        return 0
+
+    books = index.select(args.get("b"))
+    n = args.get("limit")
+    if query == "freq":
+        counts = index.frequency(terms)
+        rows = [i for i, b in enumerate(books) if b and counts[i].any()]
+        width = max([len(index.names[i]) for i in rows] + [5])
+        print(" ".join([f"{'Book':<{width}}", *[f"{t:>9}" for t in terms]]))
+        for i in rows:
+            row = [f"{c:>9}" for c in counts[i]]
+            print(" ".join([f"{index.names[i]:<{width}}", *row]))
+        totals = [f"{c:>9}" for c in counts[books].sum(axis=0)]
+        print(" ".join([f"{'Total':<{width}}", *totals]))
+    elif query == "top":
+        for score in index.top(n, books):
+            print(f"{score.term:<16} {score.count:>8} {score.score:>8.2%}")
+    elif query == "kwic":
+        names = dict(zip(index.books, index.names))
+        for term in terms:
+            for c in index.kwic(term, args.get("window"), n, books):
+                ref = f"{names[c.book]} {c.chapter}:{c.verse}"
+                print(f"{ref:<20} {c.left[-40:]:>40} [{c.word}] {c.right}")
+    elif query == "cooccur":
+        for score in index.cooccurring(terms[0], n, books):
+            print(f"{score.term:<16} {score.count:>8} {score.score:>10.1f}")
+    elif query == "compare":
+        if not args.get("b"):
+            print("error: compare needs --book to select the books")
+            return 1
+        against = ~books
+        if args.get("against"):
+            against = index.select(args.get("against")) & ~books
+        for score in index.distinctive(books, against, n):
+            print(f"{score.term:<16} {score.count:>8} {score.score:>8.2f}")
+    return 0
+
+
 def main():
     try:
         args = parse_args()
@@ -306,11 +1161,35 @@ def main():
         print(exc)
         return 1
 
+    conf.configure(args.get("base_uri"))
+    Data.configure(args.get("cache_dir"))
     try:
-        bible = Bible(args.get("translation"))
+        Freshness.configure(args.get("ttl"))
+    except ValueError as exc:
+        print(f"error: ${TTL_ENV}: {exc}")
+        return 1
+    if args.get("rate") is not None:
+        limiter.configure(rate=args.get("rate"))
+    else:
+        try:
+            parse_rate(os.environ.get(RATE_ENV))
+        except ValueError as exc:
+            # Already fallen back on; a typo shouldn't stop every command
+            print(f"warning: ${RATE_ENV}: {exc}; using {DEFAULT_RATE:g}")
+
+    # Cache replication needs no translation; a new host has none yet
+    if args.get("book") == "manifest":
+        manifest(args)
+        return 0
+    elif args.get("book") == "sync":
+        return sync_cache(args)
+
+    try:
+        bibles = load_bibles(args.get("translation").split(","))
     except HttpError as exc:
         print(f"error: {exc}")
         return 1
+    bible = bibles[0]
 
     book = args.get("book")
     books = bible.books()
@@ -318,19 +1197,40 @@ def main():
         print(", ".join([t[0] for t in books]))
         return 0
     elif book == "search":
-        return search(args, bible)
+        return search(args, bibles)
     elif book == "download":
         bible.download()
-        return 0
+        return verify(args, bible)
+    elif book == "warm":
+        return warm_cache(args, bibles)
+    elif book == "verify":
+        return verify(args, bible)
+    elif book == "export":
+        return export(args, bible)
+    elif book == "batch":
+        return batch(args, bible)
+    elif book == "xrefs":
+        return xrefs(args, bible)
+    elif book == "diff":
+        return diff(args, bibles)
+    elif book == "concordance":
+        return concordance(args, bible)
+    elif book == "refresh":
+        return max([refresh(args, b) for b in bibles])
 
-    results = regex_search(args.get("book"), books)
-    if not results:
+    book = bible.resolve(args.get("book"))
+    if book is None:
         print("error: invalid book name")
         return 1
-    book = results[0][1]
 
     ch = args.get("chapter")
     verses = args.get("verse")
+    ref = args.get("reference")
+
+    # Spans of chapters, and whole chapters when piped, are streamed
+    if not ref.single() or (verses is None and not sys.stdout.isatty()):
+        stream_view(bibles, ref, book, args.get("raw"), args.get("clipboard"))
+        return 0
 
     is_oneshot = verses is not None
     f = {
@@ -340,7 +1240,7 @@ def main():
 
     try:
         f.get(is_oneshot)(
-            bible, book, ch, verses, args.get("raw"), args.get("clipboard")
+            bibles, book, ch, verses, args.get("raw"), args.get("clipboard")
         )
     except Exception as exc:
         logging.error(exc)
@@ -0,0 +1,215 @@
+"""
+asyncio client for biblestudytools.com.
+
+AsyncBible mirrors the blocking Bible API as coroutines. HTTP requests
+go through a pooled aiohttp session and lxml parsing is offloaded to an
+executor, so the event loop is never blocked by either. Downloaded
+content is stored in the same Data cache layout used by Bible, with the
+same freshness metadata, so TTLs and revalidation apply to it too.
+
+Requires the optional 'aiohttp' dependency.
+"""
+
+import asyncio
+import logging
+from concurrent.futures import Executor
+from functools import partial
+from typing import Any
+
+import aiohttp
+
+from . import conf
+from .bible import parse_search, search_params
+from .book import Chapter, chapter_found
+from .cache import Data
+from .fresh import Freshness
+from .http import (
+    THROTTLED,
+    NotFound,
+    Response,
+    limiter,
+    retry_after,
+    status_error,
+)
+from .translation import Translation
+
+
+class AsyncBible:
+    def __init__(
+        self,
+        translation: str = "nkjv",
+        connections: int = 8,
+        executor: Executor = None,
+    ) -> "AsyncBible":
+        self.translation = Translation(translation)
+        self.connections = connections
+        self.executor = executor
+        self.session = None
+        self.num_results = 0
+
+    async def __aenter__(self) -> "AsyncBible":
+        try:
+            await self.open()
+        except BaseException:
+            await self.close()
+            raise
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def open(self):
+        """Open the connection pool and load the translation's books."""
+        if self.session is None:
+            connector = aiohttp.TCPConnector(limit=self.connections)
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        content = await asyncio.to_thread(self.translation.read)
+        if content is None:
+            response = await self._fetch(self.translation.uri())
+            relpath = Data.books_relpath(self.translation.name)
+            await asyncio.to_thread(Freshness.store, relpath, response)
+            content = response.content
+        await self._run(self.translation.load, content)
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _run(self, fn, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, partial(fn, *args, **kwargs)
+        )
+
+    async def _fetch(self, uri: str, retries: int = 3, **kwargs) -> Response:
+        # Shares http.limiter with the threaded paths, so mixing both
+        # still respects one rate and concurrency limit
+        for attempt in range(retries + 1):
+            await limiter.acquire_async()
+            try:
+                async with self.session.get(uri, **kwargs) as response:
+                    status = response.status
+                    content = await response.read()
+                    headers = response.headers
+            except BaseException:
+                limiter.release()
+                raise
+
+            delay = None
+            if status in THROTTLED:
+                delay = retry_after(headers.get("Retry-After"), attempt)
+            limiter.release(status, delay)
+
+            if status not in THROTTLED:
+                break
+
+        if status != 200:
+            raise status_error(status)
+        return Response(
+            status,
+            content,
+            headers.get("ETag"),
+            headers.get("Last-Modified"),
+        )
+
+    async def _get(self, uri: str, retries: int = 3, **kwargs) -> bytes:
+        return (await self._fetch(uri, retries, **kwargs)).content
+
+    def chapter_uri(self, book: str, chapter: int) -> str:
+        base = conf.BASE_URI
+        return f"{base}/{self.translation}/{book}/{chapter}.html"
+
+    async def books(self) -> list[tuple[str, str]]:
+        return self.translation.books
+
+    async def chapters(self, book: str) -> int:
+        """Number of chapters in a book."""
+        return await asyncio.to_thread(
+            Data.read_chapters, self.translation, book
+        )
+
+    async def get_chapter(self, book: str, chapter: int) -> str:
+        """
+        Store and retrieve cached data originated from HTTP requests
+        to the Bible.uri website
+        """
+
+        relpath = Data.chapter_relpath(self.translation, book, chapter)
+        uri = self.chapter_uri(book, chapter)
+        content = await asyncio.to_thread(Data.read, relpath)
+        if content is None:
+            response = await self._fetch(uri)
+            # As with Bible, "Page not found" pages aren't cached
+            if not await self._run(chapter_found, response.content):
+                raise NotFound(f"{uri}: page not found")
+            await asyncio.to_thread(Freshness.store, relpath, response)
+            content = response.content
+        elif await asyncio.to_thread(Freshness.is_stale, relpath):
+            Freshness.revalidate_later(relpath, uri)
+        return content.decode()
+
+    async def chapter(
+        self, book: str, chapter: int, raw: bool = False
+    ) -> Chapter:
+        """Fetch a chapter and parse it off the event loop."""
+        content = await self.get_chapter(book, chapter)
+        return await self._run(Chapter, self.translation.name, content, raw)
+
+    async def search(self, args: dict[str, Any], page: int = 1):
+        """Search from page onward, fetching pages until one is empty."""
+        results = []
+        p = page
+        while True:
+            uri, params = search_params(self.translation, args, p)
+            try:
+                content = await self._get(uri, params=params)
+                results += await self._run(parse_search, content)
+            except Exception as exc:
+                logging.debug(f"Search stopped at page {p}: {exc}")
+                break
+            p += 1
+
+        self.num_results = len(results)
+        return results
+
+    async def _download_book(self, book: str) -> int:
+        """
+        Download every chapter of a book, `connections` chapters at a
+        time, and return the number of chapters found.
+        """
+        nc = await self.chapters(book)
+        window = self.connections
+
+        i = 1
+        while nc is None or i <= nc:
+            end = i + window
+            if nc is not None:
+                end = min(end, nc + 1)
+
+            batch = range(i, end)
+            results = await asyncio.gather(
+                *[self.get_chapter(book, ch) for ch in batch],
+                return_exceptions=True,
+            )
+
+            for ch, result in zip(batch, results):
+                if isinstance(result, NotFound):
+                    nc = ch - 1
+                    await asyncio.to_thread(
+                        Data.save_chapters, self.translation, book, str(nc)
+                    )
+                    return nc
+                elif isinstance(result, BaseException):
+                    raise result
+
+            i = end
+
+        return nc
+
+    async def download(self):
+        """Download the whole Bible."""
+        for book_display, book in await self.books():
+            await self._download_book(book)
+            print(f"Downloaded '{book_display}'")
@@ -1,12 +1,13 @@
 import curses
 import re
 import shutil
+import sys
 from textwrap import wrap
-from typing import Any, Callable
+from typing import Any, Callable, NamedTuple
 
 from lxml import etree
 
-from .color import Colors
+from .color import SGR, Colors
 
 
 def _dec(content: list[str], attr: int = 0) -> tuple[int, list[str]]:
@@ -21,76 +22,300 @@ def raw_wrap_(text, **kw):
     return [text]
 
 
-def parse_passages(root: etree._Element, raw: bool = False):
+def text_width(columns: int = None) -> int:
+    """Width text is wrapped to, in a terminal (or screen) of columns."""
+    columns = columns or shutil.get_terminal_size((80, 20)).columns
+    return int(columns * 0.9)
 
-    wrap_fn = wrap_
-    if raw:
-        wrap_fn = raw_wrap_
 
-    ts = shutil.get_terminal_size((80, 20))
-    textwidth = int(ts.columns * 0.9)
+class Span(NamedTuple):
+    """A styled run of a verse's text, by character offsets."""
+
+    start: int
+    end: int
+    # "red" (red-letter), "italic" or "note" (footnote/cross-reference)
+    style: str
+    # Where a note links to, if anywhere
+    target: str = None
+
+
+class Verse(NamedTuple):
+    """Compact, picklable record of a parsed verse."""
+
+    number: int
+    text: str
+    # Segment heading preceding the verse, if any
+    title: str = None
+    spans: tuple[Span] = ()
+
+
+# A styled run of a wrapped line: (start column, end column, style)
+Run = tuple[int, int, str]
+
+WHITESPACE_RE = re.compile(r"\s+")
+NOTE_CLASSES = ("footnote", "xref", "crossref", "cross-reference")
+
+
+def _style(element: etree._Element) -> str:
+    cls = element.get("class", "")
+    if "red-letter" in cls:
+        return "red"
+    if element.tag in ("i", "em"):
+        return "italic"
+    if element.tag == "sup" or any(c in cls for c in NOTE_CLASSES):
+        return "note"
+    return None
+
+
+class _Text:
+    """Accumulates text with collapsed whitespace, tracking offsets."""
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.space = True
+
+    def add(self, text: str):
+        if not text:
+            return
+        text = WHITESPACE_RE.sub(" ", text)
+        if self.space and text[0] == " ":
+            text = text[1:]
+        if text:
+            self.parts.append(text)
+            self.length += len(text)
+            self.space = text[-1] == " "
+
+    def end(self, start: int) -> int:
+        """Offset ending a span started at start, less trailing space."""
+        if self.space and self.length > start:
+            return self.length - 1
+        return self.length
+
+
+def _walk(element: etree._Element, text: _Text, spans: list, skip: set):
+    style = _style(element)
+    start = text.length
+    text.add(element.text)
+    for child in element:
+        if isinstance(child.tag, str) and child not in skip:
+            _walk(child, text, spans, skip)
+        text.add(child.tail)
+
+    end = text.end(start)
+    if style and end > start:
+        target = element.get("href")
+        if target is None and style == "note":
+            links = element.xpath(".//a/@href")
+            target = str(links[0]) if links else None
+        spans.append(Span(start, end, style, target))
+
+
+def extract_passages(root: etree._Element) -> list[Verse]:
+    """Extract verse records, with their styled spans, from verse divs."""
     divs = root.xpath(".//div[contains(@class, 'leading-8')]")
-    i = 0
     output = []
-    num_verses = 0
-    for div in divs:
-        offset = 1
+    for i, div in enumerate(divs, 1):
+        skip = set(div.xpath("./h3"))
+
+        title = None
+        if skip:
+            # xpath() returns "smart" strings referencing the whole tree;
+            # copy and intern, as headings repeat across translations
+            title = sys.intern(str(div.xpath("./h3/text()")[0]))
+
+        number = div.xpath("./a")[0]
+        verse_num = (number.text or "").strip()
+        skip.add(number)
+
+        text, spans = _Text(), []
+        _walk(div, text, spans, skip)
+        body = "".join(text.parts).rstrip()
+        spans = [s for s in spans if s.start < len(body)]
+
+        number = int(verse_num) if verse_num.isdigit() else i
+        spans = tuple(sorted(spans, key=lambda s: s[:2]))
+        output.append(Verse(number, body, title, spans))
+
+    return output
+
+
+def plain_text(verse: Verse) -> str:
+    """Text of a verse without its note markers."""
+    text, end = [], 0
+    for span in verse.spans:
+        if span[2] == "note":
+            text.append(verse.text[end : span[0]])
+            end = span[1]
+    text.append(verse.text[end:])
+    return WHITESPACE_RE.sub(" ", " ".join(text)).strip()
 
-        title = div.xpath("./h3")
-        if title:
-            offset = 2
-            title = title[0].xpath("./text()")[0]
 
-        verse_num = div.xpath("./a/text()")[0].strip()
+def _breakable(text: str, hyphen: int) -> bool:
+    """Whether textwrap would break after the hyphen at this offset."""
+    after = text[hyphen + 1 : hyphen + 2]
+    return text[hyphen - 2 : hyphen].isalpha() and after.isalpha()
 
-        i += 1
+
+def _chunk_end(text: str, pos: int) -> int:
+    """End of the unbreakable chunk of text starting at pos."""
+    end = text.find(" ", pos)
+    if end == -1:
+        end = len(text)
+    hyphen = text.find("-", pos + 2, end)
+    while hyphen != -1:
+        if _breakable(text, hyphen):
+            return hyphen + 1
+        hyphen = text.find("-", hyphen + 1, end)
+    return end
+
+
+def wrap_spans(
+    text: str,
+    spans: tuple[Span],
+    width: int,
+    indent: str = "",
+    raw: bool = False,
+) -> tuple[list[str], list[tuple[Run]]]:
+    """
+    Greedily wrap text to width like textwrap.wrap, also breaking after
+    hyphens within words, and split spans across the wrapped lines.
+    Returns the lines and each line's runs of (start, end, style)
+    columns. text must already have its whitespace collapsed.
+    """
+    lines, offsets = [], []
+    pos, n = 0, len(text)
+    while pos < n:
+        prefix = indent if lines else ""
+        avail = max(width - len(prefix), 1)
+        limit = pos + avail
+        if raw or n <= limit:
+            cut = after = n
+        else:
+            cut = text.rfind(" ", pos, limit + 1)
+            hyphen = text.rfind("-", pos + 2, limit)
+            if hyphen > max(cut, pos) and _breakable(text, hyphen):
+                cut = after = hyphen + 1
+            elif cut <= pos or _chunk_end(text, cut + 1) - cut - 1 > avail:
+                # A word too long for a whole line is split like
+                # textwrap does, filling this line first
+                cut = after = limit
+                while cut > pos and text[cut - 1] == " ":
+                    cut -= 1
+            else:
+                after = cut + 1
+        lines.append(prefix + text[pos:cut])
+        offsets.append((pos, cut, len(prefix)))
+        pos = after
+        while pos < n and text[pos] == " ":
+            pos += 1
+
+    runs = []
+    for start, end, column in offsets:
+        shift = column - start
+        # Tuples; most lines have no runs and share the empty tuple
+        runs.append(
+            tuple(
+                (max(s[0], start) + shift, min(s[1], end) + shift, s[2])
+                for s in spans
+                if s[0] < end and s[1] > start
+            )
+        )
+    return (lines, runs)
+
+
+def segments(line: str, runs: tuple[Run]) -> list[tuple[str, tuple[str]]]:
+    """Split a line into (text, styles) at the boundaries of its runs."""
+    if not runs:
+        return [(line, ())]
+
+    bounds = sorted({0, len(line)} | {c for r in runs for c in r[:2]})
+    output = []
+    for start, end in zip(bounds, bounds[1:]):
+        if end > len(line):
+            break
+        styles = tuple(r[2] for r in runs if r[0] <= start and r[1] >= end)
+        output.append((line[start:end], styles))
+    return output
+
+
+def ansi(line: str, runs: tuple[Run]) -> str:
+    """Render a line's runs with ANSI escape codes."""
+    if not runs:
+        return line
+    output = []
+    for text, styles in segments(line, runs):
+        codes = ";".join([SGR.get(s) for s in styles if s in SGR])
+        output.append(f"\033[{codes}m{text}\033[0m" if codes else text)
+    return "".join(output)
+
+
+def wrap_passages(
+    verses: list[Verse],
+    raw: bool = False,
+    width: int = None,
+    index: dict[int, int] = None,
+    runs: list[list[tuple[Run]]] = None,
+):
+    """
+    Wrap verse records into decorated passages.
+
+    If index is given, it is filled with verse number -> position of
+    that verse in the returned passage list. If runs is given, it is
+    filled with the styled runs of each passage's lines, parallel to
+    the returned passages.
+    """
+
+    wrap_fn = wrap_
+    if raw:
+        wrap_fn = raw_wrap_
+
+    textwidth = width or text_width()
+    output = []
+    line_runs = []
+    for i, verse in enumerate(verses, 1):
         indent = " " * (1 + len(str(i)))
 
-        """ Needed for red-letter decoration. """
-        # red = div.xpath("./span[contains(@class, 'red-letter')]")
-
-        # Text sanitization for display
-        body = [t.strip() for t in div.itertext()]
-        body = [x for x in body if x]
-
-        """ Red-letter attempt; good progress, need to persist between
-            textwrapped lines.
-        logging.info(body)
-        for i in range(len(body)):
-            for section in red:
-                logging.info(section.text)
-                # TODO: This doesn't work... because the red letter is
-                # split upon multiple lines via textwrap.wrap
-                # Think of a clever way to persist red-letter styles through
-                # our output list along with textwrap.wrap results
-                body[i] = body[i].replace(section.text, f"<{section.text}>")
-        logging.info(f" * {body}")
-        """
-
-        body[offset] = body[offset].replace(str(verse_num), "")
-        body = [verse_num] + body[offset:]
-
-        text = re.sub(r"\s{2}", " ", " ".join(body))
-        text = re.sub(r" ([:?,])", r"\1", text)
-
-        if title:
-            w = wrap_fn(title, width=textwidth, subsequent_indent="")
+        if verse.title:
+            w = wrap_fn(verse.title, width=textwidth, subsequent_indent="")
             output += [
                 _dec([""], Colors.default_color()),
                 # Boldify segment titles
                 _dec(w, Colors.default_color(curses.A_BOLD)),
                 _dec([""], Colors.default_color()),
             ]
+            line_runs += [
+                [()],
+                [((0, len(ln), "heading"),) for ln in w],
+                [()],
+            ]
 
-        output.append(
-            _dec(
-                wrap_fn(text, width=textwidth, subsequent_indent=indent),
-                Colors.default_color(),
-            )
+        if index is not None:
+            index[verse.number] = len(output)
+
+        prefix = f"{verse.number} "
+        shift = len(prefix)
+        spans = [(s[0] + shift, s[1] + shift, s[2]) for s in verse.spans]
+        lines, r = wrap_spans(
+            prefix + verse.text, spans, textwidth, indent, raw
         )
-        num_verses += 1
+        output.append(_dec(lines, Colors.default_color()))
+        line_runs.append(r)
+
+    if runs is not None:
+        runs += line_runs
+
+    return (len(verses), output)
+
 
-    return (num_verses, output)
+def parse_passages(
+    root: etree._Element,
+    raw: bool = False,
+    width: int = None,
+    index: dict[int, int] = None,
+):
+    """Parse verse divs under root into decorated, wrapped passages."""
+    return wrap_passages(extract_passages(root), raw, width, index)
 
 
 def reduce(array: list[Any], check: Callable) -> list[Any]:
@@ -1,15 +1,35 @@
 import logging
-import os
 import re
 import sys
-from typing import Any
-from urllib.parse import quote_plus
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+from urllib.parse import quote_plus, urlencode
 
-from . import http
-from .algorithm import parse_passages
+from . import conf, http
+from .algorithm import Verse, extract_passages, text_width
+from .book import Chapter, chapter_found
 from .cache import Data
-from .conf import BASE_URI
+from .fresh import Freshness
 from .translation import Translation
+from .xref import (
+    Target,
+    chapter_xrefs,
+    dump_xrefs,
+    load_xrefs,
+    parse_target,
+)
+
+# Seconds search result pages are reused for before searching again
+SEARCH_TTL = 3600
+
+
+class SearchHit(NamedTuple):
+    """A search result: the verses it matched and where they are."""
+
+    title: str
+    # Parsed from the result's link; None if it didn't link to verses
+    target: Target
+    verses: list[Verse]
 
 
 class Bible:
@@ -17,12 +37,8 @@ class Bible:
         self.translation = Translation(translation)
         self.translation.parse()
 
-        # Prepare storage
-        if not os.path.exists(Data.path):
-            os.mkdir(Data.path)
-
         self.num_results = 99
-        self.num_chapters = None
+        self.num_chapters = dict()
 
     def search(self, args: dict[str, Any], page: int = 1):
         print("Searching page ", end=str())
@@ -42,75 +58,68 @@ class Bible:
         self.num_results = len(results)
         return results
 
-    def _search(self, args: dict[str, Any], page: int = 1):
-        criteria = args.get("query")
-        logging.debug(f"Search keywords: {criteria}")
-        q = " ".join([f'"{c}"' for c in criteria])
-        uri = f"{BASE_URI}/search"
-        params = {
-            "t": self.translation,
-            "q": q,
-            "s": "bibles",
-            "p": str(page),
-        }
-
-        if "b" in args:
-            params["c"] = args.get("b")
-
-        logging.debug(f"Search URL: '{q}'")
-        logging.debug(f"Search params: {params}")
-
-        content = http.get(uri, params=params)
-        root = http.parse(content.decode())
+    def locate(self, hit: SearchHit) -> Target:
+        """Where a search hit is, from its link or else its title."""
+        if hit.target is not None:
+            return hit.target
 
-        parent = '//div[@id="tabContent"]/div'
+        try:
+            name, spec = hit.title.rsplit(maxsplit=1)
+            ch, _, verses = spec.partition(":")
+            start, _, end = verses.partition("-")
+            start = int(start) if start else None
+            target = (int(ch), start, int(end) if end else start)
+        except ValueError:
+            return None
 
-        results = root.xpath(parent + '/div[contains(@class, "shadow-md")]')
-        if not results:
-            raise Exception("finished")
+        book = self.resolve(name)
+        return Target(book, *target) if book is not None else None
 
-        output = []
-        for result in results:
-            title = result.xpath("./a")
-            title = "".join([t.strip() for t in title[0].itertext()])
-            num_verses, passage = parse_passages(result)
-            output.append((title, passage))
-
-        return output
+    def _search(self, args: dict[str, Any], page: int = 1):
+        uri, params = search_params(self.translation, args, page)
+        # Cached briefly, so repeating a search (to open a result) is
+        # instant and works offline, but results don't go stale
+        relpath = Data.search_relpath(params)
+        uri = f"{uri}?{urlencode(params)}"
+        content = Freshness.read_within(relpath, uri, SEARCH_TTL)
+        return parse_search(content)
 
     def chapter_uri(self, book: str, chapter: int) -> str:
-        return f"{BASE_URI}/{self.translation}/{book}/{chapter}.html"
+        base = conf.BASE_URI
+        return f"{base}/{self.translation}/{book}/{chapter}.html"
 
     def book_uri(self, book: str) -> str:
         return f"{Data.path}/{self.translation}/{book}"
 
     def local_chapter_uri(self, book: str, chapter: int) -> str:
-        return f"{Data.path}/{self.translation}/{book}/{chapter}"
+        return Data.chapter_path(self.translation, book, chapter)
 
     def chapter_exists(self, book: str, ch: int) -> bool:
-        uri = self.local_chapter_uri(book, ch)
-        return os.path.exists(uri)
+        return Data.has_chapter(self.translation, book, ch)
 
     def books(self) -> list[tuple[str, str]]:
         return self.translation.books
 
+    def resolve(self, name: str) -> str:
+        """Resolve a user-supplied book name to its URI leaf, or None."""
+        result = self.translation.resolver().resolve(name)
+        return result[1] if result else None
+
     def chapters(self, book: str) -> int:
         """Number of chapters in a book."""
-        if self.num_chapters is not None:
-            return self.num_chapters
+        if self.num_chapters.get(book) is not None:
+            return self.num_chapters.get(book)
 
-        path = self.book_uri(book) + "/chapters"
-        if os.path.exists(path):
-            with open(path) as f:
-                self.num_chapters = int(f.read().strip())
-            return self.num_chapters
-
-        return None
+        self.num_chapters[book] = Data.read_chapters(self.translation, book)
+        return self.num_chapters.get(book)
 
     def save_chapters(self, book: str, chapters: str):
-        path = self.book_uri(book) + "/chapters"
-        with open(path, "w") as f:
-            f.write(chapters)
+        Data.save_chapters(self.translation, book, chapters)
+        self.num_chapters[book] = int(chapters)
+
+    def cached_chapters(self, book: str) -> list[int]:
+        """Sorted chapter numbers of a book present in the local cache."""
+        return Data.cached_chapters(self.translation, book)
 
     def get_chapter(self, book: str, chapter: int) -> str:
         """
@@ -118,27 +127,181 @@ class Bible:
         to the Bible.uri website
         """
 
-        content = Data.read_chapter(self.translation, book, chapter)
-        if not content:
-            content = http.get(self.chapter_uri(book, chapter))
-            Data.save_chapter(self.translation, book, chapter, content)
+        relpath = Data.chapter_relpath(self.translation, book, chapter)
+        uri = self.chapter_uri(book, chapter)
+        content = Freshness.read(relpath, uri, chapter_found)
         return content.decode()
 
+    def load_chapter(
+        self, book: str, chapter: int, raw: bool = False, width: int = None
+    ) -> Chapter:
+        """
+        Load a parsed chapter, reusing parsed records and pre-rendered
+        lines from the cache when present.
+        """
+        t = self.translation.name
+        if not raw:
+            width = width or text_width()
+
+        parsed = Data.read_parsed(t, book, chapter)
+        if parsed is not None:
+            title, records = parsed
+            records = [Verse(*r) for r in records]
+            result = Chapter.from_records(t, title, records, raw, width)
+        else:
+            content = self.get_chapter(book, chapter)
+            result = Chapter(t, content, raw, width)
+            self.save_parsed(book, chapter, result)
+
+        if not raw:
+            passages = Data.read_rendered(t, book, chapter, width)
+            if passages is not None:
+                result.load_passages(passages)
+
+        return result
+
+    def save_parsed(self, book: str, chapter: int, result: Chapter):
+        records = [list(r) for r in result.records]
+        data = [result.title, records]
+        Data.save_parsed(self.translation, book, chapter, data)
+
+        # Grow the cross-reference index with every chapter parsed
+        graph = dump_xrefs(chapter_xrefs(result.records))
+        Data.save_xrefs(self.translation, book, chapter, graph)
+
+    def xrefs(self, book: str, chapter: int) -> dict[int, list[Target]]:
+        """Verse number -> cross-referenced verses of a chapter."""
+        graph = Data.read_xrefs(self.translation, book, chapter)
+        if graph is None:
+            # Parsed before the index existed, or not cached at all
+            records = self.load_chapter(book, chapter, raw=True).records
+            graph = dump_xrefs(chapter_xrefs(records))
+            Data.save_xrefs(self.translation, book, chapter, graph)
+        return load_xrefs(graph)
+
+    def has_xrefs(self, book: str, chapter: int) -> bool:
+        return Data.read_xrefs(self.translation, book, chapter) is not None
+
+    def save_rendered(
+        self, book: str, chapter: int, width: int, passages: list[list]
+    ):
+        """Cache Chapter.passages() of a chapter wrapped at width."""
+        Data.save_rendered(self.translation, book, chapter, width, passages)
+
+    def probe_chapters(self, book: str, window: int = 4) -> int:
+        """
+        Number of chapters in a book, fetching chapters past those cached,
+        `window` at a time, until one isn't found when the count isn't
+        known yet.
+        """
+        nc = self.chapters(book)
+        if nc is not None:
+            return nc
+
+        cached = self.cached_chapters(book)
+        i = max(cached) + 1 if cached else 1
+        with ThreadPoolExecutor(max_workers=window) as pool:
+            while True:
+                batch = range(i, i + window)
+                futures = [
+                    pool.submit(self.get_chapter, book, ch) for ch in batch
+                ]
+                for ch, future in zip(batch, futures):
+                    try:
+                        future.result()
+                    except http.NotFound:
+                        self.save_chapters(book, str(ch - 1))
+                        return ch - 1
+                i += window
+
+    def cached_entries(self, books: list[str]) -> list[tuple[str, str]]:
+        """(cache relpath, uri) of the index and cached chapters of books."""
+        t = self.translation
+        entries = [(Data.books_relpath(t.name), t.uri())]
+        for book in books:
+            for ch in self.cached_chapters(book):
+                relpath = Data.chapter_relpath(t, book, ch)
+                entries.append((relpath, self.chapter_uri(book, ch)))
+        return entries
+
     def download(self):
         """Download the whole Bible."""
         books = self.books()
         for book_display, book in books:
             nc = self.chapters(book)
-            self.num_chapters = None
-
-            for i in range(1, nc - 1):
-                if self.chapter_exists(book, i):
-                    continue
-
-                try:
-                    self.get_chapter(book, i)
-                except http.HttpError:
-                    num_chapters = i - 1
-                    self.save_chapters(book, str(num_chapters))
-                    print(f"Downloaded '{book_display}'")
-                    break
+
+            i = 1
+            while nc is None or i <= nc:
+                if not self.chapter_exists(book, i):
+                    try:
+                        self.get_chapter(book, i)
+                    except http.NotFound:
+                        self.save_chapters(book, str(i - 1))
+                        break
+                i += 1
+
+            print(f"Downloaded '{book_display}'")
+
+
+def load_bibles(translations: list[str]) -> list[Bible]:
+    """Construct a Bible per translation, parsing their indexes at once."""
+    with ThreadPoolExecutor(max_workers=len(translations)) as pool:
+        return list(pool.map(Bible, translations))
+
+
+def load_parallel(
+    bibles: list[Bible],
+    book: str,
+    chapter: int,
+    raw: bool = False,
+    width: int = None,
+) -> list[Chapter]:
+    """Fetch and parse the same chapter from each Bible concurrently."""
+    with ThreadPoolExecutor(max_workers=len(bibles)) as pool:
+        futures = [
+            pool.submit(b.load_chapter, book, chapter, raw, width)
+            for b in bibles
+        ]
+        return [f.result() for f in futures]
+
+
+def search_params(
+    translation: Translation, args: dict[str, Any], page: int = 1
+) -> tuple[str, dict[str, str]]:
+    criteria = args.get("query")
+    logging.debug(f"Search keywords: {criteria}")
+    q = " ".join([f'"{c}"' for c in criteria])
+    uri = f"{conf.BASE_URI}/search"
+    params = {
+        "t": str(translation),
+        "q": q,
+        "s": "bibles",
+        "p": str(page),
+    }
+
+    if args.get("b"):
+        params["c"] = args.get("b")
+
+    logging.debug(f"Search URL: '{q}'")
+    logging.debug(f"Search params: {params}")
+    return (uri, params)
+
+
+def parse_search(content: bytes) -> list[SearchHit]:
+    """Parse a search results page into SearchHits."""
+    root = http.parse(content.decode())
+
+    parent = '//div[@id="tabContent"]/div'
+
+    results = root.xpath(parent + '/div[contains(@class, "shadow-md")]')
+    if not results:
+        raise Exception("finished")
+
+    output = []
+    for result in results:
+        link = result.xpath("./a")[0]
+        title = "".join([t.strip() for t in link.itertext()])
+        target = parse_target(link.get("href"))
+        output.append(SearchHit(title, target, extract_passages(result)))
+
+    return output
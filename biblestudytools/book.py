@@ -1,35 +1,285 @@
+import curses
+from itertools import zip_longest
+
 from lxml import etree
 
-from .algorithm import parse_passages
+from .algorithm import Run, Verse, extract_passages, wrap_passages
+from .color import Colors
+from .find import TokenIndex
+from .http import NotFound
+
+
+def parse_chapter(content: str) -> tuple[str, list[Verse]]:
+    """Parse chapter HTML into its title and verse records."""
+    parser = etree.HTMLParser(recover=True)
+    root = etree.fromstring(content, parser)
+
+    h1 = root.xpath("//div/h1[contains(@class, 'text-xl')]")
+    title = "".join(h1[0].itertext()).strip() if h1 else None
+    if title is None or title == "Page not found":
+        raise NotFound("Page not found")
+
+    return (title, extract_passages(root))
+
+
+def chapter_found(content: bytes) -> bool:
+    """
+    Whether a fetched page holds a chapter. Past the end of a book the
+    site may answer 200 with a "Page not found" page instead of a 404.
+    """
+    try:
+        title, verses = parse_chapter(content.decode())
+    except (NotFound, UnicodeDecodeError):
+        return False
+    return bool(verses)
 
 
 class Chapter:
+    """
+    A parsed chapter.
+
+    Only the title and compact verse records are kept once parsed; the
+    page HTML is dropped and wrapped, decorated lines are produced on
+    first use. release() drops them again for chapters held long-term.
+    """
+
+    __slots__ = (
+        "translation",
+        "title",
+        "records",
+        "raw",
+        "width",
+        "_index",
+        "_verses",
+        "_runs",
+        "_tokens",
+    )
+
     def __init__(
-        self, translation: str, content: str, raw: bool = False
+        self,
+        translation: str,
+        content: str,
+        raw: bool = False,
+        width: int = None,
     ) -> "Chapter":
         self.translation = translation
-        self.content = content
-        self.parse(self.content, raw)
+        self.parse(content, raw, width)
 
-    def parse(self, content: str, raw: bool = False):
-        parser = etree.HTMLParser(recover=True)
-        root = etree.fromstring(content, parser)
+    @classmethod
+    def from_records(
+        cls,
+        translation: str,
+        title: str,
+        records: list[Verse],
+        raw: bool = False,
+        width: int = None,
+    ) -> "Chapter":
+        """Build a Chapter from records produced by parse_chapter."""
+        chapter = cls.__new__(cls)
+        chapter.translation = translation
+        chapter.load(title, records, raw, width)
+        return chapter
 
-        h1 = root.xpath("//div/h1[contains(@class, 'text-xl')]")
-        title = "".join(h1[0].itertext()).strip()
-        if title == "Page not found":
-            raise Exception("Page not found")
+    def parse(self, content: str, raw: bool = False, width: int = None):
+        title, records = parse_chapter(content)
+        self.load(title, records, raw, width)
 
+    def load(
+        self,
+        title: str,
+        records: list[Verse],
+        raw: bool = False,
+        width: int = None,
+    ):
         self.title = title
-        self.num_verses, self.verses = parse_passages(root, raw)
+        self.records = tuple(records)
+        self.raw, self.width = raw, width
+        self.release()
+
+    def release(self):
+        """Drop wrapped lines; they're rebuilt from records on demand."""
+        self._index, self._verses, self._runs = None, None, None
+        self._tokens = None
+
+    def _wrap(self):
+        self._index, self._runs = dict(), []
+        num_verses, self._verses = wrap_passages(
+            self.records, self.raw, self.width, self._index, self._runs
+        )
+
+    def passages(self) -> list[list]:
+        """Wrapped passages as [kind, verse, lines, runs] for caching."""
+        verses = {i: n for n, i in self.index.items()}
+        output = []
+        for i, (attr, lines) in enumerate(self.verses):
+            runs = self.runs[i]
+            if i in verses:
+                output.append(["v", verses.get(i), lines, runs])
+            elif lines == [""]:
+                output.append(["s", None, lines, runs])
+            else:
+                output.append(["h", None, lines, runs])
+        return output
+
+    def load_passages(self, passages: list[list]):
+        """Use passages produced by passages() instead of wrapping."""
+        attrs = {
+            "v": Colors.default_color(),
+            "s": Colors.default_color(),
+            "h": Colors.default_color(curses.A_BOLD),
+        }
+        self._index, self._tokens = dict(), None
+        self._verses, self._runs = [], []
+        for kind, n, lines, runs in passages:
+            if kind == "v":
+                self._index[n] = len(self._verses)
+            self._verses.append((attrs.get(kind), lines))
+            self._runs.append(runs)
+
+    @property
+    def num_verses(self) -> int:
+        return len(self.records)
+
+    @property
+    def verses(self) -> list[tuple[int, list[str]]]:
+        """Decorated, wrapped passages with headings as pseudo-verses."""
+        if self._verses is None:
+            self._wrap()
+        return self._verses
+
+    @property
+    def runs(self) -> list[list[tuple[Run]]]:
+        """Styled runs of each line of each of self.verses."""
+        if self._runs is None:
+            self._wrap()
+        return self._runs
+
+    @property
+    def index(self) -> dict[int, int]:
+        """Verse number -> position of that verse in self.verses."""
+        if self._index is None:
+            self._wrap()
+        return self._index
 
     def range(self) -> tuple[int, int]:
         # TODO: Fix extra +1 verses in NIV acts 8, why?
         return (1, self.num_verses)
 
+    def verse(self, n: int) -> tuple[int, list[str]]:
+        """Return the (attr, lines) entry of verse n, or None."""
+        i = self.index.get(n)
+        if i is None:
+            return None
+        return self.verses[i]
+
+    def styled_verse(self, n: int) -> tuple[int, list[str], list]:
+        """Return the (attr, lines, runs) entry of verse n, or None."""
+        i = self.index.get(n)
+        if i is None:
+            return None
+        return (*self.verses[i], self.runs[i])
+
+    def _entry_range(self, n: int) -> tuple[int, int]:
+        i = self.index.get(n)
+        if i is None:
+            return (0, 0)
+
+        positions = set(self.index.values())
+        j = i
+        while j > 0 and j - 1 not in positions:
+            j -= 1
+        return (j, i + 1)
+
+    def entries(self, n: int) -> list[tuple[int, list[str]]]:
+        """Return verse n preceded by any headings leading up to it."""
+        j, i = self._entry_range(n)
+        return self.verses[j:i]
+
+    def styled_entries(self, n: int) -> list[tuple[int, list[str], list]]:
+        """entries(n) as (attr, lines, runs)."""
+        j, i = self._entry_range(n)
+        return [(*v, r) for v, r in zip(self.verses[j:i], self.runs[j:i])]
+
     def lines(self):
         output = []
         for vl in self.verses:
             for v in vl[1]:
                 output.append((vl[0], v))
         return output
+
+    def line_index(self) -> dict[int, int]:
+        """Verse number -> position of its first line in lines()."""
+        starts, line = [], 0
+        for attr, lines in self.verses:
+            starts.append(line)
+            line += len(lines)
+        return {n: starts[i] for n, i in self.index.items()}
+
+    def styled_lines(self) -> list[tuple[int, str, tuple[Run]]]:
+        """lines() with each line's styled runs."""
+        output = []
+        for (attr, lines), runs in zip(self.verses, self.runs):
+            output += [(attr, ln, r) for ln, r in zip(lines, runs)]
+        return output
+
+    def token_index(self) -> TokenIndex:
+        """Word index of lines(), built on first use."""
+        if self._tokens is None:
+            self._tokens = TokenIndex([line for attr, line in self.lines()])
+        return self._tokens
+
+
+def column_width(columns: int, width: int, gap: int = 3) -> int:
+    """Width of each of `columns` columns fitting side by side in width."""
+    return max((width - gap * (columns - 1)) // columns, 1)
+
+
+def parallel_lines(
+    chapters: list[Chapter],
+    verses: tuple[int, int],
+    width: int,
+    gap: int = 3,
+    headings: bool = False,
+    index: dict[int, int] = None,
+) -> list[tuple[int, str]]:
+    """
+    Lay out chapters side by side in columns of `width` characters,
+    aligning each verse by number so every row starts at the same verse.
+    Returns (attr, line, runs) rows. If index is given, it is filled with
+    verse number -> position of the first row of that verse.
+    """
+    start, end = verses
+    sep = " " * gap
+    output = []
+    for n in range(start, end + 1):
+        columns = []
+        for chapter in chapters:
+            if headings:
+                entries = chapter.styled_entries(n)
+            else:
+                entry = chapter.styled_verse(n)
+                entries = [entry] if entry else []
+            columns.append(
+                [
+                    (a, ln, r)
+                    for a, lines, runs in entries
+                    for ln, r in zip(lines, runs)
+                ]
+            )
+
+        if not any(columns):
+            continue
+
+        if index is not None:
+            index[n] = len(output)
+        attr = next(c[0][0] for c in columns if c)
+        for row in zip_longest(*columns, fillvalue=(attr, "", ())):
+            line = sep.join([ln.ljust(width) for a, ln, r in row])
+            runs = [
+                (s + col * (width + gap), e + col * (width + gap), style)
+                for col, (a, ln, r) in enumerate(row)
+                for s, e, style in r
+            ]
+            output.append((attr, line.rstrip(), runs))
+
+    return output
@@ -1,48 +1,277 @@
+"""
+Local cache of pages scraped from BASE_URI.
+
+The cache is a stack of directories with the same layout. Entries are
+read from the first layer holding them and written to Data.path, the
+top layer. By default that is $HOME/.biblestudytools; set
+BIBLESTUDYTOOLS_CACHE (or pass --cache-dir) to move it, for example to
+a directory shared by every user on a host. Read-mostly layers listed in
+BIBLESTUDYTOOLS_SHARED_CACHE (colon-separated) sit underneath it, so a
+system-wide cache can serve everything it already holds while each user
+keeps their own additions.
+
+Writes go to a temporary file that is renamed into place, so any number
+of processes may read and populate a layer at once; readers see either
+nothing or a complete entry, never a partial one.
+
+Writing a chapter also replaces {translation}/generation in its layer,
+so indexes built over a translation's chapters can tell they're out of
+date with Data.generation() rather than by checking every chapter.
+"""
+
 import gzip
+import hashlib
+import json
 import os
+import re
+import tempfile
+import uuid
+from typing import Any
 
 from .conf import PROG
 
+CACHE_ENV = f"{PROG.upper()}_CACHE"
+SHARED_CACHE_ENV = f"{PROG.upper()}_SHARED_CACHE"
+
+# Bumped when the parsed or rendered representation changes, so derived
+# entries written by older versions are rebuilt rather than misread
+DERIVED_FORMAT = 2
+
+# Relpath of a chapter page: {translation}/{book}/{chapter}
+CHAPTER_RE = re.compile(r"[^/]+/[^/]+/\d+")
+
+# Read once; os.umask() can only be queried by setting it, which would
+# race with other threads creating files
+UMASK = os.umask(0)
+os.umask(UMASK)
+
 
 def home():
     return os.environ.get("HOME")
 
 
+def _shared_layers() -> list[str]:
+    paths = os.environ.get(SHARED_CACHE_ENV, "")
+    return [p for p in paths.split(":") if p]
+
+
 class Data:
-    path = f"{home()}/.{PROG}"
+    path = os.environ.get(CACHE_ENV) or f"{home()}/.{PROG}"
+    shared = _shared_layers()
 
-    def make_translation(translation: str):
-        path = f"{Data.path}/{translation}"
+    def configure(path: str = None, shared: list[str] = None):
+        if path:
+            Data.path = path
+        if shared is not None:
+            Data.shared = shared
+
+    def layers() -> list[str]:
+        return [Data.path] + [p for p in Data.shared if p != Data.path]
+
+    def find(relpath: str) -> str:
+        """Path of relpath in the first layer holding it, or None."""
+        for layer in Data.layers():
+            path = f"{layer}/{relpath}"
+            if os.path.exists(path):
+                return path
+        return None
+
+    def listdir(relpath: str) -> set[str]:
+        """Names under relpath across all layers."""
+        names = set()
+        for layer in Data.layers():
+            path = f"{layer}/{relpath}"
+            if os.path.isdir(path):
+                names.update(os.listdir(path))
+        return names
+
+    def write(
+        relpath: str, content: bytes, compress: bool = True, root: str = None
+    ):
+        """Atomically write content to relpath in the top layer (or root)."""
+        path = f"{root or Data.path}/{relpath}"
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=".tmp-")
         try:
-            os.mkdir(path)
-        except FileExistsError:
-            pass
+            with os.fdopen(fd, "wb") as fh:
+                if compress:
+                    with gzip.GzipFile(fileobj=fh, mode="wb") as gz:
+                        gz.write(content)
+                else:
+                    fh.write(content)
+            # mkstemp creates 0600 files; honor the umask like open() does
+            os.chmod(tmp, 0o666 & ~UMASK)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        if CHAPTER_RE.fullmatch(relpath):
+            translation = relpath.split("/", 1)[0]
+            relpath = Data.generation_relpath(translation)
+            Data.write(relpath, uuid.uuid4().hex.encode(), False, root)
+
+    def generation(translation: str) -> str:
+        """Changes whenever a chapter of translation is written, anywhere."""
+        stamps = []
+        for layer in Data.layers():
+            path = f"{layer}/{Data.generation_relpath(translation)}"
+            try:
+                with open(path) as fh:
+                    stamps.append(fh.read())
+            except FileNotFoundError:
+                stamps.append("")
+        return ":".join(stamps)
+
+    def read(relpath: str, compress: bool = True) -> bytes:
+        path = Data.find(relpath)
+        if path is None:
+            return None
+
+        opener = gzip.open if compress else open
+        with opener(path, "rb") as fh:
+            return fh.read()
+
+    def read_meta(relpath: str) -> dict:
+        """
+        Freshness metadata of an entry: when it was fetched and its HTTP
+        validators. Entries cached without metadata report their mtime.
+        """
+        meta = Data.read(f"{relpath}.meta", compress=False)
+        if meta is not None:
+            try:
+                return json.loads(meta)
+            except ValueError:
+                pass
+
+        path = Data.find(relpath)
+        if path is None:
+            return None
+        return {"fetched": os.path.getmtime(path)}
+
+    def save_meta(relpath: str, meta: dict):
+        Data.write(f"{relpath}.meta", json.dumps(meta).encode(), False)
+
+    def make_translation(translation: str):
+        os.makedirs(f"{Data.path}/{translation}", exist_ok=True)
 
     def make_book(translation: str, book: str):
-        path = f"{Data.path}/{translation}/{book}"
-        try:
-            os.mkdir(path)
-        except FileExistsError:
-            pass
+        os.makedirs(f"{Data.path}/{translation}/{book}", exist_ok=True)
+
+    def chapter_relpath(translation: str, book: str, chapter: str) -> str:
+        return f"{translation}/{book}/{chapter}"
+
+    def books_relpath(translation: str) -> str:
+        return f"{translation}/books"
+
+    def search_relpath(params: dict[str, str]) -> str:
+        """Where the search page requested with params is cached."""
+        criteria = "\0".join([params.get(k, "") for k in ("q", "s", "c")])
+        key = hashlib.sha1(criteria.encode()).hexdigest()[:16]
+        return f"search/{params.get('t', '')}/{key}/{params.get('p', '1')}"
+
+    def concordance_relpath(translation: str) -> str:
+        return f"{translation}/concordance.npz"
+
+    def fuzzy_relpath(translation: str) -> str:
+        return f"{translation}/fuzzy"
+
+    def generation_relpath(translation: str) -> str:
+        return f"{translation}/generation"
+
+    def chapter_path(translation: str, book: str, chapter: str) -> str:
+        """Path of a cached chapter, or where it would be written."""
+        relpath = f"{translation}/{book}/{chapter}"
+        return Data.find(relpath) or f"{Data.path}/{relpath}"
+
+    def has_chapter(translation: str, book: str, chapter: str) -> bool:
+        return Data.find(f"{translation}/{book}/{chapter}") is not None
+
+    def cached_chapters(translation: str, book: str) -> list[int]:
+        names = Data.listdir(f"{translation}/{book}")
+        return sorted([int(f) for f in names if f.isdigit()])
 
     def save_chapter(
         translation: str, book: str, chapter: str, content: bytes
     ):
-        path = f"{Data.path}/{translation}/{book}/{chapter}"
-        with gzip.open(path, "wb") as fh:
-            fh.write(content)
+        Data.write(f"{translation}/{book}/{chapter}", content)
 
     def read_chapter(translation: str, book: str, chapter: str) -> bytes:
+        return Data.read(f"{translation}/{book}/{chapter}")
+
+    def read_books(translation: str) -> bytes:
+        return Data.read(f"{translation}/books")
+
+    def save_books(translation: str, content: bytes):
+        Data.write(f"{translation}/books", content)
+
+    def read_chapters(translation: str, book: str) -> int:
+        content = Data.read(f"{translation}/{book}/chapters", compress=False)
+        if content is None:
+            return None
+        return int(content.strip())
 
-        if not os.path.exists(f"{Data.path}/{translation}"):
-            Data.make_translation(translation)
-        if not os.path.exists(f"{Data.path}/{translation}/{book}"):
-            Data.make_book(translation, book)
+    def save_chapters(translation: str, book: str, chapters: str):
+        relpath = f"{translation}/{book}/chapters"
+        Data.write(relpath, chapters.encode(), compress=False)
 
-        path = f"{Data.path}/{translation}/{book}/{chapter}"
-        if not os.path.exists(path):
+    def _read_derived(relpath: str, source: str) -> Any:
+        """Read gzipped JSON at relpath unless it's older than source."""
+        path, source = Data.find(relpath), Data.find(source)
+        if path is None or source is None:
             return None
 
-        with gzip.open(path, "rb") as fh:
-            data = fh.read()
-        return data
+        try:
+            if os.path.getmtime(path) < os.path.getmtime(source):
+                return None
+            with gzip.open(path, "rt") as fh:
+                derived = json.load(fh)
+        except (OSError, ValueError):
+            return None
+
+        if not isinstance(derived, dict):
+            return None
+        if derived.get("format") != DERIVED_FORMAT:
+            return None
+        return derived.get("data")
+
+    def _save_derived(relpath: str, data: Any):
+        derived = {"format": DERIVED_FORMAT, "data": data}
+        Data.write(relpath, json.dumps(derived).encode())
+
+    def read_parsed(translation: str, book: str, chapter: str) -> Any:
+        """Parsed form of a cached chapter, if newer than the chapter."""
+        base = f"{translation}/{book}"
+        return Data._read_derived(
+            f"{base}/parsed/{chapter}", f"{base}/{chapter}"
+        )
+
+    def save_parsed(translation: str, book: str, chapter: str, data: Any):
+        Data._save_derived(f"{translation}/{book}/parsed/{chapter}", data)
+
+    def read_rendered(
+        translation: str, book: str, chapter: str, width: int
+    ) -> Any:
+        """Chapter pre-rendered at width, if newer than the chapter."""
+        base = f"{translation}/{book}"
+        return Data._read_derived(
+            f"{base}/rendered/{width}/{chapter}", f"{base}/{chapter}"
+        )
+
+    def save_rendered(
+        translation: str, book: str, chapter: str, width: int, data: Any
+    ):
+        relpath = f"{translation}/{book}/rendered/{width}/{chapter}"
+        Data._save_derived(relpath, data)
+
+    def read_xrefs(translation: str, book: str, chapter: str) -> Any:
+        """Cross-references of a chapter, if newer than the chapter."""
+        base = f"{translation}/{book}"
+        return Data._read_derived(
+            f"{base}/xrefs/{chapter}", f"{base}/{chapter}"
+        )
+
+    def save_xrefs(translation: str, book: str, chapter: str, data: Any):
+        Data._save_derived(f"{translation}/{book}/xrefs/{chapter}", data)
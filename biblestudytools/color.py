@@ -3,10 +3,28 @@ import curses
 COLORS = {
     "highlight": (curses.COLOR_BLACK, curses.COLOR_BLUE),
     "default": (-1, -1),
+    "red": (curses.COLOR_RED, -1),
 }
 COLOR_IDS = {
     "highlight": 1,
     "default": 2,
+    "red": 3,
+}
+
+# Curses attributes and ANSI SGR codes of styled text runs
+STYLE_ATTRS = {
+    "heading": curses.A_BOLD,
+    "italic": curses.A_ITALIC,
+    "note": curses.A_DIM,
+    "current": curses.A_BOLD | curses.A_UNDERLINE,
+}
+SGR = {
+    "heading": "1",
+    "italic": "3",
+    "note": "2",
+    "red": "31",
+    "deleted": "31",
+    "inserted": "32",
 }
 
 started = False
@@ -41,5 +59,16 @@ class Colors:
     def default_color(attr: int = 0) -> int:
         return Colors.decoration("default", attr)
 
+    def style(styles: tuple[str], attr: int = 0) -> int:
+        """attr with the attributes of styles applied."""
+        for style in styles:
+            if style in COLOR_IDS and started:
+                # Color pairs aren't bit flags; replace rather than OR
+                pair = curses.color_pair(COLOR_IDS.get(style))
+                attr = (attr & ~curses.A_COLOR) | pair
+            else:
+                attr |= STYLE_ATTRS.get(style, 0)
+        return attr
+
     def color(self, name: str, attr: int = 0) -> int:
         return Colors.decoration(name, attr)
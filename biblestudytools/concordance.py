@@ -0,0 +1,325 @@
+"""
+Concordance and word-frequency analytics over cached translations.
+
+Every cached chapter of a translation is tokenized once into a corpus of
+term ids, kept alongside a book x term count matrix and the verse each
+token belongs to, and persisted as {translation}/concordance.npz in the
+cache. Frequency, keyword-in-context, co-occurrence and comparison
+queries are then array operations over the whole corpus instead of
+passes over its chapters. The index is rebuilt once the cache's
+generation of the translation moves on, i.e. chapters are added to the
+cache or refreshed.
+
+Requires the optional 'numpy' dependency.
+"""
+
+import io
+import math
+from typing import NamedTuple
+
+import numpy as np
+
+from .algorithm import plain_text, regex_search
+from .bible import Bible
+from .cache import Data
+from .find import TOKEN_RE
+from .parallel import cached_records
+
+# Bumped when the layout of the persisted arrays changes
+FORMAT = 2
+
+# Pseudo-count smoothing term rates in comparisons
+PRIOR = 0.5
+
+
+class Context(NamedTuple):
+    """A keyword in context."""
+
+    book: str
+    chapter: int
+    verse: int
+    left: str
+    word: str
+    right: str
+
+
+class Score(NamedTuple):
+    term: str
+    count: int
+    score: float
+
+
+def _cached_refs(bible: Bible) -> list[tuple[int, str, int]]:
+    """(book index, book, chapter) of every cached chapter, in order."""
+    return [
+        (i, book, ch)
+        for i, (display, book) in enumerate(bible.books())
+        for ch in bible.cached_chapters(book)
+    ]
+
+
+class Concordance:
+    def __init__(
+        self,
+        books: np.ndarray,
+        names: np.ndarray,
+        chapters: np.ndarray,
+        refs: np.ndarray,
+        terms: np.ndarray,
+        tokens: np.ndarray,
+        starts: np.ndarray,
+        counts: np.ndarray,
+        generation: str = None,
+    ) -> "Concordance":
+        # Data.generation() of the cache when the index was built
+        self.generation = generation
+        # Book slugs and display names, in canonical order
+        self.books, self.names = books, names
+        # (book index, chapter) of every chapter indexed
+        self.chapters = chapters
+        # (book index, chapter, verse) of every verse
+        self.refs = refs
+        # Sorted vocabulary, and the term id of every token in order
+        self.terms, self.tokens = terms, tokens
+        # Offset of each verse's first token, then the number of tokens
+        self.starts = starts
+        # Book x term occurrence counts
+        self.counts = counts
+
+        self.verse_of = np.repeat(np.arange(len(refs)), np.diff(starts))
+        self.sizes = counts.sum(axis=1)
+
+    @classmethod
+    def build(cls, bible: Bible, jobs: int = None) -> "Concordance":
+        """Tokenize every cached chapter of bible."""
+        # Taken first, so chapters written meanwhile make the index stale
+        generation = Data.generation(bible.translation.name)
+        refs = _cached_refs(bible)
+        records = cached_records(
+            bible, [(book, ch) for i, book, ch in refs], jobs
+        )
+
+        words, verses, starts = [], [], [0]
+        for i, book, ch in refs:
+            for verse in records.get((book, ch), ()):
+                words += TOKEN_RE.findall(plain_text(verse).lower())
+                verses.append((i, ch, verse.number))
+                starts.append(len(words))
+
+        words = np.array(words, dtype=str)
+        terms, tokens = np.unique(words, return_inverse=True)
+        books = bible.books()
+        verses = np.array(verses, dtype=np.int32).reshape(-1, 3)
+        token_books = np.repeat(verses[:, 0], np.diff(starts))
+        counts = np.bincount(
+            token_books * len(terms) + tokens,
+            minlength=len(books) * len(terms),
+        ).reshape(len(books), len(terms))
+
+        return cls(
+            np.array([b for d, b in books], dtype=str),
+            np.array([d for d, b in books], dtype=str),
+            np.array([r[::2] for r in refs], dtype=np.int32).reshape(-1, 2),
+            verses,
+            terms,
+            tokens.astype(np.int32),
+            np.array(starts, dtype=np.int64),
+            counts.astype(np.int32),
+            generation,
+        )
+
+    @classmethod
+    def load(cls, bible: Bible) -> "Concordance":
+        """The persisted concordance of bible, unless it's out of date."""
+        t = bible.translation.name
+        path = Data.find(Data.concordance_relpath(t))
+        if path is None:
+            return None
+
+        try:
+            with np.load(path) as data:
+                if int(data["format"]) != FORMAT:
+                    return None
+                # Stale once chapters are added or refetched
+                generation = str(data["generation"])
+                if generation != Data.generation(t):
+                    return None
+                arrays = {
+                    k: data[k]
+                    for k in data.files
+                    if k not in ("format", "generation")
+                }
+        except (OSError, ValueError, KeyError):
+            return None
+        return cls(**arrays, generation=generation)
+
+    @classmethod
+    def open(
+        cls, bible: Bible, rebuild: bool = False, jobs: int = None
+    ) -> "Concordance":
+        """Load the concordance of bible, (re)building it if needed."""
+        result = None if rebuild else cls.load(bible)
+        if result is None:
+            result = cls.build(bible, jobs)
+            result.save(bible.translation.name)
+        return result
+
+    def save(self, translation: str):
+        fh = io.BytesIO()
+        np.savez_compressed(
+            fh,
+            format=FORMAT,
+            generation=self.generation,
+            books=self.books,
+            names=self.names,
+            chapters=self.chapters,
+            refs=self.refs,
+            terms=self.terms,
+            tokens=self.tokens,
+            starts=self.starts,
+            counts=self.counts,
+        )
+        relpath = Data.concordance_relpath(translation)
+        Data.write(relpath, fh.getvalue(), compress=False)
+
+    def term_ids(self, words: list[str]) -> np.ndarray:
+        """Term id of each word, or -1 for words not in the corpus."""
+        words = np.array([w.lower() for w in words], dtype=str)
+        if not len(self.terms):
+            return np.full(len(words), -1)
+        ids = np.searchsorted(self.terms, words)
+        ids = np.minimum(ids, len(self.terms) - 1)
+        return np.where(self.terms[ids] == words, ids, -1)
+
+    def select(self, expr: str = None) -> np.ndarray:
+        """Mask of the books matching regex expr; all books without one."""
+        if not expr:
+            return np.ones(len(self.books), dtype=bool)
+        books = list(zip(self.names.tolist(), self.books.tolist()))
+        matched = {book for display, book in regex_search(expr, books)}
+        return np.isin(self.books, list(matched))
+
+    def frequency(self, words: list[str]) -> np.ndarray:
+        """Book x word occurrence counts of words."""
+        ids = self.term_ids(words)
+        return np.where(ids >= 0, self.counts[:, ids], 0)
+
+    def top(self, n: int, books: np.ndarray = None) -> list[Score]:
+        """The n most frequent terms, with their share of all tokens."""
+        if books is None:
+            books = self.select()
+        counts = self.counts[books].sum(axis=0)
+        total = max(int(counts.sum()), 1)
+        ids = np.argsort(-counts, kind="stable")[:n]
+        return [
+            Score(self.terms[i], int(counts[i]), counts[i] / total)
+            for i in ids
+            if counts[i]
+        ]
+
+    def _positions(self, word: str, books: np.ndarray) -> np.ndarray:
+        term = self.term_ids([word])[0]
+        if term < 0:
+            return np.array([], dtype=np.int64)
+        positions = np.flatnonzero(self.tokens == term)
+        return positions[books[self.refs[self.verse_of[positions], 0]]]
+
+    def kwic(
+        self,
+        word: str,
+        window: int = 5,
+        limit: int = None,
+        books: np.ndarray = None,
+    ) -> list[Context]:
+        """Occurrences of word with up to window words either side."""
+        if books is None:
+            books = self.select()
+        output = []
+        for pos in self._positions(word, books)[:limit].tolist():
+            v = self.verse_of[pos]
+            start = max(pos - window, self.starts[v])
+            end = min(pos + window + 1, self.starts[v + 1])
+            book, ch, n = self.refs[v].tolist()
+            output.append(
+                Context(
+                    self.books[book],
+                    ch,
+                    n,
+                    " ".join(self.terms[self.tokens[start:pos]]),
+                    self.terms[self.tokens[pos]],
+                    " ".join(self.terms[self.tokens[pos + 1 : end]]),
+                )
+            )
+        return output
+
+    def cooccurring(
+        self,
+        word: str,
+        n: int,
+        books: np.ndarray = None,
+        min_count: int = 3,
+    ) -> list[Score]:
+        """
+        Terms occurring in the same verses as word more often than their
+        frequency elsewhere predicts, scored by log-likelihood.
+        """
+        if books is None:
+            books = self.select()
+        positions = self._positions(word, books)
+        if not len(positions):
+            return []
+
+        verses = np.zeros(len(self.refs), dtype=bool)
+        verses[self.verse_of[positions]] = True
+        in_verses = verses[self.verse_of]
+        observed = np.bincount(
+            self.tokens[in_verses], minlength=len(self.terms)
+        )
+        overall = self.counts[books].sum(axis=0)
+        expected = overall * (observed.sum() / max(overall.sum(), 1))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            score = np.where(
+                observed > expected,
+                2 * observed * np.log(observed / expected),
+                0.0,
+            )
+        score[self.term_ids([word])[0]] = 0
+        score[observed < min_count] = 0
+
+        ids = np.argsort(-score, kind="stable")[:n]
+        return [
+            Score(self.terms[i], int(observed[i]), float(score[i]))
+            for i in ids
+            if score[i] > 0
+        ]
+
+    def distinctive(
+        self,
+        books: np.ndarray,
+        against: np.ndarray,
+        n: int,
+        min_count: int = 5,
+    ) -> list[Score]:
+        """
+        Terms most characteristic of books against the others, ranked by
+        the z-score of their smoothed log-odds ratio.
+        """
+        a = self.counts[books].sum(axis=0).astype(np.float64)
+        b = self.counts[against].sum(axis=0).astype(np.float64)
+        na, nb = a.sum(), b.sum()
+        if not na or not nb:
+            return []
+
+        prior = PRIOR * len(self.terms)
+        odds_a = (a + PRIOR) / (na + prior - a - PRIOR)
+        odds_b = (b + PRIOR) / (nb + prior - b - PRIOR)
+        delta = np.log(odds_a) - np.log(odds_b)
+        z = delta / np.sqrt(1 / (a + PRIOR) + 1 / (b + PRIOR))
+        z[a < min_count] = -math.inf
+
+        ids = np.argsort(-z, kind="stable")[:n]
+        return [
+            Score(self.terms[i], int(a[i]), float(z[i]))
+            for i in ids
+            if z[i] > 0
+        ]
@@ -1,2 +1,14 @@
-BASE_URI = "https://biblestudytools.com"
+import os
+
 PROG = "biblestudytools"
+
+# Point at a mirror or a local fixture server (see fixture.py) instead
+BASE_URI_ENV = f"{PROG.upper()}_BASE_URI"
+DEFAULT_BASE_URI = "https://biblestudytools.com"
+BASE_URI = os.environ.get(BASE_URI_ENV, DEFAULT_BASE_URI).rstrip("/")
+
+
+def configure(base_uri: str = None):
+    global BASE_URI
+    if base_uri:
+        BASE_URI = base_uri.rstrip("/")
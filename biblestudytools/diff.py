@@ -0,0 +1,224 @@
+"""
+Verse-level comparison of translations.
+
+Chapters of two or more translations are aligned by verse number and
+every verse is compared word by word with the first translation's.
+Comparing is CPU-bound, parsing then difflib, so chapters are diffed in
+worker processes that read the cache themselves and send back only
+similarity scores and word differences. DiffSummary folds the results
+into per-book scores as they arrive and keeps the most divergent verses.
+"""
+
+import heapq
+import os
+import re
+from concurrent.futures import Future, ProcessPoolExecutor
+from difflib import SequenceMatcher
+from itertools import count
+from typing import Iterable, Iterator, NamedTuple
+
+from .algorithm import Span, Verse, plain_text
+from .bible import Bible
+from .book import parse_chapter
+from .cache import Data
+from .parallel import windowed
+
+# A word difference: "=" for common words, "-" for words only in the
+# first translation, "+" for words only in the other
+Op = tuple[str, str]
+
+NON_WORD_RE = re.compile(r"\W+")
+
+
+class VerseDiff(NamedTuple):
+    book: str
+    chapter: int
+    verse: int
+    # Mean similarity to the first translation, 0.0-1.0
+    similarity: float
+    # Word differences from the first translation, per other translation
+    ops: tuple[tuple[Op]]
+
+
+class BookScore(NamedTuple):
+    book: str
+    chapters: int
+    verses: int
+    identical: int
+    similarity: float
+
+
+def word_diff(a: str, b: str) -> tuple[float, tuple[Op]]:
+    """
+    Similarity of b to a, ignoring case and punctuation, and the word
+    differences turning a into b.
+    """
+    wa, wb = a.split(), b.split()
+    ka = [NON_WORD_RE.sub("", w.lower()) for w in wa]
+    kb = [NON_WORD_RE.sub("", w.lower()) for w in wb]
+    matcher = SequenceMatcher(None, ka, kb, autojunk=False)
+
+    ops = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(("=", " ".join(wb[j1:j2])))
+            continue
+        if i2 > i1:
+            ops.append(("-", " ".join(wa[i1:i2])))
+        if j2 > j1:
+            ops.append(("+", " ".join(wb[j1:j2])))
+    return (matcher.ratio(), tuple(ops))
+
+
+def marked(ops: tuple[Op]) -> tuple[str, list[Span]]:
+    """Word differences as [-deleted-]{+inserted+} text and its spans."""
+    text, spans = [], []
+    pos = 0
+    for tag, words in ops:
+        if tag == "-":
+            words, style = f"[-{words}-]", "deleted"
+        elif tag == "+":
+            words, style = f"{{+{words}+}}", "inserted"
+        else:
+            style = None
+
+        if text:
+            pos += 1
+        if style:
+            spans.append(Span(pos, pos + len(words), style))
+        text.append(words)
+        pos += len(words)
+    return (" ".join(text), spans)
+
+
+def _verses(translation: str, book: str, ch: int) -> dict[int, str]:
+    """Verse number -> plain text of a cached chapter."""
+    parsed = Data.read_parsed(translation, book, ch)
+    if parsed is not None:
+        records = [Verse(*r) for r in parsed[1]]
+    else:
+        content = Data.read_chapter(translation, book, ch)
+        records = parse_chapter(content.decode())[1]
+    return {v.number: plain_text(v) for v in records}
+
+
+def diff_chapter(
+    translations: list[str], book: str, ch: int
+) -> list[VerseDiff]:
+    """Compare the verses of a chapter in translations with the first's."""
+    texts = [_verses(t, book, ch) for t in translations]
+    output = []
+    for n in sorted(set().union(*texts)):
+        base, scores, ops = texts[0].get(n, ""), [], []
+        for other in texts[1:]:
+            ratio, diff = word_diff(base, other.get(n, ""))
+            scores.append(ratio)
+            ops.append(diff)
+        output.append(
+            VerseDiff(book, ch, n, sum(scores) / len(scores), tuple(ops))
+        )
+    return output
+
+
+class DiffExecutor:
+    def __init__(self, jobs: int = None) -> "DiffExecutor":
+        self.jobs = jobs or os.cpu_count() or 1
+        # Workers read the same cache layers as this process
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.jobs,
+            initializer=Data.configure,
+            initargs=(Data.path, Data.shared),
+        )
+
+    def __enter__(self) -> "DiffExecutor":
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def submit(self, bibles: list[Bible], book: str, ch: int) -> Future:
+        """Diff a chapter in a worker, fetching it first where uncached."""
+        for bible in bibles:
+            if not bible.chapter_exists(book, ch):
+                bible.get_chapter(book, ch)
+        translations = [bible.translation.name for bible in bibles]
+        return self.pool.submit(diff_chapter, translations, book, ch)
+
+    def diff(
+        self, bibles: list[Bible], refs: Iterable[tuple[str, int]]
+    ) -> Iterator[tuple[tuple[str, int], Future]]:
+        """Yield ((book, chapter), future) for each ref, in order."""
+        return windowed(
+            lambda ref: self.submit(bibles, *ref), refs, self.jobs * 4
+        )
+
+
+class DiffSummary:
+    """Per-book similarity and the most divergent verses of a diff."""
+
+    def __init__(self, limit: int = 10) -> "DiffSummary":
+        self.limit = limit
+        self.books = []
+        self.current = None
+        # Heap of the `limit` least similar verses, most similar on top
+        self.divergent = []
+        self.counter = count()
+
+    def add(self, verses: list[VerseDiff]) -> BookScore:
+        """
+        Add a chapter's verses; returns the score of the previous book
+        once verses move on to another.
+        """
+        if not verses:
+            return None
+
+        done = None
+        book = verses[0].book
+        if self.current is not None and self.current[0] != book:
+            done = self.finish()
+        if self.current is None:
+            self.current = [book, 0, 0, 0, 0.0]
+
+        self.current[1] += 1
+        for v in verses:
+            self.current[2] += 1
+            self.current[3] += v.similarity == 1.0
+            self.current[4] += v.similarity
+            if v.similarity < 1.0:
+                item = (-v.similarity, next(self.counter), v)
+                if len(self.divergent) < self.limit:
+                    heapq.heappush(self.divergent, item)
+                elif self.limit:
+                    heapq.heappushpop(self.divergent, item)
+        return done
+
+    def finish(self) -> BookScore:
+        """Score of the book in progress, if any."""
+        if self.current is None:
+            return None
+        book, chapters, verses, identical, total = self.current
+        score = BookScore(
+            book, chapters, verses, identical, total / max(verses, 1)
+        )
+        self.books.append(score)
+        self.current = None
+        return score
+
+    def overall(self) -> BookScore:
+        verses = sum([b.verses for b in self.books])
+        total = sum([b.similarity * b.verses for b in self.books])
+        return BookScore(
+            None,
+            sum([b.chapters for b in self.books]),
+            verses,
+            sum([b.identical for b in self.books]),
+            total / max(verses, 1),
+        )
+
+    def most_divergent(self) -> list[VerseDiff]:
+        """The least similar verses, least similar first."""
+        ordered = sorted(self.divergent, key=lambda d: (-d[0], d[1]))
+        return [v for s, i, v in ordered]
@@ -0,0 +1,69 @@
+"""
+Word lookup within a chapter.
+
+TokenIndex is built once over a chapter's wrapped lines and keeps its
+words sorted, so each lookup is a binary search for the query's first
+word plus a check of the words following each hit, however many lines
+the chapter has. The last word of a query matches as a prefix, which
+makes it suitable for find-as-you-type.
+"""
+
+import re
+from bisect import bisect_left
+from typing import NamedTuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+
+class Token(NamedTuple):
+    word: str
+    line: int
+    start: int
+    end: int
+
+
+class TokenIndex:
+    def __init__(self, lines: list[str]) -> "TokenIndex":
+        self.tokens = [
+            Token(m.group().lower(), i, m.start(), m.end())
+            for i, line in enumerate(lines)
+            for m in TOKEN_RE.finditer(line)
+        ]
+        # Token positions ordered by word, then position
+        self.order = sorted(
+            range(len(self.tokens)), key=lambda t: self.tokens[t].word
+        )
+        self.words = [self.tokens[t].word for t in self.order]
+
+    def _lookup(self, word: str, prefix: bool) -> list[int]:
+        """Positions of tokens equal to, or prefixed by, word."""
+        lo = bisect_left(self.words, word)
+        hi = lo
+        while hi < len(self.words) and (
+            self.words[hi] == word
+            or (prefix and self.words[hi].startswith(word))
+        ):
+            hi += 1
+        return sorted(self.order[lo:hi])
+
+    def find(self, query: str) -> list[list[Token]]:
+        """
+        Occurrences of the words of query, in reading order, each as the
+        list of its tokens (which may span lines).
+        """
+        words = [w.lower() for w in TOKEN_RE.findall(query)]
+        if not words:
+            return []
+
+        n = len(words)
+        matches = []
+        for t in self._lookup(words[0], prefix=n == 1):
+            tokens = self.tokens[t : t + n]
+            if len(tokens) < n:
+                continue
+            if any(tok.word != w for tok, w in zip(tokens[1:-1], words[1:])):
+                continue
+            if n > 1 and not tokens[-1].word.startswith(words[-1]):
+                continue
+            matches.append(tokens)
+        return matches
@@ -0,0 +1,311 @@
+"""
+Local stand-in for the site, for running without network access.
+
+Serves pages recorded in a directory with the cache layout (see
+cache.py), so any populated cache doubles as a recording:
+
+    {root}/{translation}/books                 book index
+    {root}/{translation}/{book}/{chapter}      chapter pages
+    {root}/search/{translation}/{key}/{page}   search result pages
+
+Files are gzipped, like the cache. Chapters that aren't recorded are
+answered like the site answers chapters past the end of a book: with a
+404, or with --missing empty, a "Page not found" page. Search pages that
+aren't recorded are answered with a page of no results, which ends
+pagination. With --record URI, misses are fetched from URI and recorded.
+
+Latency and errors can be injected to exercise concurrency, prefetch and
+retry behavior reproducibly; /_fixture/stats reports request counts and
+peak concurrency as JSON.
+
+    python -m biblestudytools.fixture --root ~/.biblestudytools
+    BIBLESTUDYTOOLS_BASE_URI=http://127.0.0.1:8080 biblestudytools john 3
+"""
+
+import argparse
+import gzip
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+from . import http
+from .cache import Data
+from .conf import DEFAULT_BASE_URI
+
+NOT_FOUND_PAGE = (
+    b'<html><body><div><h1 class="text-xl">Page not found</h1></div>'
+    b"</body></html>"
+)
+
+NO_RESULTS_PAGE = (
+    b'<html><body><div id="tabContent"><div></div></div></body></html>'
+)
+
+CHAPTER_RE = re.compile(r"^/([^/]+)/([^/]+)/(\d+)\.html$")
+BOOKS_RE = re.compile(r"^/([^/]+)/?$")
+
+# Seconds to wait on the upstream site for a page being recorded
+RECORD_TIMEOUT = 30
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        root: str,
+        address: tuple[str, int] = ("127.0.0.1", 0),
+        missing: str = "404",
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        retry_after: int = None,
+        record: str = None,
+        seed: int = None,
+    ) -> "FixtureServer":
+        super().__init__(address, FixtureHandler)
+        self.root = root
+        self.missing = missing
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        self.record = record.rstrip("/") if record else None
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.stats = Counter()
+        self.active = 0
+        self.thread = None
+
+    @property
+    def base_uri(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FixtureServer":
+        """Serve from a background thread."""
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __exit__(self, *exc):
+        if self.thread is not None:
+            self.shutdown()
+        super().__exit__(*exc)
+
+    def read(self, relpath: str) -> bytes:
+        try:
+            with gzip.open(f"{self.root}/{relpath}", "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+    def fetch(self, relpath: str, path: str, params: dict) -> bytes:
+        """Record a missing page from the upstream site, if recording."""
+        if not self.record:
+            return None
+
+        # Through the shared rate limiter, so recording stays polite
+        # however many clients are being served
+        try:
+            response = http.fetch(
+                f"{self.record}{path}", params=params, timeout=RECORD_TIMEOUT
+            )
+        except (http.HttpError, requests.RequestException) as exc:
+            logging.warning(f"Recording {relpath}: {exc}")
+            return None
+        Data.write(relpath, response.content, root=self.root)
+        return response.content
+
+    def inject(self) -> int:
+        """Sleep for the configured latency; return an error to inject."""
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            return self.error_status
+        return None
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return dict(self.stats)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    server: FixtureServer
+
+    def log_message(self, format: str, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send(self, status: int, content: bytes = b"", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+        with self.server.lock:
+            self.server.stats[f"status_{status}"] += 1
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.active += 1
+            server.stats["requests"] += 1
+            peak = server.stats["peak_concurrency"]
+            server.stats["peak_concurrency"] = max(peak, server.active)
+
+        try:
+            self.route()
+        finally:
+            with server.lock:
+                server.active -= 1
+
+    def route(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path == "/_fixture/stats":
+            return self.send(200, json.dumps(server.snapshot()).encode())
+
+        status = server.inject()
+        if status is not None:
+            headers = dict()
+            if server.retry_after is not None:
+                headers["Retry-After"] = str(server.retry_after)
+            return self.send(status, headers=headers)
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if url.path.rstrip("/") == "/search":
+            relpath = Data.search_relpath(params)
+            content = server.read(relpath)
+            if content is None:
+                content = server.fetch(relpath, "/search", params)
+            return self.send(200, content or NO_RESULTS_PAGE)
+
+        if match := CHAPTER_RE.match(url.path):
+            relpath = Data.chapter_relpath(*match.groups())
+        elif match := BOOKS_RE.match(url.path):
+            relpath = Data.books_relpath(match.group(1))
+        else:
+            return self.send(404)
+
+        content = server.read(relpath)
+        if content is None:
+            content = server.fetch(relpath, url.path, params)
+        if content is not None:
+            return self.send(200, content)
+
+        if match.re is CHAPTER_RE and server.missing == "empty":
+            return self.send(200, NOT_FOUND_PAGE)
+        self.send(404)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m biblestudytools.fixture",
+        description="Serve recorded pages in place of the site",
+    )
+    parser.add_argument(
+        "--root",
+        default=Data.path,
+        help=f"recorded pages, in cache layout (default: {Data.path})",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", default=8080, type=int)
+    parser.add_argument(
+        "--missing",
+        choices=("404", "empty"),
+        default="404",
+        help="answer unrecorded chapters with a 404 or a "
+        "'Page not found' page (default: 404)",
+    )
+    parser.add_argument(
+        "--latency",
+        default=0.0,
+        type=float,
+        help="seconds to delay every response",
+    )
+    parser.add_argument(
+        "--jitter",
+        default=0.0,
+        type=float,
+        help="up to this many more seconds of random delay",
+    )
+    parser.add_argument(
+        "--error-rate",
+        default=0.0,
+        type=float,
+        help="fraction of requests to fail (0.0-1.0)",
+    )
+    parser.add_argument(
+        "--error-status",
+        default=503,
+        type=int,
+        help="status of injected failures (default: 503)",
+    )
+    parser.add_argument(
+        "--retry-after",
+        default=None,
+        type=int,
+        help="Retry-After seconds sent with injected failures",
+    )
+    parser.add_argument(
+        "--record",
+        nargs="?",
+        const=DEFAULT_BASE_URI,
+        default=None,
+        help="fetch and record unrecorded pages from this site "
+        f"(default: {DEFAULT_BASE_URI})",
+    )
+    parser.add_argument("--seed", default=None, type=int)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO"))
+
+    server = FixtureServer(
+        args.root,
+        (args.host, args.port),
+        missing=args.missing,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after,
+        record=args.record,
+        seed=args.seed,
+    )
+    logging.info(f"Serving {args.root} on {server.base_uri}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        logging.info(f"Stats: {server.snapshot()}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
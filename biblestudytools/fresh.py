@@ -0,0 +1,200 @@
+"""
+Cache freshness.
+
+Every page fetched into the cache records when it was fetched along with
+its ETag and Last-Modified validators. Entries older than the TTL are
+still served immediately, but are revalidated in the background with a
+conditional GET: unchanged pages cost a 304 with no body, and changed
+ones replace the cached copy, which also invalidates anything derived
+from it.
+
+The TTL is unlimited unless set with --ttl or BIBLESTUDYTOOLS_TTL, as a
+number of seconds or with an s, m, h or d suffix (e.g. 30d).
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from . import http
+from .cache import Data
+from .conf import PROG
+
+TTL_ENV = f"{PROG.upper()}_TTL"
+UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+class Revalidation(NamedTuple):
+    # 304 if unchanged, else 200
+    status: int
+    # Whether the cached copy was replaced
+    changed: bool
+    # Bytes of body received
+    received: int
+
+
+def parse_ttl(spec: str) -> float:
+    """Seconds in a TTL like '90', '15m' or '30d'; None for no limit."""
+    if not spec or spec == "never":
+        return None
+
+    unit = UNITS.get(spec[-1])
+    try:
+        if unit is None:
+            return float(spec)
+        return float(spec[:-1]) * unit
+    except ValueError:
+        raise ValueError(
+            f"invalid TTL '{spec}'; expected seconds, optionally with "
+            "an s, m, h or d suffix, or 'never'"
+        )
+
+
+def _env_ttl() -> float:
+    try:
+        return parse_ttl(os.environ.get(TTL_ENV))
+    except ValueError:
+        # Reported by Freshness.configure(); don't fail on import
+        return None
+
+
+class Freshness:
+    ttl = _env_ttl()
+
+    # Revalidations run on a small pool; pending ones finish before exit
+    pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="revalidate")
+    pending = set()
+    lock = threading.Lock()
+
+    def configure(ttl: str = None):
+        """Set the TTL from ttl, else the environment; ValueError if bad."""
+        if ttl is None:
+            ttl = os.environ.get(TTL_ENV)
+        Freshness.ttl = parse_ttl(ttl)
+
+    def is_stale(relpath: str) -> bool:
+        if Freshness.ttl is None:
+            return False
+
+        meta = Data.read_meta(relpath)
+        if meta is None:
+            return True
+        return time.time() - meta.get("fetched", 0) > Freshness.ttl
+
+    def fetch(relpath: str, uri: str, valid=None, **kwargs) -> bytes:
+        """
+        Fetch uri into relpath, recording freshness metadata. Content
+        failing valid(content) isn't cached and raises http.NotFound.
+        """
+        response = http.fetch(uri, **kwargs)
+        if valid is not None and not valid(response.content):
+            raise http.NotFound(f"{uri}: page not found")
+        Freshness.store(relpath, response)
+        return response.content
+
+    def store(relpath: str, response: http.Response):
+        """Cache a fetched page along with its freshness metadata."""
+        Data.write(relpath, response.content)
+        Freshness._save_meta(relpath, response)
+
+    def revalidate(relpath: str, uri: str) -> Revalidation:
+        """Conditionally refetch a cached entry."""
+        meta = Data.read_meta(relpath) or dict()
+        response = http.fetch(uri, meta.get("etag"), meta.get("last_modified"))
+        # Servers without validators answer 200; only replace the entry
+        # (invalidating what's derived from it) if it actually changed
+        content = response.content
+        changed = content is not None and content != Data.read(relpath)
+        if changed:
+            Data.write(relpath, content)
+        Freshness._save_meta(relpath, response)
+        return Revalidation(response.status, changed, len(content or b""))
+
+    def revalidate_later(relpath: str, uri: str):
+        """Revalidate in the background, once per entry at a time."""
+        with Freshness.lock:
+            if relpath in Freshness.pending:
+                return
+            Freshness.pending.add(relpath)
+
+        def task():
+            try:
+                result = Freshness.revalidate(relpath, uri)
+                logging.debug(f"Revalidated {relpath}: {result}")
+            except Exception as exc:
+                logging.error(f"Revalidating {relpath}: {exc}")
+            finally:
+                with Freshness.lock:
+                    Freshness.pending.discard(relpath)
+
+        Freshness.pool.submit(task)
+
+    def read(relpath: str, uri: str, valid=None) -> bytes:
+        """
+        Cached content of relpath, fetched from uri when missing and
+        revalidated in the background when stale.
+        """
+        content = Data.read(relpath)
+        if content is None:
+            return Freshness.fetch(relpath, uri, valid)
+
+        if Freshness.is_stale(relpath):
+            Freshness.revalidate_later(relpath, uri)
+        return content
+
+    def read_within(relpath: str, uri: str, ttl: float) -> bytes:
+        """
+        Cached content of relpath if fetched within ttl seconds, else
+        fetched from uri now; the cached copy is served if that fails.
+        """
+        content = Data.read(relpath)
+        meta = Data.read_meta(relpath) or dict()
+        if content is not None and time.time() - meta.get("fetched", 0) <= ttl:
+            return content
+
+        try:
+            return Freshness.fetch(relpath, uri)
+        except Exception as exc:
+            if content is None:
+                raise
+            logging.warning(f"Serving cached {relpath}: {exc}")
+            return content
+
+    def refresh(entries: list[tuple[str, str]], jobs: int = 4) -> Counter:
+        """
+        Revalidate (relpath, uri) entries now, returning counts of those
+        "unchanged", "updated" and "errors", and "bytes" received.
+        """
+
+        def task(entry: tuple[str, str]) -> tuple[str, int]:
+            relpath, uri = entry
+            try:
+                result = Freshness.revalidate(relpath, uri)
+            except Exception as exc:
+                logging.error(f"Revalidating {relpath}: {exc}")
+                return ("errors", 0)
+
+            # A 200 with the same content is unchanged all the same
+            key = "updated" if result.changed else "unchanged"
+            return (key, result.received)
+
+        counts = Counter()
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for key, size in pool.map(task, entries):
+                counts[key] += 1
+                counts["bytes"] += size
+        return counts
+
+    def _save_meta(relpath: str, response: http.Response):
+        Data.save_meta(
+            relpath,
+            {
+                "fetched": time.time(),
+                "etag": response.etag,
+                "last_modified": response.last_modified,
+            },
+        )
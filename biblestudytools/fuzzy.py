@@ -0,0 +1,217 @@
+"""
+Fuzzy recall of verses from half-remembered quotations.
+
+Live search needs every keyword to match exactly. TrigramIndex instead
+breaks each cached verse into the three-letter fragments of its words
+(" lo", "lov", "ove", "ve ") and ranks verses by how much of a query's
+fragments they share, weighting rare fragments above common ones, so
+misspellings, reordered words and another translation's wording still
+find the verse. Candidates are gathered from the postings of the
+query's rarest fragments, then rescored exactly.
+
+The index covers the chapters cached when it was built and is persisted
+in the cache: {translation}/fuzzy holds the verses and fragments,
+{translation}/fuzzy.postings the verse ids of each fragment. It's
+rebuilt once the cache's generation of the translation moves on, i.e.
+chapters are added to the cache or refreshed.
+"""
+
+import json
+import math
+import re
+from array import array
+from collections import Counter
+from typing import NamedTuple
+
+from .algorithm import plain_text
+from .bible import Bible
+from .cache import Data
+from .parallel import cached_records
+from .xref import Target
+
+# Bumped when the layout of the persisted index changes
+FORMAT = 2
+
+NON_WORD_RE = re.compile(r"[\W_]+")
+
+# Postings of up to this many of a query's rarest fragments are scanned,
+# stopping short of this many verse ids in all
+SCAN_GRAMS = 48
+SCAN_POSTINGS = 40000
+# Candidates rescored exactly, per result asked for and at least
+CANDIDATES = 5
+MIN_CANDIDATES = 50
+
+
+class FuzzyHit(NamedTuple):
+    target: Target
+    # Weighted share of the query's fragments found in the verse, 0-1
+    score: float
+
+
+def normalize(text: str) -> str:
+    return NON_WORD_RE.sub(" ", text.lower()).strip()
+
+
+def trigrams(text: str) -> set[str]:
+    """Three-letter fragments of the words of text, padded at the ends."""
+    grams = set()
+    for word in normalize(text).split():
+        word = f" {word} "
+        grams.update([word[i : i + 3] for i in range(len(word) - 2)])
+    return grams
+
+
+class TrigramIndex:
+    def __init__(
+        self,
+        chapters: list[list],
+        refs: list[list],
+        texts: list[str],
+        grams: list[str],
+        lengths: list[int],
+        postings: array,
+        generation: str = None,
+    ) -> "TrigramIndex":
+        # Data.generation() of the cache when the index was built
+        self.generation = generation
+        # (book, chapter) of every chapter indexed
+        self.chapters = chapters
+        # (book, chapter, verse) and normalized text of every verse
+        self.refs, self.texts = refs, texts
+        # Fragment -> (offset, count) of its verse ids in postings
+        self.postings = postings
+        self.grams, offset = dict(), 0
+        for gram, length in zip(grams, lengths):
+            self.grams[gram] = (offset, length)
+            offset += length
+
+    @classmethod
+    def build(cls, bible: Bible, jobs: int = None) -> "TrigramIndex":
+        """Index the verses of every cached chapter of bible."""
+        # Taken first, so chapters written meanwhile make the index stale
+        generation = Data.generation(bible.translation.name)
+        chapters = [
+            (book, ch)
+            for display, book in bible.books()
+            for ch in bible.cached_chapters(book)
+        ]
+        records = cached_records(bible, chapters, jobs)
+
+        refs, texts, index = [], [], dict()
+        for book, ch in chapters:
+            for verse in records.get((book, ch), ()):
+                i = len(refs)
+                refs.append((book, ch, verse.number))
+                texts.append(normalize(plain_text(verse)))
+                for gram in trigrams(texts[i]):
+                    index.setdefault(gram, array("I")).append(i)
+
+        grams = sorted(index)
+        postings = array("I")
+        for gram in grams:
+            postings.extend(index[gram])
+        lengths = [len(index[gram]) for gram in grams]
+        return cls(chapters, refs, texts, grams, lengths, postings, generation)
+
+    @classmethod
+    def load(cls, bible: Bible) -> "TrigramIndex":
+        """The persisted index of bible, unless it's out of date."""
+        t = bible.translation.name
+        relpath = Data.fuzzy_relpath(t)
+        path = Data.find(relpath)
+        if path is None:
+            return None
+
+        try:
+            data = json.loads(Data.read(relpath))
+            blob = Data.read(f"{relpath}.postings", compress=False)
+        except (OSError, TypeError, ValueError):
+            return None
+        if data.get("format") != FORMAT or blob is None:
+            return None
+        # Stale once chapters are added or refetched
+        if data.get("generation") != Data.generation(t):
+            return None
+
+        postings = array("I")
+        postings.frombytes(blob)
+        return cls(
+            data["chapters"],
+            data["refs"],
+            data["texts"],
+            data["grams"],
+            data["lengths"],
+            postings,
+            data["generation"],
+        )
+
+    @classmethod
+    def open(
+        cls, bible: Bible, rebuild: bool = False, jobs: int = None
+    ) -> "TrigramIndex":
+        """Load the index of bible, (re)building it if needed."""
+        result = None if rebuild else cls.load(bible)
+        if result is None:
+            result = cls.build(bible, jobs)
+            result.save(bible.translation.name)
+        return result
+
+    def save(self, translation: str):
+        relpath = Data.fuzzy_relpath(translation)
+        # Postings first, so an index is never read before its postings
+        Data.write(
+            f"{relpath}.postings", self.postings.tobytes(), compress=False
+        )
+        data = {
+            "format": FORMAT,
+            "generation": self.generation,
+            "chapters": self.chapters,
+            "refs": self.refs,
+            "texts": self.texts,
+            "grams": list(self.grams),
+            "lengths": [length for offset, length in self.grams.values()],
+        }
+        Data.write(relpath, json.dumps(data).encode())
+
+    def weight(self, gram: str) -> float:
+        """Inverse document frequency of a fragment."""
+        count = self.grams.get(gram, (0, 0))[1]
+        return math.log((len(self.refs) + 1) / (count + 1))
+
+    def search(self, query: str, k: int = 10) -> list[FuzzyHit]:
+        """The k verses most like query, best first."""
+        # Fragments found in no verse can't tell verses apart, but still
+        # count against every match, so a misspelt query never scores 100%
+        weights = {g: self.weight(g) for g in trigrams(query)}
+        wanted = {g: w for g, w in weights.items() if g in self.grams}
+        total = sum(weights.values())
+        if not wanted or not total:
+            return []
+
+        # Gather candidates from the rarest fragments' postings
+        rarest = sorted(wanted, key=wanted.get, reverse=True)
+        votes, scanned = Counter(), 0
+        for gram in rarest[:SCAN_GRAMS]:
+            offset, length = self.grams[gram]
+            if scanned and scanned + length > SCAN_POSTINGS:
+                break
+            votes.update(self.postings[offset : offset + length])
+            scanned += length
+
+        # Fragments hold a space only at a word's edge, so a padded
+        # verse holds a fragment exactly when its text contains it
+        size = len(normalize(query))
+        hits = []
+        for i, _ in votes.most_common(max(k * CANDIDATES, MIN_CANDIDATES)):
+            text = f" {self.texts[i]} "
+            shared = sum([w for g, w in wanted.items() if g in text])
+            # Among equal matches, prefer verses nearest the query's size
+            hits.append((shared / total, -abs(len(text) - size), i))
+
+        hits.sort(reverse=True)
+        output = []
+        for score, extra, i in hits[:k]:
+            book, ch, n = self.refs[i]
+            output.append(FuzzyHit(Target(book, ch, n, n), score))
+        return output
@@ -0,0 +1,314 @@
+"""
+Headless BookUI for benchmarks and scroll regression checks.
+
+HeadlessUI runs the reader against VirtualScreen, an in-memory stand-in
+for the curses windows BookUI draws on, instead of a terminal. Scripted
+keys are fed to it one at a time and every action is recorded as a
+Frame: how long it took, how many window refreshes and lines it drew,
+and whether the screen then shows the lines the reader's scroll
+position says it does.
+
+Scripts are whitespace-separated keys, each optionally repeated with *N:
+
+    down*40 pgdn pgup right left resize:30x100 /love enter n N q
+
+Named keys are up, down, pgup, pgdn, left, right, back, enter and esc;
+resize:HxW resizes the screen to H rows by W columns; any other key is
+typed as its characters. Prefetching is off unless asked for, so runs
+only read the cache and are repeatable. Chapters are wrapped to the
+screen's width, as they would be to a terminal's.
+"""
+
+import curses
+import time
+from collections import deque
+from typing import NamedTuple
+
+from .algorithm import text_width
+from .bible import Bible
+from .color import Colors
+from .ui import BookUI
+
+KEYS = {
+    "up": curses.KEY_UP,
+    "down": curses.KEY_DOWN,
+    "pgup": curses.KEY_PPAGE,
+    "pgdn": curses.KEY_NPAGE,
+    "left": curses.KEY_LEFT,
+    "right": curses.KEY_RIGHT,
+    "back": curses.KEY_BACKSPACE,
+    "enter": 10,
+    "esc": 27,
+}
+
+
+class Frame(NamedTuple):
+    action: str
+    seconds: float
+    refreshes: int
+    lines: int
+    # Whether the reading view matched the scroll position afterwards
+    consistent: bool
+
+
+class ScriptEnd(Exception):
+    """Raised for input once a script has been replayed."""
+
+
+def parse_script(script: str) -> list[tuple[str, int, tuple[int, int]]]:
+    """Script keys as (action, key code, new screen size or None)."""
+    output = []
+    for token in script.split():
+        token, times = token, 1
+        if "*" in token[1:]:
+            token, n = token.rsplit("*", 1)
+            times = int(n)
+
+        if token.startswith("resize:"):
+            h, w = token.split(":", 1)[1].split("x")
+            keys = [(token, curses.KEY_RESIZE, (int(h), int(w)))]
+        elif token in KEYS:
+            keys = [(token, KEYS[token], None)]
+        else:
+            keys = [(c, ord(c), None) for c in token]
+        output += keys * times
+    return output
+
+
+class VirtualWindow:
+    """A curses window drawing into its screen's character grid."""
+
+    def __init__(
+        self, screen: "VirtualScreen", h: int, w: int, y: int, x: int
+    ) -> "VirtualWindow":
+        self.screen = screen
+        self.h, self.w = h, w
+        self.y, self.x = y, x
+        self.cy = self.cx = 0
+        self.scrolling = False
+
+    def getmaxyx(self) -> tuple[int, int]:
+        return (self.h, self.w)
+
+    def derwin(self, h: int, w: int, y: int, x: int) -> "VirtualWindow":
+        return VirtualWindow(self.screen, h, w, self.y + y, self.x + x)
+
+    subpad = subwin = derwin
+
+    def keypad(self, flag: bool):
+        pass
+
+    def bkgd(self, ch: str, attr: int = 0):
+        pass
+
+    def scrollok(self, flag: bool):
+        self.scrolling = bool(flag)
+
+    def refresh(self):
+        self.screen.refreshes += 1
+
+    def row(self, y: int) -> list[str]:
+        return self.screen.grid[self.y + y]
+
+    def erase(self):
+        for y in range(self.h):
+            self.row(y)[self.x : self.x + self.w] = [" "] * self.w
+        self.cy = self.cx = 0
+
+    clear = erase
+
+    def move(self, y: int, x: int):
+        if not (0 <= y < self.h and 0 <= x < self.w):
+            raise curses.error(f"move({y}, {x}) outside {self.h}x{self.w}")
+        self.cy, self.cx = y, x
+
+    def addstr(self, *args):
+        """addstr([y, x,] text[, attr]), wrapping like curses does."""
+        if len(args) >= 3:
+            self.move(args[0], args[1])
+            args = args[2:]
+        for ch in args[0]:
+            self.row(self.cy)[self.x + self.cx] = ch
+            self.screen.cells += 1
+            self.cx += 1
+            if self.cx < self.w:
+                continue
+            self.cx = 0
+            if self.cy + 1 < self.h:
+                self.cy += 1
+            elif self.scrolling:
+                self.scroll(1)
+            else:
+                raise curses.error("addstr() past the end of the window")
+
+    def scroll(self, n: int = 1):
+        rows = [self.row(y)[self.x : self.x + self.w] for y in range(self.h)]
+        blank = [[" "] * self.w for _ in range(min(abs(n), self.h))]
+        if n > 0:
+            rows = rows[n:] + blank
+        else:
+            rows = blank + rows[: self.h + n]
+        for y, row in enumerate(rows[: self.h]):
+            self.row(y)[self.x : self.x + self.w] = row
+
+    def deleteln(self):
+        rows = [self.row(y)[self.x : self.x + self.w] for y in range(self.h)]
+        del rows[self.cy]
+        rows.append([" "] * self.w)
+        for y, row in enumerate(rows):
+            self.row(y)[self.x : self.x + self.w] = row
+
+    def getch(self) -> int:
+        return self.screen.input()
+
+    def text(self) -> list[str]:
+        """Rows of the window as strings, trailing spaces removed."""
+        return [
+            "".join(self.row(y)[self.x : self.x + self.w]).rstrip()
+            for y in range(self.h)
+        ]
+
+
+class VirtualScreen(VirtualWindow):
+    def __init__(self, h: int = 24, w: int = 80) -> "VirtualScreen":
+        super().__init__(self, h, w, 0, 0)
+        self.grid = [[" "] * w for _ in range(h)]
+        self.keys = deque()
+        self.refreshes = self.cells = 0
+        # Called for each key read; returns the key code
+        self.input = self._next_key
+
+    def _next_key(self) -> int:
+        if not self.keys:
+            raise ScriptEnd()
+        return self.keys.popleft()[1]
+
+    def resize(self, h: int, w: int):
+        # Windows of the old size draw until they're replaced, so the grid
+        # never shrinks beneath them
+        rows, cols = max(h, len(self.grid)), max(w, len(self.grid[0]))
+        self.h, self.w = h, w
+        self.grid = [[" "] * cols for _ in range(rows)]
+
+
+class HeadlessColors(Colors):
+    """Colors that leave curses alone; every style draws as plain text."""
+
+    def __init__(self) -> "HeadlessColors":
+        self.pair_ids, self.pairs = {}, {}
+
+
+class HeadlessUI(BookUI):
+    def __init__(
+        self, h: int = 24, w: int = 80, prefetch: bool = False
+    ) -> "HeadlessUI":
+        self.screen = VirtualScreen(h, w)
+        self.screen.input = self._input
+        self.prefetch = prefetch
+        self.frames = []
+        self.drawn = 0
+        self.action = None
+        super().__init__()
+
+    def _init_screen(self) -> VirtualScreen:
+        return self.screen
+
+    def _init_colors(self) -> Colors:
+        return HeadlessColors()
+
+    def _resize_terminal(self, h: int, w: int):
+        # resizeterm() queues a KEY_RESIZE of its own, which BookUI skips;
+        # it's part of the resize it follows, not an action of its own
+        self.screen.keys.appendleft((None, curses.KEY_RESIZE, None))
+
+    def _end_screen(self):
+        pass
+
+    def _text_width(self) -> int:
+        return text_width(self.screen.w)
+
+    def _start_prefetch(self, book: str, ch: int):
+        if self.prefetch:
+            return super()._start_prefetch(book, ch)
+        self.prefetched = book
+
+    def _start_xref_prefetch(self, book: str, ch: int):
+        if self.prefetch:
+            super()._start_xref_prefetch(book, ch)
+
+    def _addline(self, y: int, k: int):
+        self.drawn += 1
+        super()._addline(y, k)
+
+    def consistent(self) -> bool:
+        """Whether the screen shows the lines the scroll position says."""
+        if self.pad is None or not hasattr(self, "pos"):
+            return True
+        h, w = self.pad.getmaxyx()
+        lines = self.lines[self.pos : self.pos + h]
+        expected = [line.rstrip() for attr, line, runs in lines]
+        expected += [""] * (h - len(expected))
+        return self.pad.text() == expected
+
+    def _record(self):
+        """Add the frame of the action in progress, if any."""
+        if self.action is None:
+            return None
+        action, start, refreshes, drawn = self.action
+        seconds = time.perf_counter() - start
+        self.frames.append(
+            Frame(
+                action,
+                seconds,
+                self.screen.refreshes - refreshes,
+                self.drawn - drawn,
+                self.consistent(),
+            )
+        )
+        self.action = None
+
+    def _input(self) -> int:
+        """Record the frame of the last action, then read the next key."""
+        if self.screen.keys and self.screen.keys[0][0] is None:
+            return self.screen.keys.popleft()[1]
+        self._record()
+
+        if not self.screen.keys:
+            raise ScriptEnd()
+        action, key, size = self.screen.keys.popleft()
+        if size is not None:
+            self.screen.resize(*size)
+        self.action = (
+            action,
+            time.perf_counter(),
+            self.screen.refreshes,
+            self.drawn,
+        )
+        return key
+
+    def replay(
+        self, bibles: list[Bible], book: str, ch: int, script: str
+    ) -> list[Frame]:
+        """Open ch of book and replay script; returns a Frame per action."""
+        self.screen.keys.extend(parse_script(script))
+        self.frames = []
+        self.action = (
+            "open",
+            time.perf_counter(),
+            self.screen.refreshes,
+            self.drawn,
+        )
+        try:
+            self.loop(bibles, book, ch)
+        except SystemExit:
+            # Quitting ends the script early; its frame is still recorded
+            self._record()
+        except ScriptEnd:
+            pass
+        finally:
+            self.sync()
+        return self.frames
+
+    def text(self) -> list[str]:
+        """The screen as it'd be seen, one string per row."""
+        return self.screen.text()
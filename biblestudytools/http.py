@@ -1,9 +1,181 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+
 import requests
 from lxml import etree
 
+from .conf import PROG
+
+RATE_ENV = f"{PROG.upper()}_RATE"
+# Requests per second to the site, unless configured otherwise
+DEFAULT_RATE = 5.0
+
+# Responses asking us to slow down
+THROTTLED = (429, 503)
+
+# Shared across threads so connections are pooled and kept alive
+session = requests.Session()
+
 
 class HttpError(Exception):
-    pass
+    def __init__(self, message: str, status: int = None) -> "HttpError":
+        super().__init__(message)
+        # HTTP status of the failed response, if there was one
+        self.status = status
+
+
+class NotFound(HttpError):
+    """The page doesn't exist, e.g. a chapter past the end of a book."""
+
+
+def status_error(status: int) -> HttpError:
+    """The error for a failed response; only a 404 means not found."""
+    cls = NotFound if status == 404 else HttpError
+    return cls(f"returned status {status}", status)
+
+
+class Response(NamedTuple):
+    status: int
+    # None when the server answered 304 Not Modified
+    content: bytes
+    etag: str = None
+    last_modified: str = None
+
+
+class RateLimiter:
+    """
+    Politeness controller shared by every request to the site.
+
+    Requests start at no more than `rate` per second (a token bucket
+    allowing bursts of `burst`), and at most `limit` run at once. The
+    limit adapts AIMD-style: it grows by one per window of successful
+    responses and halves on a 429 or 503, which also pauses every
+    request for the response's Retry-After.
+    """
+
+    def __init__(
+        self, rate: float = 5.0, burst: int = 5, concurrency: int = 8
+    ) -> "RateLimiter":
+        self.cond = threading.Condition()
+        self.configure(rate, burst, concurrency)
+        self.active = 0
+        self.blocked_until = 0.0
+
+    def configure(
+        self, rate: float = None, burst: int = None, concurrency: int = None
+    ):
+        with self.cond:
+            if rate is not None:
+                self.rate = rate
+            if burst is not None:
+                self.burst = self.tokens = burst
+            if concurrency is not None:
+                self.max_limit = self.limit = concurrency
+            self.updated = time.monotonic()
+
+    def _try_acquire(self) -> float:
+        """
+        Take a slot and a token if both are available and return 0;
+        otherwise return seconds to wait, or None to wait for a release.
+        """
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.active >= int(self.limit):
+            return None
+
+        elapsed = now - self.updated
+        self.tokens = min(self.burst, self.tokens + elapsed * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return (1 - self.tokens) / self.rate
+
+        self.tokens -= 1
+        self.active += 1
+        return 0
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                delay = self._try_acquire()
+                if delay == 0:
+                    return
+                self.cond.wait(delay)
+
+    async def acquire_async(self):
+        while True:
+            with self.cond:
+                delay = self._try_acquire()
+            if delay == 0:
+                return
+            # Releases can't wake coroutines; poll at a short interval
+            await asyncio.sleep(min(delay or 0.05, 1.0))
+
+    def release(self, status: int = None, retry_after: float = None):
+        """Return a slot, adapting to the response status (if any)."""
+        with self.cond:
+            self.active -= 1
+            if status in THROTTLED:
+                if retry_after is None:
+                    retry_after = 1.0
+                self.limit = max(1.0, self.limit / 2)
+                pause = time.monotonic() + retry_after
+                self.blocked_until = max(self.blocked_until, pause)
+                logging.warning(
+                    f"Throttled ({status}); concurrency {int(self.limit)}, "
+                    f"pausing {retry_after:.1f}s"
+                )
+            elif status is not None and status < 400:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.cond.notify_all()
+
+
+def parse_rate(spec: str) -> float:
+    """Requests per second in spec, None if empty; ValueError if bad."""
+    if not spec:
+        return None
+    try:
+        rate = float(spec)
+    except ValueError:
+        rate = None
+    # Also rejects nan, which compares false with everything
+    if rate is None or not rate > 0:
+        raise ValueError(
+            f"invalid rate '{spec}'; expected a positive number of "
+            "requests per second"
+        )
+    return rate
+
+
+def _env_rate() -> float:
+    try:
+        return parse_rate(os.environ.get(RATE_ENV)) or DEFAULT_RATE
+    except ValueError:
+        # Reported by the command line; don't fail on import
+        return DEFAULT_RATE
+
+
+limiter = RateLimiter(rate=_env_rate())
+
+
+def retry_after(value: str, attempt: int) -> float:
+    """Seconds to wait from a Retry-After header, else back off."""
+    if value:
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value).timestamp()
+            return max(when - time.time(), 0.0)
+        except (TypeError, ValueError):
+            pass
+    return float(2**attempt)
 
 
 def parse(content: str) -> etree._Element:
@@ -12,9 +184,54 @@ def parse(content: str) -> etree._Element:
     return etree.fromstring(content, parser)
 
 
-def get(uri, **kwargs):
-    response = requests.get(uri, **kwargs)
+def fetch(
+    uri: str, etag: str = None, last_modified: str = None, **kwargs
+) -> Response:
+    """
+    GET uri, conditionally when validators from a previous response are
+    given; an unchanged page then costs a 304 with no body.
+    """
+    headers = kwargs.pop("headers", dict())
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    response = request(uri, headers=headers, **kwargs)
     status = response.status_code
-    if status != 200:
-        raise HttpError(f"returned status {status}")
-    return response.content
+    if status == 304:
+        return Response(status, None, etag, last_modified)
+    elif status != 200:
+        raise status_error(status)
+
+    return Response(
+        status,
+        response.content,
+        response.headers.get("ETag"),
+        response.headers.get("Last-Modified"),
+    )
+
+
+def request(uri: str, retries: int = 3, **kwargs) -> requests.Response:
+    """GET uri through the rate limiter, retrying throttled responses."""
+    for attempt in range(retries + 1):
+        limiter.acquire()
+        try:
+            response = session.get(uri, **kwargs)
+        except BaseException:
+            limiter.release()
+            raise
+
+        status = response.status_code
+        delay = None
+        if status in THROTTLED:
+            delay = retry_after(response.headers.get("Retry-After"), attempt)
+        limiter.release(status, delay)
+
+        if status not in THROTTLED:
+            break
+    return response
+
+
+def get(uri, **kwargs):
+    return fetch(uri, **kwargs).content
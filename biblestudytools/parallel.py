@@ -0,0 +1,159 @@
+"""
+Process-pool parsing for bulk operations.
+
+Parsing chapters is pure CPU work in lxml, regex and textwrap, so bulk
+paths hand cached chapters to worker processes. Workers read the gzipped
+chapter themselves and send back compact Verse records rather than lxml
+trees, keeping the data crossing process boundaries small.
+"""
+
+import gzip
+import logging
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Iterable, Iterator, NamedTuple
+
+from .algorithm import Verse
+from .bible import Bible
+from .book import Chapter, parse_chapter
+from .cache import Data
+
+
+class ParsedChapter(NamedTuple):
+    book: str
+    chapter: int
+    title: str
+    verses: list[Verse]
+    # width -> Chapter.passages() when rendering was requested
+    rendered: dict[int, list] = None
+
+    def to_chapter(
+        self, translation: str, raw: bool = False, width: int = None
+    ) -> Chapter:
+        return Chapter.from_records(
+            translation, self.title, self.verses, raw, width
+        )
+
+
+def _parse_file(
+    book: str, chapter: int, path: str, widths: tuple[int] = ()
+) -> ParsedChapter:
+    with gzip.open(path, "rb") as fh:
+        content = fh.read()
+    title, verses = parse_chapter(content.decode())
+
+    rendered = None
+    if widths:
+        rendered = {
+            w: Chapter.from_records("", title, verses, width=w).passages()
+            for w in widths
+        }
+    return ParsedChapter(book, chapter, title, verses, rendered)
+
+
+class ParseExecutor:
+    def __init__(self, jobs: int = None) -> "ParseExecutor":
+        self.jobs = jobs or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.jobs)
+
+    def __enter__(self) -> "ParseExecutor":
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+    def shutdown(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def submit(
+        self, bible: Bible, book: str, chapter: int, widths: tuple[int] = ()
+    ) -> Future:
+        """
+        Parse a chapter in a worker, fetching it first if uncached, and
+        also render it at each of widths.
+        """
+        if not bible.chapter_exists(book, chapter):
+            bible.get_chapter(book, chapter)
+        path = bible.local_chapter_uri(book, chapter)
+        return self.pool.submit(_parse_file, book, chapter, path, widths)
+
+    def parse(
+        self,
+        bible: Bible,
+        refs: Iterable[tuple[str, int]],
+        widths: tuple[int] = (),
+    ) -> Iterator[tuple[tuple[str, int], Future]]:
+        """
+        Yield ((book, chapter), future) for each ref, in order.
+
+        Only a few chapters per worker are kept in flight, so memory
+        stays bounded no matter how many refs are given. Errors are
+        raised by future.result(), leaving the caller to decide whether
+        one bad chapter stops the job.
+        """
+        return windowed(
+            lambda ref: self.submit(bible, *ref, widths), refs, self.jobs * 4
+        )
+
+
+def windowed(
+    submit: Callable[[Any], Future], refs: Iterable[Any], window: int
+) -> Iterator[tuple[Any, Future]]:
+    """
+    Yield (ref, submit(ref)) for each ref, in order, with at most window
+    futures submitted ahead of the one yielded.
+    """
+    pending = deque()
+    for ref in refs:
+        try:
+            future = submit(ref)
+        except Exception as exc:
+            logging.error(f"{ref}: {exc}")
+            future = Future()
+            future.set_exception(exc)
+        pending.append((ref, future))
+
+        if len(pending) >= window:
+            yield pending.popleft()
+
+    while pending:
+        yield pending.popleft()
+
+
+def book_refs(bible: Bible, book: str) -> list[tuple[str, int]]:
+    """(book, chapter) refs for every known chapter of a book."""
+    nc = bible.chapters(book)
+    if nc is None:
+        cached = bible.cached_chapters(book)
+        nc = max(cached) if cached else 0
+    return [(book, i) for i in range(1, nc + 1)]
+
+
+def cached_records(
+    bible: Bible, refs: list[tuple[str, int]], jobs: int = None
+) -> dict[tuple[str, int], list[Verse]]:
+    """
+    (book, chapter) -> verse records of cached chapters, reading parsed
+    records where present and parsing (and saving) the rest in parallel.
+    """
+    t = bible.translation.name
+    records, missing = dict(), []
+    for book, ch in refs:
+        parsed = Data.read_parsed(t, book, ch)
+        if parsed is None:
+            missing.append((book, ch))
+            continue
+        records[(book, ch)] = [Verse(*r) for r in parsed[1]]
+
+    if missing:
+        with ParseExecutor(jobs) as executor:
+            for (book, ch), future in executor.parse(bible, missing):
+                try:
+                    parsed = future.result()
+                except Exception as exc:
+                    logging.error(f"{book} {ch}: {exc}")
+                    continue
+                bible.save_parsed(book, ch, parsed.to_chapter(t))
+                records[(book, ch)] = parsed.verses
+    return records
@@ -0,0 +1,191 @@
+"""
+Book name resolution.
+
+BookResolver is built once per list of books and answers lookups in
+O(len(query)) by walking a prefix trie of normalized names, slugs and
+common abbreviations. Matches are ranked deterministically:
+
+    1. exact name, slug or abbreviation
+    2. prefix, earliest book in list order first
+    3. substring of a name, earliest book first
+    4. closest fuzzy match
+"""
+
+import difflib
+import re
+
+# Common abbreviations, keyed by normalized book name
+ALIASES = {
+    "genesis": ["gen", "ge", "gn"],
+    "exodus": ["exod", "exo", "ex"],
+    "leviticus": ["lev", "le", "lv"],
+    "numbers": ["num", "nu", "nm", "nb"],
+    "deuteronomy": ["deut", "de", "dt"],
+    "joshua": ["josh", "jos", "jsh"],
+    "judges": ["judg", "jdg", "jg", "jdgs"],
+    "ruth": ["rth", "ru"],
+    "1samuel": ["1sam", "1sa", "1sm"],
+    "2samuel": ["2sam", "2sa", "2sm"],
+    "1kings": ["1kgs", "1ki", "1kin"],
+    "2kings": ["2kgs", "2ki", "2kin"],
+    "1chronicles": ["1chron", "1chr", "1ch"],
+    "2chronicles": ["2chron", "2chr", "2ch"],
+    "ezra": ["ezr"],
+    "nehemiah": ["neh", "ne"],
+    "esther": ["esth", "est", "es"],
+    "job": ["jb"],
+    "psalms": ["psalm", "pss", "psa", "ps", "pslm"],
+    "proverbs": ["prov", "pro", "prv", "pr"],
+    "ecclesiastes": ["eccles", "eccl", "ecc", "ec", "qoh"],
+    "songofsolomon": ["song", "sos", "so", "canticles", "songofsongs"],
+    "isaiah": ["isa", "is"],
+    "jeremiah": ["jer", "je", "jr"],
+    "lamentations": ["lam", "la"],
+    "ezekiel": ["ezek", "eze", "ezk"],
+    "daniel": ["dan", "da", "dn"],
+    "hosea": ["hos", "ho"],
+    "joel": ["jl"],
+    "amos": ["am"],
+    "obadiah": ["obad", "ob"],
+    "jonah": ["jnh", "jon"],
+    "micah": ["mic", "mc"],
+    "nahum": ["nah", "na"],
+    "habakkuk": ["hab", "hb"],
+    "zephaniah": ["zeph", "zep", "zp"],
+    "haggai": ["hag", "hg"],
+    "zechariah": ["zech", "zec", "zc"],
+    "malachi": ["mal", "ml"],
+    "matthew": ["matt", "mat", "mt"],
+    "mark": ["mrk", "mar", "mk", "mr"],
+    "luke": ["luk", "lk", "lu"],
+    "john": ["joh", "jhn", "jn"],
+    "acts": ["act", "ac"],
+    "romans": ["rom", "ro", "rm"],
+    "1corinthians": ["1cor", "1co"],
+    "2corinthians": ["2cor", "2co"],
+    "galatians": ["gal", "ga"],
+    "ephesians": ["eph", "ephes"],
+    "philippians": ["phil", "php", "pp"],
+    "colossians": ["col", "co"],
+    "1thessalonians": ["1thess", "1thes", "1th"],
+    "2thessalonians": ["2thess", "2thes", "2th"],
+    "1timothy": ["1tim", "1ti"],
+    "2timothy": ["2tim", "2ti"],
+    "titus": ["tit", "ti"],
+    "philemon": ["philem", "phm", "pm"],
+    "hebrews": ["heb"],
+    "james": ["jas", "jm"],
+    "1peter": ["1pet", "1pe", "1pt", "1p"],
+    "2peter": ["2pet", "2pe", "2pt", "2p"],
+    "1john": ["1jhn", "1jn", "1jo", "1j"],
+    "2john": ["2jhn", "2jn", "2jo", "2j"],
+    "3john": ["3jhn", "3jn", "3jo", "3j"],
+    "jude": ["jud", "jd"],
+    "revelation": ["rev", "re", "rv", "apocalypse"],
+}
+
+ORDINALS = {
+    "i": "1",
+    "ii": "2",
+    "iii": "3",
+    "first": "1",
+    "second": "2",
+    "third": "3",
+}
+
+
+def normalize(name: str) -> str:
+    """Lowercase name, spelling ordinals as digits, without separators."""
+    words = re.split(r"[\s.\-_]+", name.strip().lower())
+    if len(words) > 1 and words[0] in ORDINALS:
+        words[0] = ORDINALS.get(words[0])
+    return "".join(words)
+
+
+class _Node:
+    __slots__ = ("children", "exact", "best")
+
+    def __init__(self):
+        self.children = dict()
+        # Position of the book whose key ends exactly here
+        self.exact = None
+        # Earliest book position of any key below this node
+        self.best = None
+
+
+class BookResolver:
+    def __init__(self, books: list[tuple[str, str]]) -> "BookResolver":
+        """books is a list of (display name, value) in canonical order."""
+        self.books = books
+        self.names = [normalize(name) for name, value in books]
+        self.root = _Node()
+
+        for i, name in enumerate(self.names):
+            slug = normalize(str(books[i][1]))
+            keys = [name, slug]
+            keys += ALIASES.get(name, ALIASES.get(slug, []))
+            for key in keys:
+                self._insert(key, i)
+
+    def _insert(self, key: str, i: int):
+        node = self.root
+        for c in key:
+            node = node.children.setdefault(c, _Node())
+            if node.best is None:
+                node.best = i
+        # The first book to claim a key keeps it
+        if node.exact is None:
+            node.exact = i
+
+    def _walk(self, key: str) -> _Node:
+        node = self.root
+        for c in key:
+            node = node.children.get(c)
+            if node is None:
+                return None
+        return node
+
+    def resolve(self, query: str) -> tuple[str, str]:
+        """Return the best matching (display name, value), or None."""
+        key = normalize(query)
+        if not key:
+            return None
+
+        node = self._walk(key)
+        if node is not None:
+            i = node.exact if node.exact is not None else node.best
+            return self.books[i]
+
+        matches = self.matches(query, 1)
+        return matches[0] if matches else None
+
+    def matches(self, query: str, n: int = 5) -> list[tuple[str, str]]:
+        """Up to n ranked matches for query."""
+        key = normalize(query)
+        if not key:
+            return []
+
+        ranked = []
+        node = self._walk(key)
+        if node is not None:
+            if node.exact is not None:
+                ranked.append(node.exact)
+            ranked += sorted(self._positions(node))
+
+        ranked += [i for i, name in enumerate(self.names) if key in name]
+
+        close = difflib.get_close_matches(key, self.names, n, cutoff=0.6)
+        ranked += [self.names.index(name) for name in close]
+
+        output = list(dict.fromkeys(ranked))[:n]
+        return [self.books[i] for i in output]
+
+    def _positions(self, node: _Node) -> set[int]:
+        positions = set()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            if node.exact is not None:
+                positions.add(node.exact)
+            stack += node.children.values()
+        return positions
@@ -0,0 +1,147 @@
+"""
+Output sinks.
+
+Rendered lines are written to a Sink as they're produced. ClipboardSink
+starts its copy commands once and streams lines into their stdin, so a
+whole chapter or book never has to be buffered before copying.
+"""
+
+import logging
+import os
+import sys
+from abc import ABC, abstractmethod
+from subprocess import DEVNULL, PIPE, Popen, TimeoutExpired
+
+from .conf import PROG
+from .system import payload_timeout
+
+# When set, --clipboard writes to this file (or pipe) instead
+CLIPBOARD_ENV = f"{PROG.upper()}_CLIPBOARD"
+
+
+class Sink(ABC):
+    @abstractmethod
+    def write(self, line: str):
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self) -> "Sink":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StdoutSink(Sink):
+    def write(self, line: str):
+        print(line)
+
+
+class FileSink(Sink):
+    """Write lines to a file or named pipe, e.g. for headless testing."""
+
+    def __init__(self, path: str) -> "FileSink":
+        self.fh = open(path, "w")
+
+    def write(self, line: str):
+        self.fh.write(line + "\n")
+
+    def close(self):
+        self.fh.close()
+
+
+class TeeSink(Sink):
+    def __init__(self, *sinks: Sink) -> "TeeSink":
+        self.sinks = sinks
+
+    def write(self, line: str):
+        for sink in self.sinks:
+            sink.write(line)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+class ClipboardSink(Sink):
+    """
+    Stream lines into clipboard commands.
+
+    Each command is spawned once, up front, for one selection. wl-copy
+    can only serve one selection per process, so Wayland takes two; both
+    are fed the same stream as it's written. Failures and timeouts,
+    which scale with the payload size, raise RuntimeError on close.
+
+    wl-copy and xclip fork a child that keeps serving the selection with
+    the command's stderr still open, so output isn't captured: reading
+    it would wait for the selection to be replaced.
+    """
+
+    def __init__(self, commands: list[list[str]]) -> "ClipboardSink":
+        self.nbytes = 0
+        self.procs = [
+            Popen(cmd, stdin=PIPE, stdout=DEVNULL, stderr=DEVNULL)
+            for cmd in commands
+        ]
+
+    @classmethod
+    def wayland(cls) -> "ClipboardSink":
+        return cls([["wl-copy"], ["wl-copy", "--primary"]])
+
+    def write(self, line: str):
+        data = (line + "\n").encode()
+        self.nbytes += len(data)
+        for proc in self.procs:
+            try:
+                proc.stdin.write(data)
+            except BrokenPipeError:
+                # The command exited early; close() reports its status
+                pass
+
+    def close(self):
+        timeout = payload_timeout(self.nbytes)
+        errors = []
+        for proc in self.procs:
+            try:
+                proc.stdin.close()
+            except BrokenPipeError:
+                pass
+            try:
+                proc.wait(timeout=timeout)
+            except TimeoutExpired:
+                proc.kill()
+                proc.wait()
+                errors.append(f"{proc.args} timed out after {timeout:.1f}s")
+                continue
+
+            if proc.returncode != 0:
+                errors.append(f"{proc.args} returned {proc.returncode}")
+
+        if errors:
+            for error in errors:
+                logging.error(error)
+            raise RuntimeError("; ".join(errors))
+
+
+def clipboard_available() -> bool:
+    env = os.environ
+    return bool(env.get(CLIPBOARD_ENV) or env.get("WAYLAND_DISPLAY"))
+
+
+def clipboard_sink() -> Sink:
+    path = os.environ.get(CLIPBOARD_ENV)
+    if path:
+        return FileSink(path)
+    return ClipboardSink.wayland()
+
+
+def open_sink(clipboard: bool = False) -> Sink:
+    """Sink for rendered output: stdout, also copied when clipboard."""
+    stdout = StdoutSink()
+    if not clipboard:
+        return stdout
+
+    sys.stdout.flush()
+    return TeeSink(stdout, clipboard_sink())
@@ -0,0 +1,243 @@
+"""
+Streaming output for references spanning chapters or whole books.
+
+Chapters are loaded lazily with a few fetched and parsed ahead of the one
+being rendered, and lines are produced by generators, so output starts
+immediately and memory stays bounded however large the reference is.
+"""
+
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, NamedTuple
+
+from .algorithm import ansi, text_width
+from .bible import Bible, load_parallel
+from .book import Chapter, column_width, parallel_lines
+from .http import NotFound
+
+
+class Reference(NamedTuple):
+    """
+    A span of verses within a book. A verse of None means the start or
+    end of its chapter, and an end chapter of None the end of the book.
+    """
+
+    start_chapter: int = 1
+    start_verse: int = None
+    end_chapter: int = None
+    end_verse: int = None
+
+    def single(self) -> bool:
+        """Whether the reference lies within one chapter."""
+        return self.start_chapter == self.end_chapter
+
+
+def _parse_point(spec: str) -> tuple[int, int]:
+    if ":" in spec:
+        ch, verse = spec.split(":")
+        return (int(ch), int(verse))
+    return (int(spec), None)
+
+
+def parse_reference(spec: str = None) -> Reference:
+    """
+    Parse a reference within a book, e.g. '3', '3:16', '1:2-4', '3-5',
+    '8:28-9:5' or '3-' (to the end of the book). An empty spec is the
+    whole book. Raises ValueError on malformed or reversed references.
+    """
+    if not spec:
+        return Reference()
+
+    try:
+        if "-" not in spec:
+            ch, verse = _parse_point(spec)
+            return Reference(ch, verse, ch, verse)
+
+        start, end = spec.split("-")
+        sc, sv = _parse_point(start)
+        if not end:
+            return Reference(sc, sv)
+
+        if ":" in start and ":" not in end:
+            # 1:2-4 is a verse range within chapter 1
+            ec, ev = sc, int(end)
+        else:
+            ec, ev = _parse_point(end)
+    except ValueError:
+        raise ValueError(f"invalid verse specification '{spec}'")
+
+    if sc < 1 or (sv is not None and sv < 1):
+        raise ValueError("invalid verse range; a >= 1 && b >= a")
+    if (ec, ev or 0) < (sc, sv or 0):
+        raise ValueError("invalid verse range; a >= 1 && b >= a")
+
+    return Reference(sc, sv, ec, ev)
+
+
+def header(title: str, verses: tuple[int, int], t: str, raw: bool) -> str:
+    start, end = verses
+    verse_disp = f"{start}-{end}"
+    if start == end:
+        verse_disp = str(start)
+
+    pre, post = "", ""
+    if not raw:
+        pre = "\n \033[1;4m"
+        post = "\033[0m"
+
+    return f"{pre}{title}:{verse_disp} ({t}){post}\n"
+
+
+def render_chapter(
+    chapter: Chapter, verses: tuple[int, int], raw: bool = False
+) -> Iterator[str]:
+    start, end = verses
+    t = chapter.translation.upper()
+    yield header(chapter.title, verses, t, raw)
+
+    for i in range(start, end + 1):
+        entry = chapter.styled_verse(i)
+        if entry is None:
+            continue
+        attr, lines, runs = entry
+        if raw:
+            yield from lines
+        else:
+            yield from map(ansi, lines, runs)
+
+
+def render_parallel(
+    chapters: list[Chapter],
+    verses: tuple[int, int],
+    raw: bool = False,
+    width: int = None,
+) -> Iterator[str]:
+    """Render the same verses of several translations aligned by number."""
+    start, end = verses
+    t = ", ".join([c.translation.upper() for c in chapters])
+    yield header(chapters[0].title, verses, t, raw)
+
+    if raw:
+        # Unwrapped text doesn't fit columns; stack translations per verse
+        for i in range(start, end + 1):
+            for chapter in chapters:
+                entry = chapter.verse(i)
+                if entry is None:
+                    continue
+                t = chapter.translation.upper()
+                for line in entry[1]:
+                    yield f"({t}) {line}"
+    else:
+        gap = 3
+        cw = column_width(len(chapters), width or text_width(), gap)
+        columns = (" " * gap).join(
+            [c.translation.upper().ljust(cw) for c in chapters]
+        )
+        yield columns.rstrip()
+        for attr, line, runs in parallel_lines(chapters, verses, cw, gap):
+            yield ansi(line, runs)
+
+
+def iter_chapters(
+    bibles: list[Bible],
+    book: str,
+    start: int,
+    end: int = None,
+    raw: bool = False,
+    width: int = None,
+    read_ahead: int = 2,
+) -> Iterator[tuple[int, list[Chapter]]]:
+    """
+    Yield (chapter number, [Chapter per Bible]) from start to end,
+    keeping read_ahead chapters loading in the background. When end is
+    None and the chapter count isn't known, stop at the first chapter
+    that can't be fetched.
+    """
+    bible = bibles[0]
+    if end is None:
+        end = bible.chapters(book)
+
+    def chapters() -> Iterator[int]:
+        ch = start
+        while end is None or ch <= end:
+            yield ch
+            ch += 1
+
+    pending = deque()
+    numbers = chapters()
+    with ThreadPoolExecutor(max_workers=read_ahead + 1) as pool:
+
+        def submit():
+            ch = next(numbers, None)
+            if ch is not None:
+                future = pool.submit(
+                    load_parallel, bibles, book, ch, raw, width
+                )
+                pending.append((ch, future))
+
+        for i in range(read_ahead + 1):
+            submit()
+
+        while pending:
+            ch, future = pending.popleft()
+            try:
+                result = future.result()
+            except NotFound as exc:
+                # Past the last chapter; anything else is a real failure
+                if end is not None:
+                    raise
+                if ch == start:
+                    # Nothing of the range exists; the count is still unknown
+                    raise NotFound(f"{book} has no chapter {start}") from exc
+                logging.debug(f"End of {book} before chapter {ch}: {exc}")
+                bible.save_chapters(book, str(ch - 1))
+                break
+
+            submit()
+            yield (ch, result)
+
+        for ch, future in pending:
+            future.cancel()
+
+
+def render_reference(
+    bibles: list[Bible],
+    book: str,
+    ref: Reference,
+    raw: bool = False,
+    width: int = None,
+) -> Iterator[str]:
+    """Render every chapter of ref, one chapter header at a time."""
+    parallel = len(bibles) > 1
+    width = width or text_width()
+    cw = column_width(len(bibles), width) if parallel else width
+
+    chapters = iter_chapters(
+        bibles, book, ref.start_chapter, ref.end_chapter, raw, cw
+    )
+    for ch, loaded in chapters:
+        first, last = loaded[0].range()
+        if ch == ref.start_chapter and ref.start_verse:
+            first = ref.start_verse
+        if ch == ref.end_chapter and ref.end_verse:
+            last = min(ref.end_verse, last)
+        if first > last:
+            continue
+
+        if parallel:
+            yield from render_parallel(loaded, (first, last), raw, width)
+        else:
+            yield from render_chapter(loaded[0], (first, last), raw)
+        yield ""
+
+
+def stream_reference(
+    bibles: list[Bible],
+    book: str,
+    ref: Reference,
+    raw: bool,
+    write: Callable[[str], None],
+):
+    for line in render_reference(bibles, book, ref, raw):
+        write(line)
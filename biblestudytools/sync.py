@@ -0,0 +1,380 @@
+"""
+Content-hash manifests and delta sync of caches between hosts.
+
+A manifest lists every cached page a host holds, the book indexes and
+chapters of each translation, with the SHA-256 and size of its content.
+Hashes are of the uncompressed page, so the same page fetched on two
+hosts matches even though its gzip headers differ. Manifests are kept
+in {cache}/manifest.json and only entries whose file changed since are
+hashed again, many at once.
+
+Syncing compares the manifest of a source, another cache directory or a
+peer serving its cache with 'biblestudytools sync --serve', with this
+host's and copies only the entries missing here or different from the
+source's, checking each against the source's hash. Copied files keep
+their stored form and freshness metadata and are written atomically, so
+a host can sync while in use.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import NamedTuple
+
+import requests
+
+from .cache import Data
+
+MANIFEST = "manifest.json"
+MANIFEST_FORMAT = 1
+# Peers serve their manifest here, and entries at their relpath
+MANIFEST_URI = "/_manifest"
+
+# Top-level cache directories that aren't translations
+NOT_TRANSLATIONS = ("search",)
+
+# Book indexes, chapters and chapter counts, as scan() finds them
+ENTRY_RE = re.compile(r"([^/]+)/(books|[^/]+/(\d+|chapters))")
+
+
+class Entry(NamedTuple):
+    sha256: str
+    # Bytes of uncompressed content
+    size: int
+    # Stat of the stored file when hashed, to tell when to hash again
+    mtime: int = 0
+    stored: int = 0
+
+
+def _compressed(relpath: str) -> bool:
+    # Chapter counts are stored as plain text; pages are gzipped
+    return not relpath.endswith("/chapters")
+
+
+def scan(root: str) -> dict[str, str]:
+    """relpath -> path of every book index and chapter under root."""
+    paths = dict()
+    try:
+        translations = list(os.scandir(root))
+    except FileNotFoundError:
+        return paths
+
+    for t in translations:
+        if not t.is_dir() or t.name in NOT_TRANSLATIONS:
+            continue
+        for entry in os.scandir(t.path):
+            if entry.name == "books" and entry.is_file():
+                paths[f"{t.name}/books"] = entry.path
+            elif entry.is_dir():
+                for page in os.scandir(entry.path):
+                    name = page.name
+                    if name.isdigit() or name == "chapters":
+                        paths[f"{t.name}/{entry.name}/{name}"] = page.path
+    return paths
+
+
+def valid_relpath(relpath: str) -> bool:
+    """Whether relpath names an entry within a cache, as scan() would."""
+    match = ENTRY_RE.fullmatch(relpath)
+    if match is None or match.group(1) in NOT_TRANSLATIONS:
+        return False
+    return not any(part in (".", "..") for part in relpath.split("/"))
+
+
+def hash_file(relpath: str, path: str) -> Entry:
+    stat = os.stat(path)
+    opener = gzip.open if _compressed(relpath) else open
+    with opener(path, "rb") as fh:
+        content = fh.read()
+    return Entry(
+        hashlib.sha256(content).hexdigest(),
+        len(content),
+        stat.st_mtime_ns,
+        stat.st_size,
+    )
+
+
+def read_manifest(path: str) -> dict[str, Entry]:
+    try:
+        with open(path) as fh:
+            data = json.load(fh)
+    except (OSError, ValueError):
+        return dict()
+    if data.get("format") != MANIFEST_FORMAT:
+        return dict()
+    return {k: Entry(*v) for k, v in data.get("entries", {}).items()}
+
+
+def dump_manifest(entries: dict[str, Entry]) -> bytes:
+    data = {
+        "format": MANIFEST_FORMAT,
+        "entries": {k: list(v) for k, v in sorted(entries.items())},
+    }
+    return json.dumps(data).encode()
+
+
+class Manifest:
+    def __init__(self, entries: dict[str, Entry], paths: dict[str, str]):
+        self.entries = entries
+        # relpath -> path of the stored file
+        self.paths = paths
+        self.hashed = 0
+
+    @classmethod
+    def build(
+        cls,
+        roots: list[str],
+        previous: dict[str, Entry] = None,
+        jobs: int = None,
+    ) -> "Manifest":
+        """
+        Manifest of the entries under roots, the first root holding an
+        entry winning. Entries unchanged since previous aren't hashed.
+        """
+        paths = dict()
+        for root in reversed(roots):
+            paths.update(scan(root))
+
+        previous = previous or dict()
+        entries, work = dict(), []
+        for relpath, path in paths.items():
+            known = previous.get(relpath)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if known is not None and (known.mtime, known.stored) == (
+                stat.st_mtime_ns,
+                stat.st_size,
+            ):
+                entries[relpath] = known
+            else:
+                work.append(relpath)
+
+        def run(relpath: str) -> tuple[str, Entry]:
+            try:
+                return (relpath, hash_file(relpath, paths[relpath]))
+            except (OSError, EOFError) as exc:
+                logging.error(f"{relpath}: {exc}")
+                return (relpath, None)
+
+        with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+            for relpath, entry in pool.map(run, work):
+                if entry is not None:
+                    entries[relpath] = entry
+
+        manifest = cls(entries, {k: paths[k] for k in entries})
+        manifest.hashed = len(work)
+        return manifest
+
+    @classmethod
+    def local(cls, jobs: int = None) -> "Manifest":
+        """Manifest of the cache, updating the one kept in it."""
+        previous = read_manifest(f"{Data.path}/{MANIFEST}")
+        manifest = cls.build(Data.layers(), previous, jobs)
+        Data.write(MANIFEST, dump_manifest(manifest.entries), compress=False)
+        return manifest
+
+    @classmethod
+    def directory(cls, root: str, jobs: int = None) -> "Manifest":
+        """Manifest of another cache directory, leaving it untouched."""
+        previous = read_manifest(f"{root}/{MANIFEST}")
+        return cls.build([root], previous, jobs)
+
+    def size(self) -> int:
+        return sum([e.size for e in self.entries.values()])
+
+    def delta(self, source: dict[str, Entry]) -> list[str]:
+        """Entries of source missing here or differing from this host's."""
+        return [
+            relpath
+            for relpath, entry in sorted(source.items())
+            if relpath not in self.entries
+            or self.entries[relpath].sha256 != entry.sha256
+        ]
+
+
+class Source(ABC):
+    """Where entries are synced from."""
+
+    @abstractmethod
+    def manifest(self, jobs: int = None) -> dict[str, Entry]:
+        pass
+
+    @abstractmethod
+    def read(self, relpath: str) -> bytes:
+        """Stored bytes of relpath, or None if it isn't there."""
+
+
+class DirectorySource(Source):
+    def __init__(self, root: str) -> "DirectorySource":
+        self.root = root.rstrip("/")
+
+    def manifest(self, jobs: int = None) -> dict[str, Entry]:
+        return Manifest.directory(self.root, jobs).entries
+
+    def read(self, relpath: str) -> bytes:
+        try:
+            with open(f"{self.root}/{relpath}", "rb") as fh:
+                return fh.read()
+        except FileNotFoundError:
+            return None
+
+
+class PeerSource(Source):
+    def __init__(self, uri: str) -> "PeerSource":
+        self.uri = uri.rstrip("/")
+        self.local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        # Sessions aren't thread-safe; keep one per transfer thread
+        if not hasattr(self.local, "session"):
+            self.local.session = requests.Session()
+        return self.local.session
+
+    def manifest(self, jobs: int = None) -> dict[str, Entry]:
+        response = self.session.get(f"{self.uri}{MANIFEST_URI}")
+        response.raise_for_status()
+        data = response.json()
+        if data.get("format") != MANIFEST_FORMAT:
+            raise ValueError(f"unsupported manifest from {self.uri}")
+        return {k: Entry(*v) for k, v in data.get("entries", {}).items()}
+
+    def read(self, relpath: str) -> bytes:
+        response = self.session.get(f"{self.uri}/{relpath}")
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+        return response.content
+
+
+def open_source(spec: str) -> Source:
+    if spec.startswith(("http://", "https://")):
+        return PeerSource(spec)
+    return DirectorySource(spec)
+
+
+def verify(relpath: str, content: bytes, entry: Entry) -> bool:
+    """Whether stored content matches the hash of a manifest entry."""
+    try:
+        if _compressed(relpath):
+            content = gzip.decompress(content)
+    except (OSError, EOFError):
+        return False
+    return hashlib.sha256(content).hexdigest() == entry.sha256
+
+
+def sync(
+    source: Source,
+    local: Manifest,
+    remote: dict[str, Entry],
+    jobs: int = 8,
+) -> Counter:
+    """
+    Copy the entries of remote missing or different in local from source.
+    Returns counts of entries copied and failed, and bytes transferred.
+    """
+    counts = Counter()
+    lock = threading.Lock()
+
+    def copy(relpath: str):
+        try:
+            content = source.read(relpath)
+            if content is None:
+                raise ValueError("missing at the source")
+            if not verify(relpath, content, remote[relpath]):
+                raise ValueError("doesn't match the source's manifest")
+            Data.write(relpath, content, compress=False)
+            # Keep when it was fetched, and its validators, with it
+            meta = source.read(f"{relpath}.meta")
+            if meta is not None:
+                Data.write(f"{relpath}.meta", meta, compress=False)
+        except Exception as exc:
+            logging.error(f"sync {relpath}: {exc}")
+            with lock:
+                counts["failed"] += 1
+            return
+
+        with lock:
+            counts["copied"] += 1
+            counts["bytes"] += len(content)
+
+    # Sources are trusted for content, never for where it's written
+    relpaths = []
+    for relpath in local.delta(remote):
+        if valid_relpath(relpath):
+            relpaths.append(relpath)
+        else:
+            logging.error(f"sync {relpath!r}: not a cache entry, skipped")
+            counts["failed"] += 1
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(copy, relpaths))
+    return counts
+
+
+class ManifestServer(ThreadingHTTPServer):
+    """Serves this host's manifest and cache entries to syncing peers."""
+
+    daemon_threads = True
+
+    def __init__(
+        self, address: tuple[str, int], jobs: int = None
+    ) -> "ManifestServer":
+        super().__init__(address, ManifestHandler)
+        self.jobs = jobs
+        self.lock = threading.Lock()
+        self.manifest = None
+
+    def refresh(self) -> Manifest:
+        """Rebuild the manifest, hashing only what changed since."""
+        with self.lock:
+            self.manifest = Manifest.local(self.jobs)
+            return self.manifest
+
+    def path(self, relpath: str) -> str:
+        """Stored file of a manifest entry (or its metadata), or None."""
+        manifest = self.manifest or self.refresh()
+        base = relpath.removesuffix(".meta")
+        path = manifest.paths.get(base)
+        if path is None:
+            return None
+        return path if base == relpath else f"{path}.meta"
+
+
+class ManifestHandler(BaseHTTPRequestHandler):
+    server: ManifestServer
+
+    def log_message(self, format: str, *args):
+        logging.debug(f"{self.address_string()} {format % args}")
+
+    def send(self, status: int, content: bytes = b"", kind: str = None):
+        self.send_response(status)
+        self.send_header("Content-Type", kind or "application/octet-stream")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        if self.path == MANIFEST_URI:
+            manifest = self.server.refresh()
+            content = dump_manifest(manifest.entries)
+            return self.send(200, content, "application/json")
+
+        # Only entries in the manifest are served, never arbitrary paths
+        path = self.server.path(self.path.lstrip("/"))
+        try:
+            with open(path or "", "rb") as fh:
+                content = fh.read()
+        except OSError:
+            return self.send(404)
+        self.send(200, content)
@@ -1,35 +1,37 @@
-import os
 import random
 import string
 import sys
-from subprocess import PIPE, Popen
-from typing import Any
+from subprocess import PIPE, Popen, TimeoutExpired
+
+
+def payload_timeout(nbytes: int, base: float = 1.0) -> float:
+    """Seconds to allow a child to consume nbytes: base + 1s per MiB."""
+    return base + nbytes / (1 << 20)
 
 
 def execute(
     command: str,
     *args: list[str],
     input_data: str = False,
+    timeout: float = None,
 ) -> int:
     cmd = [command] + list(args)
-    proc = Popen(
-        cmd,
-        stdin=PIPE,
-        stdout=PIPE,
-        env=dict(os.environ),
-    )
+    proc = Popen(cmd, stdin=PIPE, stdout=PIPE)
     data = input_data.encode() if input_data else None
-    stdout = None
+    if timeout is None:
+        timeout = payload_timeout(len(data or b""))
+
     try:
-        stdout, _ = proc.communicate(input=data, timeout=1)
-        stdout = stdout.decode()
-    except Exception:
-        pass
+        stdout, _ = proc.communicate(input=data, timeout=timeout)
+    except TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise RuntimeError(f"{cmd} timed out after {timeout:.1f}s")
 
     if proc.returncode != 0:
         raise RuntimeError(f"{cmd} returned {proc.returncode}")
 
-    return stdout
+    return stdout.decode()
 
 
 if __name__ == "__main__":
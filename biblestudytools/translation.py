@@ -1,17 +1,15 @@
-import gzip
-import logging
-import os
-
 from lxml import etree
 
-from . import http
+from . import conf, http
 from .cache import Data
-from .conf import BASE_URI
+from .fresh import Freshness
+from .resolver import BookResolver
 
 
 class Translation:
     def __init__(self, name: str) -> "Translation":
         self.name = name
+        self._resolver = None
 
     def __str__(self) -> str:
         return self.name
@@ -32,25 +30,30 @@ class Translation:
             self._parse_uri_leaf(element),
         )
 
+    def uri(self) -> str:
+        return f"{conf.BASE_URI}/{self.name}"
+
+    def read(self) -> bytes:
+        """Return the cached book index, or None if it isn't cached."""
+        return Data.read_books(self.name)
+
+    def save(self, content: bytes):
+        Data.save_books(self.name, content)
+
     def parse(self):
-        local_uri = f"{Data.path}/{self.name}/books"
-        content = None
-        if os.path.exists(local_uri):
-            with gzip.open(local_uri, "rb") as f:
-                content = f.read()
-        else:
-            dp = "/".join(local_uri.split("/")[:-1])
-            if not os.path.isdir(dp):
-                os.mkdir(dp)
-
-            uri = f"{BASE_URI}/{self.name}"
-            content = http.get(uri)
-            with gzip.open(local_uri, "wb") as f:
-                f.write(content)
-
-        parser = etree.HTMLParser(recover=True)
-        root = etree.fromstring(content.decode(), parser)
+        relpath = Data.books_relpath(self.name)
+        self.load(Freshness.read(relpath, self.uri()))
+
+    def load(self, content: bytes):
+        root = http.parse(content.decode())
 
         books = root.xpath("//div[contains(@class, 'grid-cols-2')]/div/a")
         self.books = [self._parse_element(b) for b in books]
         self.mapping = {el[0]: el[1] for el in self.books}
+        self._resolver = None
+
+    def resolver(self) -> BookResolver:
+        """Book name resolver for this translation, built on first use."""
+        if self._resolver is None:
+            self._resolver = BookResolver(self.books)
+        return self._resolver
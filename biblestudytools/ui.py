@@ -1,13 +1,15 @@
 import curses
 import logging
-import os
 import sys
 import threading
 
-from .bible import Bible
-from .book import Chapter
+from .algorithm import segments, text_width
+from .bible import Bible, load_parallel
+from .book import column_width, parallel_lines
 from .color import Colors
-from .http import HttpError
+from .find import TokenIndex
+from .http import HttpError, NotFound
+from .xref import prefetch
 
 
 class BookUI:
@@ -21,12 +23,20 @@ class BookUI:
         # Instance-based counters
         self.resized = 0
 
-        # Initialization
-        self.stdscr = curses.initscr()
-        curses.noecho()
-        curses.curs_set(0)
+        # (book, chapter, top line) to return to from followed references
+        self.history = []
+        self.target_verse = self.target_line = None
+        self.threads = []
 
-        self.c = Colors()
+        # Find: query, its matches in the lines and the current match;
+        # find_from is the end of the chapter to continue matching from
+        self.query, self.matches, self.match = "", [], None
+        self.highlights, self.current = dict(), dict()
+        self.tokens = self.find_from = None
+
+        # Initialization
+        self.stdscr = self._init_screen()
+        self.c = self._init_colors()
 
         # Initialize input specifics
         self.stdscr.keypad(True)
@@ -36,6 +46,25 @@ class BookUI:
 
         self._init_layout(*self.stdscr.getmaxyx())
 
+    def _init_screen(self):
+        stdscr = curses.initscr()
+        curses.noecho()
+        curses.curs_set(0)
+        curses.set_escdelay(25)
+        return stdscr
+
+    def _init_colors(self) -> Colors:
+        return Colors()
+
+    def _resize_terminal(self, h: int, w: int):
+        curses.resizeterm(h, w)
+
+    def _end_screen(self):
+        curses.endwin()
+
+    def _text_width(self) -> int:
+        return text_width()
+
     def _init_layout(self, h: int, w: int):
         self.h, self.w = h, w
         o = self.TITLEBAR_HEIGHT
@@ -57,7 +86,7 @@ class BookUI:
         lhs = f"{title}, {num_chapter}"
         if chapters is not None:
             lhs += f" of {chapters}"
-        t = self.bible.translation.name.upper()
+        t = ", ".join([b.translation.name.upper() for b in self.bibles])
         title = f"{lhs} — vv. {verses[0]}-{verses[1]} ({t})"
 
         y, x = self.titlebar.getmaxyx()
@@ -70,6 +99,19 @@ class BookUI:
         self.titlebar.addstr(0, x, title)
         self.titlebar.refresh()
 
+    def _paint_prompt(self, query: str):
+        """Show the find query in place of the title."""
+        prompt = f"/{query}"
+        if query:
+            if self.matches:
+                prompt += f"  [{self.match + 1}/{len(self.matches)}]"
+            else:
+                prompt += "  [no matches]"
+
+        self.titlebar.erase()
+        self.titlebar.addstr(0, 1, prompt[: self.w - 2])
+        self.titlebar.refresh()
+
     def _init_pad(self):
         h, w = self.stdscr.getmaxyx()
         o = 1
@@ -78,28 +120,36 @@ class BookUI:
         )
         self.pad.scrollok(1)
 
-    def _paint_pad(self):
-        y, x = self.pad.getmaxyx()
+    def _paint_pad(self, top: int = 0):
+        h, x = self.pad.getmaxyx()
         if x <= 6:
             return None
 
         self.pad.erase()
-        self.lines = self.chapter.lines()
-        n = min(curses.LINES - 1, len(self.lines))
+        top = max(min(top, len(self.lines) - h), 0)
+        n = min(h, len(self.lines) - top)
         for i in range(0, n):
-            attr, line = self.lines[i]
-            self.pad.addstr(i, 0, line, attr)
+            self._addline(i, top + i)
         self.pad.refresh()
 
-        # Reset position to the top
-        self.pos = 0
-        self.i = n - 1
+        # Position the view at top
+        self.pos = top
+        self.i = top + n - 1
+
+    def _addline(self, y: int, k: int):
+        """Draw line k at row y, styling each of its runs and matches."""
+        attr, line, runs = self.lines[k]
+        if k in self.highlights:
+            runs = (*runs, *self.highlights[k], *self.current.get(k, ()))
+        self.pad.move(y, 0)
+        for text, styles in segments(line, runs):
+            self.pad.addstr(text, Colors.style(styles, attr))
 
     def resize(self):
         self.pad.deleteln()
         self.titlebar.deleteln()
         y, x = self.stdscr.getmaxyx()
-        curses.resizeterm(y, x)
+        self._resize_terminal(y, x)
         self.stdscr.clear()
         self.stdscr.refresh()
 
@@ -108,8 +158,7 @@ class BookUI:
         return False
 
     def fetch_chapter(self, bible: Bible, book: str, ch: int):
-        uri = bible.local_chapter_uri(book, ch)
-        if not os.path.exists(uri):
+        if not bible.chapter_exists(book, ch):
             bible.get_chapter(book, ch)
 
     def __back_thread(self, bible: Bible, book: str, ch: int):
@@ -117,27 +166,25 @@ class BookUI:
             for i in range(ch - 1, 0, -1):
                 if not self.back_running:
                     return
-                self.fetch_chapter(bible, book, i)
+                for b in self.bibles:
+                    self.fetch_chapter(b, book, i)
         except HttpError:
             return
 
     def __forward_thread(self, bible: Bible, book: str, ch: int):
         num_chapters = bible.chapters(book) or 200
 
-        chap = None
-        try:
-            for i in range(ch + 1, num_chapters):
-                if not self.forward_running:
-                    return
-                try:
-                    self.fetch_chapter(bible, book, i)
-                except HttpError:
-                    # re-raise HttpError with our previous index
-                    raise HttpError(str(i - 1))
-        except HttpError as exc:
-            # Save the raised index
-            bible.save_chapters(book, str(exc))
-            self._paint_titlebar(self.chapter.range())
+        for i in range(ch + 1, num_chapters):
+            if not self.forward_running:
+                return
+            try:
+                for b in self.bibles:
+                    self.fetch_chapter(b, book, i)
+            except NotFound:
+                # Past the last chapter; other errors end the thread
+                bible.save_chapters(book, str(i - 1))
+                self._paint_titlebar(self.chapter.range())
+                return
 
     def _thread(self, fn, bible: Bible, book: str, ch: int):
         try:
@@ -145,41 +192,91 @@ class BookUI:
         except Exception as exc:
             logging.error(exc)
 
-    def loop(self, bible: Bible, book: str, ch: int):
-        self.bible = bible
-        self.book = book
-        self.ch = ch
-
-        self.forward_thread = threading.Thread(
+    def _start_prefetch(self, book: str, ch: int):
+        """Fetch the chapters around ch of book in the background."""
+        for fn in (self.__forward_thread, self.__back_thread):
+            thread = threading.Thread(
+                target=self._thread, args=(fn, self.bible, book, ch)
+            )
+            thread.start()
+            self.threads.append(thread)
+        self.prefetched = book
+
+    def __xref_thread(self, bible: Bible, book: str, ch: int):
+        graph = bible.xrefs(book, ch)
+        prefetch(self.bibles, [t for ts in graph.values() for t in ts])
+
+    def _start_xref_prefetch(self, book: str, ch: int):
+        """Fetch the chapters cross-referenced by ch in the background."""
+        threading.Thread(
             target=self._thread,
-            args=(self.__forward_thread, self.bible, book, ch),
-        )
-        self.forward_thread.start()
+            args=(self.__xref_thread, self.bible, book, ch),
+            daemon=True,
+        ).start()
+
+    def load(self, book: str, ch: int):
+        """Load chapter ch, side by side when viewing many translations."""
+        if len(self.bibles) == 1:
+            width = self._text_width()
+            self.chapter = self.bible.load_chapter(book, ch, width=width)
+            self.lines = self.chapter.styled_lines()
+            self.line_index = self.chapter.line_index()
+            self.tokens = None
+            return
 
-        self.back_thread = threading.Thread(
-            target=self._thread,
-            args=(self.__back_thread, self.bible, book, ch),
+        cw = column_width(len(self.bibles), self.w - 1)
+        chapters = load_parallel(self.bibles, book, ch, width=cw)
+        self.chapter = chapters[0]
+        verses = (1, max([c.num_verses for c in chapters]))
+        self.line_index = dict()
+        self.lines = parallel_lines(
+            chapters, verses, cw, headings=True, index=self.line_index
         )
-        self.back_thread.start()
+        self.tokens = None
+
+    def loop(self, bibles: list[Bible], book: str, ch: int, verse: int = None):
+        """Read ch of book, starting at verse if given."""
+        self.bibles = bibles
+        self.bible = bibles[0]
+        self.book = book
+        self.ch = ch
+        self.target_verse = verse
+        self._start_prefetch(book, ch)
 
         while True:
             if self.pad is None:
                 self._init_pad()
 
             try:
-                content = self.bible.get_chapter(book, self.ch)
-                self.chapter = Chapter(self.bible.translation.name, content)
+                self.load(self.book, self.ch)
             except HttpError as e:
                 logging.error(e)
-                curses.endwin()
+                self._end_screen()
                 print(f"error: {e}")
                 return None
 
+            if self.book != self.prefetched:
+                self._start_prefetch(self.book, self.ch)
+            self._start_xref_prefetch(self.book, self.ch)
+
             self.pad_h, self.pad_w = self.pad.getmaxyx()
             self._paint_titlebar(self.chapter.range())
 
+            top = self.target_line or 0
+            if self.target_verse is not None:
+                top = self.line_index.get(self.target_verse, 0)
+            self.target_verse = self.target_line = None
+
+            # Carry the find over, landing on the first or last match when
+            # it's what brought us to this chapter
+            self._set_query(self.query)
+            if self.matches and self.find_from is not None:
+                i = 0 if self.find_from > 0 else len(self.matches) - 1
+                top = self.matches[self._select(i)][0].line - self.pad_h // 3
+            self.find_from = None
+
             try:
-                self._paint_pad()
+                self._paint_pad(top)
             except curses.error:
                 self.resize()
                 continue
@@ -195,6 +292,12 @@ class BookUI:
             curses.KEY_LEFT: self._left,
             curses.KEY_RIGHT: self._right,
             curses.KEY_RESIZE: self._resize,
+            ord("/"): self._find,
+            ord("n"): self._find_next,
+            ord("N"): self._find_previous,
+            ord("x"): self._xrefs,
+            ord("u"): self._back,
+            curses.KEY_BACKSPACE: self._back,
             ord("q"): self._quit,
         }
 
@@ -210,8 +313,7 @@ class BookUI:
             return True
 
         self.pad.scroll(-1)
-        attr, line = self.lines[self.i - self.pad_h]
-        self.pad.addstr(0, 0, line, attr)
+        self._addline(0, self.i - self.pad_h)
         self.pos -= 1
         self.i -= 1
 
@@ -239,8 +341,7 @@ class BookUI:
         pos = self.pad_h - yd
         for i in range(y):
             self.i += 1 * direction
-            attr, line = self.lines[self.i]
-            self.pad.addstr(pos, 0, line, attr)
+            self._addline(pos, self.i)
             pos += 1 * direction
         self.pos += yd
         self.pad.refresh()
@@ -268,6 +369,165 @@ class BookUI:
         self.ch += 1
         return False
 
+    def _visible_verses(self) -> list[int]:
+        """Verses with a line on screen, in order."""
+        bottom = self.pos + self.pad_h
+        verses = sorted(self.line_index, key=self.line_index.get)
+        above = [n for n in verses if self.line_index[n] <= self.pos]
+        on_screen = [
+            n for n in verses if self.pos < self.line_index[n] < bottom
+        ]
+        return above[-1:] + on_screen
+
+    def _xrefs(self) -> bool:
+        """List cross-references of the verses on screen to follow one."""
+        graph = self.bible.xrefs(self.book, self.ch)
+        choices = [
+            (n, target)
+            for n in self._visible_verses()
+            for target in graph.get(n, [])
+        ][:9]
+        if not choices:
+            return True
+
+        names = {slug: display for display, slug in self.bible.books()}
+        self.pad.erase()
+        bold = self.c.color("default", curses.A_BOLD)
+        self.pad.addstr(0, 0, "Cross-references"[: self.w - 1], bold)
+        for i, (n, target) in enumerate(choices, 1):
+            line = f" {i}. {self.ch}:{n} -> {target.display(names)}"
+            if i + 1 < self.pad_h:
+                self.pad.addstr(i + 1, 0, line[: self.w - 1])
+        self.pad.refresh()
+
+        char = self.stdscr.getch() - ord("1")
+        if not 0 <= char < len(choices):
+            self._paint_pad(self.pos)
+            return True
+
+        n, target = choices[char]
+        self.history.append((self.book, self.ch, self.pos))
+        self.book, self.ch = target.book, target.chapter
+        self.target_verse = target.start
+        return False
+
+    def _back(self) -> bool:
+        """Return to where the last followed reference was followed from."""
+        if not self.history:
+            return True
+        self.book, self.ch, self.target_line = self.history.pop()
+        return False
+
+    def _token_index(self) -> TokenIndex:
+        """Word index of the lines on display, built on first find."""
+        if self.tokens is None:
+            if len(self.bibles) == 1:
+                self.tokens = self.chapter.token_index()
+            else:
+                self.tokens = TokenIndex([ln for _, ln, _ in self.lines])
+        return self.tokens
+
+    def _set_query(self, query: str):
+        """Match query against the lines, highlighting every match."""
+        self.query = query
+        self.matches = self._token_index().find(query) if query else []
+        self.match, self.highlights, self.current = None, dict(), dict()
+        for tokens in self.matches:
+            for t in tokens:
+                run = (t.start, t.end, "highlight")
+                self.highlights.setdefault(t.line, []).append(run)
+
+    def _select(self, i: int) -> int:
+        """Make match i the current match."""
+        self.match, self.current = i, dict()
+        for t in self.matches[i]:
+            run = (t.start, t.end, "current")
+            self.current.setdefault(t.line, []).append(run)
+        return i
+
+    def _show_match(self, i: int):
+        """Select match i, moving the view to it unless it's on screen."""
+        tokens = self.matches[self._select(i)]
+        first, last = tokens[0].line, tokens[-1].line
+        top = self.pos
+        if first < self.pos or last >= self.pos + self.pad_h:
+            top = first - self.pad_h // 3
+        self._paint_pad(top)
+
+    def _find(self) -> bool:
+        """
+        Find as you type, from the top of the screen; Enter keeps the
+        matches for n and N, Escape drops them and returns.
+        """
+        origin, query = self.pos, ""
+        self._set_query(query)
+        while True:
+            self._paint_prompt(query)
+            char = self.stdscr.getch()
+            if char in (curses.KEY_ENTER, 10, 13):
+                break
+            if char == 27:
+                self._set_query("")
+                self._paint_pad(origin)
+                break
+            if char in (curses.KEY_BACKSPACE, 127, 8):
+                query = query[:-1]
+            elif 32 <= char < 127:
+                query += chr(char)
+            else:
+                continue
+
+            self._set_query(query)
+            if not self.matches:
+                self._paint_pad(origin)
+                continue
+            after = (
+                i for i, m in enumerate(self.matches) if m[0].line >= origin
+            )
+            self._show_match(next(after, 0))
+
+        self._paint_titlebar(self.chapter.range())
+        return True
+
+    def _step_match(self, direction: int) -> bool:
+        """
+        Move to the next match in direction, continuing into the nearest
+        fetched chapter with a match once this chapter's run out.
+        """
+        if not self.query:
+            return True
+
+        if self.match is not None:
+            i = self.match + direction
+        elif direction > 0:
+            lines = [m[0].line for m in self.matches]
+            i = next((i for i, ln in enumerate(lines) if ln >= self.pos), -1)
+        else:
+            lines = [m[0].line for m in self.matches]
+            i = max([i for i, ln in enumerate(lines) if ln <= self.i] or [-1])
+        if 0 <= i < len(self.matches):
+            self._show_match(i)
+            return True
+
+        ch = self.ch + direction
+        while ch > 0 and self.bible.chapter_exists(self.book, ch):
+            chapter = self.bible.load_chapter(self.book, ch, raw=True)
+            if chapter.token_index().find(self.query):
+                self.ch, self.find_from = ch, direction
+                return False
+            ch += direction
+
+        # None further on; wrap around this chapter
+        if self.matches:
+            self._show_match(0 if direction > 0 else len(self.matches) - 1)
+        return True
+
+    def _find_next(self) -> bool:
+        return self._step_match(1)
+
+    def _find_previous(self) -> bool:
+        return self._step_match(-1)
+
     def _resize(self) -> bool:
         self.resized += 1
         if self.resized % 2 == 0:
@@ -283,18 +543,15 @@ class BookUI:
 
     def sync(self):
         self.back_running, self.forward_running = False, False
-        try:
-            self.back_thread.join()
-        except Exception:
-            pass
-        try:
-            self.forward_thread.join()
-        except Exception:
-            pass
+        for thread in self.threads:
+            try:
+                thread.join()
+            except Exception:
+                pass
 
     def __del__(self):
         self.sync()
         try:
-            curses.endwin()
+            self._end_screen()
         except Exception:
             pass
@@ -0,0 +1,133 @@
+"""
+Cache warming for reading plans.
+
+A plan file holds one day per line: an optional ISO date followed by
+references separated by semicolons, e.g.
+
+    # Daily readings
+    2026-10-19 gen 1-3; mt 1
+    2026-10-20 gen 4-6; mt 2
+    psalms 23
+
+Undated lines are included in every warm-up. Each chapter the selected
+references need is fetched concurrently, parsed in worker processes and
+stored in the cache pre-parsed and pre-rendered at the requested widths,
+so the first lookup of the day is a cache hit.
+"""
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from typing import NamedTuple
+
+from .bible import Bible
+from .parallel import ParseExecutor
+from .stream import parse_reference
+
+
+class PlanEntry(NamedTuple):
+    day: date
+    refs: list[str]
+
+
+def read_plan(path: str) -> list[PlanEntry]:
+    entries = []
+    with open(path) as f:
+        for line in f:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+
+            day = None
+            head, _, rest = line.partition(" ")
+            try:
+                day = date.fromisoformat(head)
+                line = rest
+            except ValueError:
+                pass
+
+            refs = [r.strip() for r in line.split(";") if r.strip()]
+            entries.append(PlanEntry(day, refs))
+    return entries
+
+
+def select_refs(entries: list[PlanEntry], start: date, end: date) -> list[str]:
+    """References of undated entries and those dated within start..end."""
+    refs = []
+    for entry in entries:
+        if entry.day is None or start <= entry.day <= end:
+            refs += entry.refs
+    return refs
+
+
+def split_ref(ref: str) -> tuple[str, str]:
+    """Split 'book [spec]' into its book name and verse spec."""
+    parts = ref.rsplit(maxsplit=1)
+    if len(parts) == 2 and parts[1][0].isdigit():
+        return (parts[0], parts[1])
+    return (ref, None)
+
+
+def plan_chapters(
+    bible: Bible, refs: list[str], jobs: int = None
+) -> list[tuple[str, int]]:
+    """Every (book, chapter) needed to read refs, in order, once each."""
+    resolved = []
+    for ref in refs:
+        name, spec = split_ref(ref)
+        book = bible.resolve(name)
+        if book is None:
+            raise LookupError(f"no book matching '{name}' in '{ref}'")
+        resolved.append((book, parse_reference(spec)))
+
+    # Books read to the end whose length isn't known are probed at once
+    unknown = {book for book, r in resolved if r.end_chapter is None}
+    with ThreadPoolExecutor(max_workers=jobs or 4) as pool:
+        ends = dict(zip(unknown, pool.map(bible.probe_chapters, unknown)))
+
+    chapters = []
+    for book, r in resolved:
+        end = r.end_chapter or ends[book]
+        chapters += [(book, ch) for ch in range(r.start_chapter, end + 1)]
+
+    return list(dict.fromkeys(chapters))
+
+
+def warm(
+    bible: Bible,
+    chapters: list[tuple[str, int]],
+    widths: tuple[int],
+    jobs: int = None,
+) -> int:
+    """
+    Fetch, parse and pre-render chapters into the cache. Returns the
+    number of chapters that couldn't be warmed.
+    """
+
+    def fetch(ref: tuple[str, int]):
+        try:
+            bible.get_chapter(*ref)
+        except Exception as exc:
+            # Left for the parse stage to report
+            logging.error(f"{ref}: {exc}")
+
+    missing = [c for c in chapters if not bible.chapter_exists(*c)]
+    with ThreadPoolExecutor(max_workers=jobs or 4) as pool:
+        list(pool.map(fetch, missing))
+
+    failed = 0
+    with ParseExecutor(jobs) as executor:
+        for (book, ch), future in executor.parse(bible, chapters, widths):
+            try:
+                parsed = future.result()
+            except Exception as exc:
+                failed += 1
+                print(f"error: {book} {ch}: {exc}")
+                continue
+
+            chapter = parsed.to_chapter(bible.translation.name)
+            bible.save_parsed(book, ch, chapter)
+            for width, passages in (parsed.rendered or {}).items():
+                bible.save_rendered(book, ch, width, passages)
+
+    return failed
@@ -0,0 +1,98 @@
+"""
+Cross-reference index.
+
+Cross-references are the note spans of parsed verses that link to other
+verses. Whenever a chapter is parsed they're extracted into a graph of
+verse -> referenced verses, persisted next to the parsed chapter, so the
+index grows as chapters are cached and lookups need neither the page
+nor the network. Chapters cached before the index existed are indexed
+the first time they're looked up, or all at once with
+'biblestudytools xrefs'.
+"""
+
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from .algorithm import Verse
+
+# [/translation]/book/chapter[-verse[-verse]].html
+TARGET_RE = re.compile(
+    r"^(?:https?://[^/]+)?(?:/[\w-]+)?/([\w-]+)/(\d+)"
+    r"(?:-(\d+)(?:-(\d+))?)?\.html"
+)
+
+
+class Target(NamedTuple):
+    """A referenced verse range; verses of None mean the whole chapter."""
+
+    book: str
+    chapter: int
+    start: int = None
+    end: int = None
+
+    def display(self, names: dict[str, str]) -> str:
+        title = f"{names.get(self.book, self.book)} {self.chapter}"
+        if self.start is None:
+            return title
+        if self.end is None or self.end == self.start:
+            return f"{title}:{self.start}"
+        return f"{title}:{self.start}-{self.end}"
+
+
+def parse_target(href: str) -> Target:
+    """Target of a cross-reference link, or None for other links."""
+    match = TARGET_RE.match(href or "")
+    if match is None:
+        return None
+
+    book, ch, start, end = match.groups()
+    start = int(start) if start else None
+    end = int(end) if end else start
+    return Target(book, int(ch), start, end)
+
+
+def chapter_xrefs(records: list[Verse]) -> dict[int, list[Target]]:
+    """Verse number -> targets of the cross-references in that verse."""
+    graph = dict()
+    for verse in records:
+        for span in verse.spans:
+            if span[2] != "note":
+                continue
+            target = parse_target(span[3])
+            targets = graph.setdefault(verse[0], [])
+            if target is not None and target not in targets:
+                targets.append(target)
+    return {n: targets for n, targets in graph.items() if targets}
+
+
+def dump_xrefs(graph: dict[int, list[Target]]) -> dict[str, list]:
+    return {str(n): [list(t) for t in ts] for n, ts in graph.items()}
+
+
+def load_xrefs(data: dict[str, list]) -> dict[int, list[Target]]:
+    return {int(n): [Target(*t) for t in ts] for n, ts in data.items()}
+
+
+def target_chapters(targets: list[Target]) -> list[tuple[str, int]]:
+    return list(dict.fromkeys([(t.book, t.chapter) for t in targets]))
+
+
+def prefetch(bibles: list, targets: list[Target], jobs: int = 4):
+    """Fetch and parse the chapters targets lie in, for every Bible."""
+
+    def load(args: tuple):
+        bible, book, ch = args
+        try:
+            bible.load_chapter(book, ch, raw=True)
+        except Exception:
+            # Dead links are reported when they're followed
+            pass
+
+    work = [
+        (bible, book, ch)
+        for book, ch in target_chapters(targets)
+        for bible in bibles
+    ]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(load, work))